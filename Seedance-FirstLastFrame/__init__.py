@@ -4,5 +4,12 @@ Seedance First-Last Frame to Video ComfyUI Node
 """
 
 from .nodes_seedance_firstlastframe import NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS
+from .nodes_seedance_video_tools import (
+    NODE_CLASS_MAPPINGS as _TOOLS_CLASS_MAPPINGS,
+    NODE_DISPLAY_NAME_MAPPINGS as _TOOLS_DISPLAY_NAME_MAPPINGS,
+)
+
+NODE_CLASS_MAPPINGS = {**NODE_CLASS_MAPPINGS, **_TOOLS_CLASS_MAPPINGS}
+NODE_DISPLAY_NAME_MAPPINGS = {**NODE_DISPLAY_NAME_MAPPINGS, **_TOOLS_DISPLAY_NAME_MAPPINGS}
 
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
\ No newline at end of file
@@ -0,0 +1,1119 @@
+# -*- coding: utf-8 -*-
+# Shared helpers for the BytePlus ARK API clients.
+# This module must stay cheap to import: ComfyUI imports every custom node at
+# startup, so requests / numpy / torch are only imported once a node runs.
+
+import os
+import re
+import sys
+import json
+import time
+import types
+import threading
+
+DEFAULT_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+
+_ENV_LOCK = threading.Lock()
+_ENV_STATE = {"loaded": False, "path": None, "mtime": None}
+
+# API client instances keyed by (class, base URL, API key), shared across node runs
+_CLIENT_LOCK = threading.Lock()
+_CLIENTS = {}
+
+
+def _find_env_file(filename: str = ".env"):
+    """
+    Walk up from this package directory looking for a .env file.
+    Mirrors the search python-dotenv's find_dotenv() does from a module file.
+    """
+    path = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        candidate = os.path.join(path, filename)
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def load_env() -> None:
+    """
+    Load the package .env file into os.environ once per process.
+    Values already present in the environment are not overridden, and
+    later calls are a no-op, so this is safe to call from INPUT_TYPES.
+    """
+    if _ENV_STATE["loaded"]:
+        return
+    with _ENV_LOCK:
+        if _ENV_STATE["loaded"]:
+            return
+        path = _find_env_file()
+        if path:
+            _load_env_file(path, override=False)
+        _ENV_STATE["path"] = path
+        _ENV_STATE["loaded"] = True
+
+
+def _env_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load_env_file(path: str, override: bool) -> None:
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(path, override=override)
+    except ImportError:
+        print("[BytePlus] python-dotenv not installed, skipping .env loading")
+    _ENV_STATE["mtime"] = _env_mtime(path)
+
+
+def reload_env_if_changed() -> bool:
+    """
+    Re-read the .env file if its mtime changed since it was last loaded.
+    Only a single stat() is done per call; the directory walk happens once.
+    Returns True when the environment was reloaded.
+    """
+    load_env()
+    path = _ENV_STATE["path"] or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+    mtime = _env_mtime(path)
+    if mtime is None or mtime == _ENV_STATE["mtime"]:
+        return False
+    with _ENV_LOCK:
+        if mtime == _ENV_STATE["mtime"]:
+            return False
+        print(f"[BytePlus] {path} changed, reloading environment")
+        _load_env_file(path, override=True)
+        _ENV_STATE["path"] = path
+    clear_api_clients()
+    return True
+
+
+def create_session(pool_maxsize: int = 16):
+    """Create a requests.Session with a connection pool sized for concurrent polling."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_api_client(api_cls, region: "RegionProfile | None" = None):
+    """
+    Return a shared instance of api_cls for the current ARK_API_BASE_URL / ARK_API_KEY.
+
+    Instances (and their pooled HTTP sessions) are reused across node invocations.
+    Editing the .env file drops the cached clients so the next call picks up the
+    new settings. api_cls() is still responsible for validating the configuration,
+    so a missing key raises the same error as before and nothing is cached.
+
+    With ARK_REGIONS configured the client is bound to region, or to the
+    healthiest region when none is given (see choose_region()). Keep using the
+    returned client for the status polls of tasks it submitted. With a key pool
+    (ARK_API_KEYS) each submission picks its own key, see attach_routing().
+    """
+    reload_env_if_changed()
+    if region is None:
+        region = choose_region()
+    if region is None:
+        key = (api_cls, os.getenv("ARK_API_BASE_URL", DEFAULT_BASE_URL), os.getenv("ARK_API_KEY"))
+    else:
+        key = (api_cls, region.name, region.base_url, region.api_key)
+    with _CLIENT_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = api_cls() if region is None else api_cls(region)
+            pool = key_pool(client.api_key, region)
+            if region is not None or pool is not None:
+                attach_routing(client.session, client.base_url, region, pool)
+            _CLIENTS[key] = client
+        return client
+
+
+def clear_api_clients() -> None:
+    """Drop all cached API clients and close their HTTP sessions."""
+    with _CLIENT_LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    for client in clients:
+        session = getattr(client, "session", None)
+        if session is not None:
+            session.close()
+
+
+# ---------------------------------------------------------------------------
+# Region routing
+# ---------------------------------------------------------------------------
+# ARK_REGIONS=cn,ap routes new work between several ARK endpoints. Each region
+# reads ARK_REGION_<NAME>_BASE_URL and ARK_REGION_<NAME>_API_KEY (falling back
+# to ARK_API_KEY), and any other ARK_REGION_<NAME>_<VAR> overrides <VAR> for
+# clients in that region, e.g. ARK_REGION_CN_SEEDANCE_PRO_MODEL for the
+# doubao- model names. Latency and error rates come from a background probe
+# every ARK_REGION_PROBE_INTERVAL seconds (0 = off) and from the client's own
+# requests. Regions failing twice in a row are skipped for a backoff period.
+# A client stays on its region, so polls, cancels and downloads of a task go to
+# the region that created it; region_for_task() maps task ids back.
+
+REGION_PROBE_INTERVAL = 60
+# Weight of the newest sample in the latency / error rate moving averages
+_REGION_EWMA = 0.3
+# Latency assumed for a region that was not measured yet
+_REGION_DEFAULT_LATENCY = 1.0
+_REGION_QUARANTINE = 30
+_REGION_MAX_QUARANTINE = 600
+_REGION_TASK_LIMIT = 10000
+
+
+def _region_var(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]", "_", name).upper()
+
+
+class RegionProfile:
+    """One ARK endpoint with its API key, env overrides and health statistics."""
+
+    def __init__(self, name: str, base_url: str, api_key: str, env: dict, api_keys: str | None = None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.env = env
+        # ARK_REGION_<NAME>_API_KEYS, pooled with api_key (see key_pool())
+        self.api_keys = api_keys
+        self.lock = threading.Lock()
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.quarantined_until = 0.0
+
+    def getenv(self, name: str, default=None):
+        return self.env.get(name) or os.getenv(name, default)
+
+    def record(self, ok: bool, latency: float | None = None) -> None:
+        with self.lock:
+            self.error_rate += _REGION_EWMA * ((0.0 if ok else 1.0) - self.error_rate)
+            if latency is not None:
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    self.latency += _REGION_EWMA * (latency - self.latency)
+            if ok:
+                self.failures = 0
+                self.quarantined_until = 0.0
+                return
+            self.failures += 1
+            if self.failures >= 2:
+                backoff = min(_REGION_QUARANTINE * 2 ** (self.failures - 2), _REGION_MAX_QUARANTINE)
+                self.quarantined_until = time.monotonic() + backoff
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.quarantined_until
+
+    def score(self) -> float:
+        """Lower is better: latency inflated by the recent error rate."""
+        latency = _REGION_DEFAULT_LATENCY if self.latency is None else self.latency
+        return latency * (1.0 + 4.0 * self.error_rate)
+
+    def describe(self) -> str:
+        latency = "n/a" if self.latency is None else f"{self.latency * 1000:.0f}ms"
+        state = "" if self.available() else ", quarantined"
+        return f"{self.name} ({latency}, {self.error_rate:.0%} errors{state})"
+
+
+def _region_response_ok(status_code: int) -> bool:
+    # Bad requests are the caller's fault; auth, throttling and 5xx count against the region
+    return status_code < 500 and status_code not in (401, 403, 429)
+
+
+def _region_hub():
+    """Process-wide router state, shared by every node package's copy of this module."""
+    hub = sys.modules.get("_byteplus_region_router")
+    if hub is None:
+        new = types.ModuleType("_byteplus_region_router")
+        new.lock = threading.Lock()
+        new.config = None
+        new.regions = []
+        new.tasks = {}      # task_id -> region name
+        new.pools = {}      # (base URL, keys) -> KeyPool
+        new.last = None     # name of the last region chosen
+        new.prober = None
+        hub = sys.modules.setdefault("_byteplus_region_router", new)
+    return hub
+
+
+def _region_config() -> tuple:
+    names = [n.strip() for n in os.getenv("ARK_REGIONS", "").split(",") if n.strip()]
+    config = []
+    for name in names:
+        prefix = f"ARK_REGION_{_region_var(name)}_"
+        values = {k[len(prefix):]: v for k, v in os.environ.items() if k.startswith(prefix)}
+        config.append((name, tuple(sorted(values.items()))))
+    return tuple(config)
+
+
+def configured_regions() -> list:
+    """RegionProfiles from ARK_REGIONS (rebuilt when the env changes), empty when routing is off."""
+    config = _region_config()
+    hub = _region_hub()
+    with hub.lock:
+        if config == hub.config:
+            return hub.regions
+        regions = []
+        for name, items in config:
+            values = dict(items)
+            base_url = values.pop("BASE_URL", None)
+            api_key = values.pop("API_KEY", None) or os.getenv("ARK_API_KEY")
+            keys = values.pop("API_KEYS", None)
+            if not base_url or not api_key:
+                print(f"[BytePlus] Region {name}: ARK_REGION_{_region_var(name)}_BASE_URL / _API_KEY missing, skipping")
+                continue
+            regions.append(RegionProfile(name, base_url, api_key, values, api_keys=keys))
+        hub.config, hub.regions = config, regions
+    if regions:
+        _start_region_prober()
+    return regions
+
+
+def choose_region() -> RegionProfile | None:
+    """The region new submissions should go to, or None when routing is off."""
+    regions = configured_regions()
+    if not regions:
+        return None
+    candidates = [r for r in regions if r.available()] or regions
+    region = min(candidates, key=lambda r: r.score())
+    hub = _region_hub()
+    if hub.last != region.name:
+        hub.last = region.name
+        others = ", ".join(r.describe() for r in regions if r is not region)
+        print(f"[BytePlus] Routing new tasks to region {region.describe()}" + (f"; {others}" if others else ""))
+    return region
+
+
+def region_env(region: RegionProfile | None, name: str, default=None):
+    """os.getenv(name, default), honouring region's ARK_REGION_<NAME>_<VAR> overrides."""
+    if region is None:
+        return os.getenv(name, default)
+    return region.getenv(name, default)
+
+
+def remember_task_region(task_id: str | None, region: RegionProfile) -> None:
+    if not task_id:
+        return
+    hub = _region_hub()
+    with hub.lock:
+        hub.tasks[task_id] = region.name
+        if len(hub.tasks) > _REGION_TASK_LIMIT:
+            for old in list(hub.tasks)[:len(hub.tasks) - _REGION_TASK_LIMIT]:
+                del hub.tasks[old]
+
+
+def region_for_task(task_id: str) -> RegionProfile | None:
+    """The region a task was submitted to, for polling it from a fresh client."""
+    name = _region_hub().tasks.get(task_id)
+    return next((r for r in configured_regions() if r.name == name), None)
+
+
+def probe_region(region: RegionProfile, session=None) -> bool:
+    """Time one cheap authenticated request (list one task) against region and record it."""
+    import requests
+
+    http = session or requests
+    start = time.monotonic()
+    try:
+        r = http.get(
+            f"{region.base_url}/contents/generations/tasks",
+            params={"page_num": 1, "page_size": 1},
+            headers={"Authorization": f"Bearer {region.api_key}"},
+            timeout=10,
+        )
+    except requests.RequestException:
+        region.record(False)
+        return False
+    ok = _region_response_ok(r.status_code)
+    region.record(ok, time.monotonic() - start)
+    return ok
+
+
+def _start_region_prober() -> None:
+    try:
+        interval = float(os.getenv("ARK_REGION_PROBE_INTERVAL", REGION_PROBE_INTERVAL))
+    except ValueError:
+        interval = REGION_PROBE_INTERVAL
+    hub = _region_hub()
+    if interval <= 0 or hub.prober is not None:
+        return
+
+    def _probe_loop():
+        session = create_session(pool_maxsize=4)
+        while True:
+            for region in list(hub.regions):
+                probe_region(region, session=session)
+            time.sleep(interval)
+
+    with hub.lock:
+        if hub.prober is None:
+            hub.prober = threading.Thread(target=_probe_loop, name="byteplus-region-probe", daemon=True)
+            hub.prober.start()
+
+
+# ---------------------------------------------------------------------------
+# API key pools
+# ---------------------------------------------------------------------------
+# ARK_API_KEYS=key1:3,key2,key3 (or ARK_REGION_<NAME>_API_KEYS) pools several
+# ARK accounts behind one endpoint; ARK_API_KEY joins the pool with weight 1
+# unless listed. Each submission goes to the available key with the fewest
+# tasks in flight per unit of weight, and the task id is remembered against
+# that key: its status polls and cancels are sent with the same key, whichever
+# client sends them. A 429 benches the key for Retry-After (or a doubling
+# backoff) and a 401 / 403 for an hour; the submission is retried with the
+# next key. Tasks count as in flight until poll_task() stops waiting for them.
+
+KEY_THROTTLE_BACKOFF = 30
+KEY_MAX_BACKOFF = 600
+KEY_REJECTED_BACKOFF = 3600
+_SUBMIT_PATHS = ("/contents/generations/tasks", "/images/generations")
+_TASK_PATH = re.compile(r"/contents/generations/tasks/([^/?#]+)")
+
+
+class PooledKey:
+    """One API key of a pool with its weight, in-flight count and bench time."""
+
+    def __init__(self, key: str, weight: float):
+        self.key = key
+        self.weight = weight
+        self.in_flight = 0
+        self.strikes = 0
+        self.benched_until = 0.0
+
+    @property
+    def label(self) -> str:
+        return f"...{self.key[-4:]}"
+
+    def load(self) -> float:
+        return (self.in_flight + 1) / self.weight
+
+
+class KeyPool:
+    """Weighted API keys of one endpoint, shared by every client of that endpoint."""
+
+    def __init__(self, keys: list[PooledKey]):
+        self.keys = keys
+        self.lock = threading.Lock()
+        self.tasks = {}         # task_id -> PooledKey that created it
+        self.running = set()    # task ids still counted in flight
+
+    def acquire(self, exclude=()) -> PooledKey | None:
+        """Take the least loaded available key (counted in flight until release())."""
+        now = time.monotonic()
+        with self.lock:
+            candidates = [k for k in self.keys if k not in exclude]
+            if not candidates:
+                return None
+            available = [k for k in candidates if k.benched_until <= now]
+            # With every key benched, use the one that comes back first rather than fail here
+            key = min(available, key=PooledKey.load) if available else \
+                min(candidates, key=lambda k: k.benched_until)
+            key.in_flight += 1
+            return key
+
+    def release(self, key: PooledKey) -> None:
+        with self.lock:
+            key.in_flight = max(0, key.in_flight - 1)
+
+    def bench(self, key: PooledKey, status_code: int, retry_after: str | None = None) -> None:
+        with self.lock:
+            key.strikes += 1
+            if status_code == 429:
+                try:
+                    seconds = float(retry_after)
+                except (TypeError, ValueError):
+                    seconds = min(KEY_THROTTLE_BACKOFF * 2 ** (key.strikes - 1), KEY_MAX_BACKOFF)
+            else:
+                seconds = KEY_REJECTED_BACKOFF
+            key.benched_until = time.monotonic() + seconds
+        print(f"[BytePlus] API key {key.label}: HTTP {status_code}, not used for {seconds:g}s")
+
+    def recovered(self, key: PooledKey) -> None:
+        with self.lock:
+            key.strikes = 0
+
+    def bind_task(self, task_id: str, key: PooledKey, counted: bool = True) -> None:
+        """Remember the key that created task_id; counted tasks stay in flight until finish_task()."""
+        with self.lock:
+            self.tasks[task_id] = key
+            if counted:
+                self.running.add(task_id)
+            if len(self.tasks) > _REGION_TASK_LIMIT:
+                for old in list(self.tasks)[:len(self.tasks) - _REGION_TASK_LIMIT]:
+                    del self.tasks[old]
+
+    def key_for_task(self, task_id: str) -> PooledKey | None:
+        return self.tasks.get(task_id)
+
+    def finish_task(self, task_id: str) -> None:
+        """Stop counting task_id against its key; the key stays bound for later polls."""
+        with self.lock:
+            if task_id not in self.running:
+                return
+            self.running.discard(task_id)
+            key = self.tasks[task_id]
+            key.in_flight = max(0, key.in_flight - 1)
+
+    def describe(self) -> str:
+        return ", ".join(f"{k.label} x{k.weight:g} ({k.in_flight} in flight)" for k in self.keys)
+
+
+def _parse_key_spec(spec: str) -> list[tuple[str, float]]:
+    keys = []
+    for item in spec.split(","):
+        key, _, weight = item.strip().partition(":")
+        if not key:
+            continue
+        try:
+            keys.append((key, float(weight) if weight else 1.0))
+        except ValueError:
+            print(f"[BytePlus] Ignoring invalid weight in API key pool entry ...{key[-4:]}")
+    return keys
+
+
+def key_pool(api_key: str | None, region: RegionProfile | None = None) -> KeyPool | None:
+    """The key pool for an endpoint (ARK_API_KEYS or the region's), None with fewer than two keys."""
+    spec = region.api_keys if region is not None else os.getenv("ARK_API_KEYS")
+    keys = _parse_key_spec(spec or "")
+    if api_key and api_key not in {k for k, _ in keys}:
+        keys.append((api_key, 1.0))
+    if len(keys) < 2:
+        return None
+    hub = _region_hub()
+    config = (region.base_url if region is not None else None, tuple(keys))
+    with hub.lock:
+        pool = hub.pools.get(config)
+        if pool is None:
+            pool = KeyPool([PooledKey(k, w) for k, w in keys if w > 0])
+            hub.pools[config] = pool
+    return pool
+
+
+def finish_task(task_id: str) -> None:
+    """Called once nobody waits for task_id any more; frees its key pool and scheduler slots."""
+    for pool in list(_region_hub().pools.values()):
+        pool.finish_task(task_id)
+    # See byteplus_scheduler / byteplus_coordinator; looked up lazily since they import this module
+    scheduler = sys.modules.get("_byteplus_scheduler")
+    if scheduler is not None:
+        scheduler.scheduler.finish_task(task_id)
+    coordinator = _coordinator()
+    if coordinator is not None:
+        coordinator.finish_task(task_id)
+
+
+def _coordinator():
+    """The active byteplus_coordinator.Coordinator, if coordination is on."""
+    return getattr(sys.modules.get("_byteplus_coordinator"), "coordinator", None)
+
+
+def attach_routing(session, base_url: str, region: RegionProfile | None = None,
+                   pool: KeyPool | None = None) -> None:
+    """
+    Wrap session.send for requests to base_url: their latency and outcome feed
+    region's health stats, submissions take the least loaded key of pool
+    (moving on to the next key after a 401 / 403 / 429), and task status polls
+    and cancels are sent with the key that created the task.
+    """
+    import requests
+
+    send = session.send
+    base_url = base_url.rstrip("/")
+
+    def _timed(request, **kwargs):
+        start = time.monotonic()
+        try:
+            response = send(request, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if region is not None:
+                region.record(False)
+            raise
+        if region is not None:
+            # With a pool, auth / throttling errors are the key's problem, not the region's
+            ok = _region_response_ok(response.status_code) or \
+                (pool is not None and response.status_code in (401, 403, 429))
+            region.record(ok, time.monotonic() - start)
+        return response
+
+    def _bind(response, path, key):
+        """Remember which region / key created the task in response; returns its id."""
+        if path != _SUBMIT_PATHS[0] or response.status_code >= 300:
+            return None
+        try:
+            task_id = response.json().get("id")
+        except ValueError:
+            return None
+        if task_id and region is not None:
+            remember_task_region(task_id, region)
+        if task_id and key is not None:
+            pool.bind_task(task_id, key)
+        return task_id
+
+    def _submit(request, path, **kwargs):
+        if pool is None:
+            response = _timed(request, **kwargs)
+            _bind(response, path, None)
+            return response
+        # Only bodies held in memory (or that can be written again) can be sent again with another key
+        resendable = request.body is None or isinstance(request.body, (bytes, str)) or \
+            getattr(request.body, "replayable", False)
+        tried = []
+        while True:
+            key = pool.acquire(exclude=tried)
+            tried.append(key)
+            request.headers["Authorization"] = f"Bearer {key.key}"
+            try:
+                response = _timed(request, **kwargs)
+            except Exception:
+                pool.release(key)
+                raise
+            if response.status_code in (401, 403, 429):
+                pool.release(key)
+                pool.bench(key, response.status_code, response.headers.get("Retry-After"))
+                if resendable and len(tried) < len(pool.keys):
+                    response.close()
+                    continue
+                return response
+            pool.recovered(key)
+            if _bind(response, path, key) is None:
+                # Synchronous (image) generations and rejected submissions are done already
+                pool.release(key)
+            return response
+
+    def _send(request, **kwargs):
+        if not request.url.startswith(base_url):
+            return send(request, **kwargs)
+        path = request.url[len(base_url):].split("?", 1)[0]
+        if request.method == "POST" and path in _SUBMIT_PATHS:
+            return _submit(request, path, **kwargs)
+        match = _TASK_PATH.match(path) if pool is not None else None
+        key = pool.key_for_task(match.group(1)) if match else None
+        if key is not None:
+            request.headers["Authorization"] = f"Bearer {key.key}"
+        return _timed(request, **kwargs)
+
+    session.send = _send
+
+
+# ---------------------------------------------------------------------------
+# Task polling
+# ---------------------------------------------------------------------------
+
+# Statuses after which a task will never succeed
+TERMINAL_FAILURES = ("failed", "cancelled", "expired")
+
+# task_id -> outcome of the cancel request sent when it was abandoned
+TASK_CANCELLATIONS = {}
+
+# Deadlines: without history a job may take DEADLINE_SAFETY times its estimate
+# (model speed in seconds of work per second of video at 720p, scaled by
+# resolution) plus a queueing allowance. Once a (model, resolution) pair has
+# HISTORY_MIN_SAMPLES completions, HISTORY_SAFETY times their p95 is used
+# instead. TASK_SLO_SECONDS / TASK_SLO_<MODEL> override both, e.g.
+#   TASK_SLO_SEEDANCE_1_0_PRO_250528=900
+_MODEL_SPEED = (("pro", 18.0), ("lite", 10.0))
+_DEFAULT_SPEED = 15.0
+_RESOLUTION_FACTOR = {"480p": 0.6, "720p": 1.0, "1080p": 2.2}
+DEADLINE_SAFETY = 3.0
+HISTORY_SAFETY = 1.5
+QUEUE_ALLOWANCE_SECONDS = 60
+MIN_DEADLINE_SECONDS = 120
+MAX_DEADLINE_SECONDS = 3600
+HISTORY_SAMPLES = 50
+HISTORY_MIN_SAMPLES = 5
+
+_HISTORY_LOCK = threading.Lock()
+_HISTORY = {"data": None, "path": None}
+
+
+def _interrupt_hub():
+    """
+    Per-thread batch interrupt events, shared by every package's copy of this
+    module (a batch node's workers may wait in another copy's scheduler).
+    """
+    hub = sys.modules.get("_byteplus_interrupts")
+    if hub is None:
+        new = types.ModuleType("_byteplus_interrupts")
+        new.local = threading.local()
+        hub = sys.modules.setdefault("_byteplus_interrupts", new)
+    return hub
+
+
+class interrupt_scope:
+    """
+    Run a worker of a batch with event as its shared interrupt flag:
+
+        interrupted = threading.Event()
+        def run(i):
+            with interrupt_scope(interrupted):
+                ...
+
+    ComfyUI's flag is cleared by the first worker that raises on it, so the
+    others would never see it; processing_interrupted() sets event when it
+    sees the flag and then reports True in every worker of the batch, which
+    makes each one cancel its remote task and raise.
+
+    detached=True is for work no prompt is waiting on (e.g. adopted orphan
+    tasks): ComfyUI's flag is neither read nor cleared there, so a Cancel
+    meant for a node never stops that work nor gets lost in it; only event
+    interrupts it.
+    """
+
+    def __init__(self, event: threading.Event, detached: bool = False):
+        self.event = event
+        self.detached = detached
+        self.previous = None
+
+    def __enter__(self):
+        local = _interrupt_hub().local
+        self.previous = (getattr(local, "event", None), getattr(local, "detached", False))
+        local.event, local.detached = self.event, self.detached
+        return self.event
+
+    def __exit__(self, exc_type, exc, tb):
+        local = _interrupt_hub().local
+        local.event, local.detached = self.previous
+        if exc is not None and is_interrupt(exc):
+            self.event.set()
+        return False
+
+
+def _scope_event():
+    return getattr(_interrupt_hub().local, "event", None)
+
+
+def _detached() -> bool:
+    return getattr(_interrupt_hub().local, "detached", False)
+
+
+def processing_interrupted() -> bool:
+    """
+    True when the user pressed Cancel in ComfyUI (False outside ComfyUI), or
+    when another worker of the current interrupt_scope saw it.
+    """
+    event = _scope_event()
+    if event is not None and event.is_set():
+        return True
+    if _detached():
+        return False
+    # Only look at the module if ComfyUI already loaded it, never import it here
+    mm = sys.modules.get("comfy.model_management")
+    if mm and mm.processing_interrupted():
+        if event is not None:
+            event.set()
+        return True
+    return False
+
+
+def is_interrupt(exc: BaseException) -> bool:
+    """True for ComfyUI's InterruptProcessingException, which nodes must re-raise."""
+    return type(exc).__name__ == "InterruptProcessingException"
+
+
+def _raise_interrupted():
+    mm = sys.modules.get("comfy.model_management")
+    if mm is not None and not _detached():
+        # Raises InterruptProcessingException and clears the flag, as ComfyUI's own nodes do
+        mm.throw_exception_if_processing_interrupted()
+        # The flag was already cleared by another worker of this batch
+        event = _scope_event()
+        if event is not None and event.is_set() and hasattr(mm, "InterruptProcessingException"):
+            raise mm.InterruptProcessingException()
+    raise InterruptedError("Processing interrupted")
+
+
+def sleep_interruptible(seconds: float, step: float = 0.2, event: threading.Event | None = None) -> bool:
+    """
+    Sleep up to seconds, waking early on a ComfyUI interrupt or when event is
+    set. Returns True if interrupted.
+    """
+    end = time.monotonic() + seconds
+    while True:
+        if processing_interrupted():
+            return True
+        remaining = end - time.monotonic()
+        if remaining <= 0 or (event is not None and event.is_set()):
+            return False
+        if event is not None:
+            event.wait(min(step, remaining))
+        else:
+            time.sleep(min(step, remaining))
+
+
+# ---------------------------------------------------------------------------
+# Task completion callbacks
+# ---------------------------------------------------------------------------
+# With TASK_CALLBACK_URL set, task submissions carry it as callback_url and ARK
+# POSTs the task object there on status changes. The receiver is a route on
+# ComfyUI's own server (POST /byteplus/task_callback) or, with
+# TASK_CALLBACK_LISTEN=host:port, a standalone listener thread instead; with
+# TASK_CALLBACK_URL unset there is no receiver at all. Callbacks must carry
+# the token query parameter of TASK_CALLBACK_URL (a random per-process one is
+# appended when it has none), others get 403. A callback only wakes the
+# waiting poll loop, which then fetches the status itself. Polling continues
+# every TASK_CALLBACK_POLL_INTERVAL seconds (default 30) as a safety net.
+
+CALLBACK_ROUTE = "/byteplus/task_callback"
+CALLBACK_POLL_INTERVAL = 30
+# Callbacks for tasks nobody waits for (yet) are kept this long
+_EARLY_CALLBACK_TTL = 600
+
+
+def _callback_hub():
+    """
+    Process-wide callback state. Every node package has its own copy of this
+    module, but there is one route / listener, so the state lives in a shared
+    module object.
+    """
+    hub = sys.modules.get("_byteplus_callback_hub")
+    if hub is None:
+        new = types.ModuleType("_byteplus_callback_hub")
+        new.lock = threading.Lock()
+        new.waiters = {}   # task_id -> threading.Event
+        new.early = {}     # task_id -> arrival time
+        new.route_registered = False
+        new.listener = None
+        new.token = None   # generated when TASK_CALLBACK_URL has no token
+        hub = sys.modules.setdefault("_byteplus_callback_hub", new)
+    return hub
+
+
+def deliver_task_callback(payload: dict) -> bool:
+    """Wake whoever waits for the task in payload. Returns True if a waiter was found."""
+    task_id = (payload or {}).get("id") or (payload or {}).get("task_id")
+    if not task_id:
+        return False
+    hub = _callback_hub()
+    with hub.lock:
+        event = hub.waiters.get(task_id)
+        if event is None:
+            now = time.time()
+            hub.early = {k: t for k, t in hub.early.items() if now - t < _EARLY_CALLBACK_TTL}
+            hub.early[task_id] = now
+            return False
+    event.set()
+    return True
+
+
+def _expect_callback(task_id: str) -> threading.Event:
+    hub = _callback_hub()
+    with hub.lock:
+        event = hub.waiters.setdefault(task_id, threading.Event())
+        if hub.early.pop(task_id, None):
+            event.set()
+    return event
+
+
+def _forget_callback(task_id: str) -> None:
+    hub = _callback_hub()
+    with hub.lock:
+        hub.waiters.pop(task_id, None)
+
+
+def _callback_token() -> str:
+    """The token callbacks must carry: TASK_CALLBACK_URL's token parameter, else one per process."""
+    from urllib.parse import parse_qs, urlsplit
+
+    token = parse_qs(urlsplit(os.getenv("TASK_CALLBACK_URL") or "").query).get("token", [""])[0]
+    if token:
+        return token
+    hub = _callback_hub()
+    with hub.lock:
+        if hub.token is None:
+            import secrets
+            hub.token = secrets.token_urlsafe(24)
+        return hub.token
+
+
+def _callback_authorized(token: str | None) -> bool:
+    import hmac
+
+    return bool(token) and hmac.compare_digest(token.encode(), _callback_token().encode())
+
+
+def register_callback_route() -> bool:
+    """
+    Add the callback route to ComfyUI's PromptServer (once per process, before
+    it starts). Only when TASK_CALLBACK_URL is set and no standalone listener
+    (TASK_CALLBACK_LISTEN) receives the callbacks instead.
+    """
+    load_env()
+    if not os.getenv("TASK_CALLBACK_URL") or os.getenv("TASK_CALLBACK_LISTEN"):
+        return False
+    server = sys.modules.get("server")
+    instance = getattr(getattr(server, "PromptServer", None), "instance", None)
+    if instance is None:
+        return False
+    hub = _callback_hub()
+    with hub.lock:
+        if hub.route_registered:
+            return True
+        hub.route_registered = True
+
+    async def _task_callback(request):
+        from aiohttp import web
+        if not _callback_authorized(request.query.get("token")):
+            return web.json_response({"ok": False, "error": "invalid token"}, status=403)
+        try:
+            payload = await request.json()
+        except Exception:
+            return web.json_response({"ok": False, "error": "invalid JSON"}, status=400)
+        return web.json_response({"ok": True, "waiting": deliver_task_callback(payload)})
+
+    instance.routes.post(CALLBACK_ROUTE)(_task_callback)
+    return True
+
+
+def start_callback_listener(host: str = "0.0.0.0", port: int = 8199):
+    """Start (once) a standalone HTTP listener for callbacks and return the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    hub = _callback_hub()
+    with hub.lock:
+        if hub.listener is not None:
+            return hub.listener
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                from urllib.parse import parse_qs, urlsplit
+
+                url = urlsplit(self.path)
+                if url.path != CALLBACK_ROUTE:
+                    self.send_error(404)
+                    return
+                if not _callback_authorized(parse_qs(url.query).get("token", [None])[0]):
+                    self.send_error(403, "invalid token")
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self.send_error(400, "invalid JSON")
+                    return
+                body = json.dumps({"ok": True, "waiting": deliver_task_callback(payload)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        listener = ThreadingHTTPServer((host, port), _Handler)
+        thread = threading.Thread(target=listener.serve_forever, name="byteplus-callbacks", daemon=True)
+        thread.start()
+        hub.listener = listener
+    print(f"[BytePlus] Task callback listener on {host}:{listener.server_address[1]}{CALLBACK_ROUTE}")
+    return listener
+
+
+def task_callback_url() -> str | None:
+    """
+    The callback_url to send with new tasks (with its token), or None when
+    callbacks are off. Starts the standalone listener on first use if
+    TASK_CALLBACK_LISTEN is set.
+    """
+    url = os.getenv("TASK_CALLBACK_URL")
+    if not url:
+        return None
+    listen = os.getenv("TASK_CALLBACK_LISTEN")
+    if listen:
+        host, _, port = listen.rpartition(":")
+        try:
+            start_callback_listener(host or "0.0.0.0", int(port))
+        except (OSError, ValueError) as e:
+            print(f"[BytePlus] Could not start callback listener on {listen}: {e}")
+            return None
+    from urllib.parse import parse_qs, urlsplit
+
+    query = urlsplit(url).query
+    if "token" not in parse_qs(query):
+        url += ("&" if query else "?") + f"token={_callback_token()}"
+    return url
+
+
+def cancel_task(api, task_id: str) -> str:
+    """
+    Ask ARK to cancel a task we are abandoning (DELETE on the task: queued
+    tasks are cancelled, finished ones are deleted). Never raises; the
+    outcome is logged, kept in TASK_CANCELLATIONS and returned.
+    """
+    try:
+        r = api.session.delete(
+            f"{api.base_url}/contents/generations/tasks/{task_id}",
+            headers=api.headers,
+            timeout=10,
+        )
+        if r.status_code < 300:
+            outcome = "cancelled"
+        else:
+            outcome = f"cancel rejected (HTTP {r.status_code}: {r.text[:200]})"
+    except Exception as e:
+        outcome = f"cancel failed: {e}"
+    TASK_CANCELLATIONS[task_id] = outcome
+    print(f"[BytePlus] Task {task_id}: {outcome}")
+    return outcome
+
+
+def _history_path() -> str:
+    path = os.getenv("TASK_HISTORY_FILE")
+    if path:
+        return path
+    try:
+        import folder_paths
+        base = folder_paths.get_user_directory()
+    except Exception:
+        import tempfile
+        base = tempfile.gettempdir()
+    return os.path.join(base, "byteplus_task_history.json")
+
+
+def _load_history() -> dict:
+    """(model|resolution) -> recent seconds of work per second of video, loaded once."""
+    if _HISTORY["data"] is None:
+        path = _history_path()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        _HISTORY["data"], _HISTORY["path"] = data, path
+    return _HISTORY["data"]
+
+
+def _history_key(params: dict) -> str:
+    return f"{params.get('model')}|{params.get('resolution')}"
+
+
+def record_task_time(params: dict, elapsed: float) -> None:
+    """Add a completed job's wall time to the history used by task_deadline()."""
+    duration = float(params.get("duration") or 5)
+    with _HISTORY_LOCK:
+        data = _load_history()
+        samples = data.setdefault(_history_key(params), [])
+        samples.append(round(elapsed / duration, 2))
+        del samples[:-HISTORY_SAMPLES]
+        tmp_path = f"{_HISTORY['path']}.{os.getpid()}.part"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, _HISTORY["path"])
+        except OSError as e:
+            print(f"[BytePlus] Could not save task history: {e}")
+
+
+def task_deadline(params: dict | None) -> tuple[float, str]:
+    """
+    Return (seconds, reason) for how long a job with these request params
+    (model, resolution, duration) may take before it is abandoned.
+    """
+    params = params or {}
+    model = str(params.get("model") or "")
+    name = re.sub(r"[^A-Za-z0-9]", "_", model).upper()
+    for var in (f"TASK_SLO_{name}", "TASK_SLO_SECONDS"):
+        value = os.getenv(var)
+        if value:
+            try:
+                return float(value), f"{var}={value}"
+            except ValueError:
+                print(f"[BytePlus] Ignoring invalid {var}={value!r}")
+
+    duration = float(params.get("duration") or 5)
+    resolution = params.get("resolution") or "720p"
+    with _HISTORY_LOCK:
+        samples = sorted(_load_history().get(_history_key(params), []))
+    if len(samples) >= HISTORY_MIN_SAMPLES:
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        seconds = HISTORY_SAFETY * p95 * duration + QUEUE_ALLOWANCE_SECONDS
+        reason = f"{HISTORY_SAFETY:g}x p95 of {len(samples)} past {model} {resolution} jobs ({p95:g}s per video second)"
+    else:
+        speed = next((v for k, v in _MODEL_SPEED if k in model), _DEFAULT_SPEED)
+        estimate = speed * _RESOLUTION_FACTOR.get(resolution, 1.0) * duration
+        seconds = DEADLINE_SAFETY * estimate + QUEUE_ALLOWANCE_SECONDS
+        reason = f"{DEADLINE_SAFETY:g}x estimate of {estimate:.0f}s for {model} {resolution} {duration:g}s"
+    seconds = round(min(max(seconds, MIN_DEADLINE_SECONDS), MAX_DEADLINE_SECONDS))
+    return seconds, reason
+
+
+def poll_task(api, task_id: str, max_wait_time: float | None = None, poll_interval: float = 5,
+              params: dict | None = None) -> dict:
+    """
+    Poll api.get_task_status(task_id) until the task succeeds and return the result.
+    With task callbacks enabled, a callback triggers the next poll immediately
+    and the regular polls slow down to a safety net.
+
+    Raises RuntimeError when the task fails. On a ComfyUI interrupt (checked
+    between polls and while sleeping) or once the deadline passes the remote
+    task is cancelled first, then InterruptProcessingException / TimeoutError
+    is raised, so the worker is freed right away and abandoned tasks stop
+    running on ARK. Without max_wait_time the deadline comes from
+    task_deadline(params); successful jobs feed its history.
+    """
+    if max_wait_time is None:
+        max_wait_time, reason = task_deadline(params)
+    else:
+        reason = "max_wait_time"
+    print(f"[BytePlus] Task {task_id}: deadline {max_wait_time:g}s ({reason})")
+    coordinator = _coordinator()
+    if coordinator is not None:
+        coordinator.task_started(api, task_id, params)
+    start = time.monotonic()
+    deadline = start + max_wait_time
+    callback = _expect_callback(task_id) if os.getenv("TASK_CALLBACK_URL") else None
+    if callback is not None:
+        try:
+            safety_interval = float(os.getenv("TASK_CALLBACK_POLL_INTERVAL", CALLBACK_POLL_INTERVAL))
+        except ValueError:
+            safety_interval = CALLBACK_POLL_INTERVAL
+        poll_interval = max(poll_interval, safety_interval)
+
+    try:
+        while True:
+            if processing_interrupted():
+                cancel_task(api, task_id)
+                if coordinator is not None:
+                    coordinator.task_polled(task_id, "cancelled")
+                _raise_interrupted()
+
+            if callback is not None:
+                # A callback arriving from here on triggers another poll
+                callback.clear()
+            result = api.get_task_status(task_id)
+            status = result.get("status", "unknown")
+            if coordinator is not None:
+                coordinator.task_polled(task_id, status, result if status == "succeeded" else None)
+            if status == "succeeded":
+                if params:
+                    record_task_time(params, time.monotonic() - start)
+                return result
+            if status in TERMINAL_FAILURES:
+                error = result.get("error") or {}
+                message = error.get("message", "Unknown error") if isinstance(error, dict) else error
+                raise RuntimeError(f"Video generation {status}: {message}")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                outcome = cancel_task(api, task_id)
+                if coordinator is not None:
+                    coordinator.task_polled(task_id, "timeout")
+                raise TimeoutError(
+                    f"Video generation timed out after {max_wait_time:g} seconds "
+                    f"(deadline: {reason}; remote task {outcome})"
+                )
+            sleep_interruptible(min(poll_interval, remaining), event=callback)
+    finally:
+        finish_task(task_id)
+        if callback is not None:
+            _forget_callback(task_id)
+
+register_callback_route()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# What the ARK generation models accept, as data, and a validator that checks
+# a request against it before any image is encoded or uploaded (every node
+# package has a copy). Image checks only look at shapes, headers and byte
+# counts, never at pixels.
+#
+# Models are matched by family, so date suffixes, a "doubao-" prefix or a
+# region's own names for them don't matter. Models outside the table (e.g.
+# endpoint ids) only get the mode and image checks. ARK_VALIDATE_REQUESTS=0
+# turns all checks off, e.g. when the service gained a capability before this
+# table did.
+
+import os
+
+SEEDANCE_RATIOS = ("16:9", "4:3", "1:1", "3:4", "9:16", "21:9")
+SEEDANCE_RESOLUTIONS = ("480p", "720p", "1080p")
+
+# family -> limits; a model id belongs to the first family it contains
+MODEL_CAPABILITIES = {
+    "seedance-1-0-pro": {
+        "modes": ("t2v", "i2v"),
+        "resolutions": SEEDANCE_RESOLUTIONS,
+        "ratios": SEEDANCE_RATIOS + ("adaptive",),
+        "duration": (3, 12),
+    },
+    "seedance-1-0-lite-t2v": {
+        "modes": ("t2v",),
+        "resolutions": SEEDANCE_RESOLUTIONS,
+        "ratios": SEEDANCE_RATIOS,
+        "duration": (3, 12),
+    },
+    "seedance-1-0-lite-i2v": {
+        "modes": ("i2v", "flf", "refs"),
+        "resolutions": SEEDANCE_RESOLUTIONS,
+        "ratios": SEEDANCE_RATIOS + ("adaptive",),
+        "duration": (3, 12),
+    },
+    "seedream-4-0": {
+        "modes": ("seedream",),
+        "pixels": (1280 * 720, 4096 * 4096),
+        "size_ratio": (1 / 16, 16),
+        "max_total_images": 15,
+    },
+}
+
+# Request mode -> number of input images, the limits those images have to meet
+# and restrictions on top of the model's
+MODES = {
+    "t2v": {"images": (0, 0), "image_limits": "seedance"},
+    "i2v": {"images": (1, 1), "image_limits": "seedance"},
+    "flf": {"images": (2, 2), "image_limits": "seedance"},
+    "refs": {"images": (1, 4), "image_limits": "seedance",
+             "resolutions": ("480p", "720p"), "ratios": SEEDANCE_RATIOS},
+    "seedream": {"images": (0, 10), "image_limits": "seedream"},
+}
+
+IMAGE_LIMITS = {
+    "seedance": {"min_side": 300, "max_side": 6000, "ratio": (0.4, 2.5), "max_bytes": 30 << 20},
+    "seedream": {"min_side": 15, "max_pixels": 6000 * 6000, "ratio": (1 / 3, 3), "max_bytes": 10 << 20},
+}
+
+
+def checks_enabled() -> bool:
+    return os.getenv("ARK_VALIDATE_REQUESTS", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def model_capabilities(model: str | None) -> dict | None:
+    """The MODEL_CAPABILITIES entry of model's family, or None for unknown models."""
+    if not model:
+        return None
+    for family, caps in MODEL_CAPABILITIES.items():
+        if family in model:
+            return caps
+    return None
+
+
+def image_info(image) -> tuple:
+    """
+    (width, height, byte size) of an input image without decoding it; unknown
+    parts are None. Accepts IMAGE tensors / arrays ([B,]H,W,C; the first image
+    of a batch is what gets sent), PIL images, encoded bytes, InlineImages
+    and data URLs.
+    http(s) URLs are fetched by the service, so nothing is known about them.
+    """
+    if type(image).__name__ == "InlineImage":     # byteplus_transport, from any package's copy
+        image = image.data
+    if isinstance(image, (bytes, bytearray)):
+        import io
+        from PIL import Image
+
+        try:
+            with Image.open(io.BytesIO(image)) as img:    # reads the header only
+                return img.size[0], img.size[1], len(image)
+        except Exception:
+            return None, None, len(image)
+    if isinstance(image, str):
+        if image.startswith("data:") and "," in image:
+            encoded = len(image) - image.index(",") - 1
+            return None, None, encoded * 3 // 4
+        return None, None, None
+    shape = getattr(image, "shape", None)
+    if shape is not None and len(shape) >= 3:
+        return int(shape[-2]), int(shape[-3]), None
+    size = getattr(image, "size", None)
+    if isinstance(size, tuple) and len(size) == 2:
+        return size[0], size[1], None
+    return None, None, None
+
+
+def _image_problems(index: int, image, limits: dict) -> list:
+    width, height, nbytes = image_info(image)
+    problems = []
+    name = f"image {index}"
+    if nbytes is not None and nbytes > limits["max_bytes"]:
+        problems.append(f"{name} is {nbytes / (1 << 20):.1f} MB, the limit is {limits['max_bytes'] >> 20} MB")
+    if not width or not height:
+        return problems
+    if min(width, height) < limits["min_side"]:
+        problems.append(f"{name} is {width}x{height}, sides must be at least {limits['min_side']} px")
+    if "max_side" in limits and max(width, height) > limits["max_side"]:
+        problems.append(f"{name} is {width}x{height}, sides must be at most {limits['max_side']} px")
+    if "max_pixels" in limits and width * height > limits["max_pixels"]:
+        problems.append(f"{name} is {width}x{height}, more than {limits['max_pixels']} pixels")
+    low, high = limits["ratio"]
+    if not low <= width / height <= high:
+        problems.append(f"{name} is {width}x{height}, the aspect ratio (width/height) must be "
+                        f"between {low:.2f} and {high:.2f}")
+    return problems
+
+
+def _allowed(*choices):
+    """Values in every given choice list, or None when none restricts them."""
+    choices = [c for c in choices if c]
+    if not choices:
+        return None
+    return [v for v in choices[0] if all(v in c for c in choices[1:])]
+
+
+def request_problems(mode: str, params: dict, images=()) -> list:
+    """Everything about a request the service would reject, as messages."""
+    rules = MODES[mode]
+    model = params.get("model")
+    caps = model_capabilities(model) or {}
+    problems = []
+    if caps and mode not in caps["modes"]:
+        problems.append(f"model {model} does not support {mode}")
+
+    images = [image for image in images if image is not None]
+    low, high = rules["images"]
+    if not low <= len(images) <= high:
+        expected = str(low) if low == high else f"{low}-{high}"
+        problems.append(f"{mode} takes {expected} input images, got {len(images)}")
+
+    for field, key in (("resolution", "resolutions"), ("aspect_ratio", "ratios")):
+        value = params.get(field)
+        allowed = _allowed(caps.get(key), rules.get(key))
+        if value and allowed is not None and value not in allowed:
+            problems.append(f"{field.replace('_', ' ')} {value} is not supported here (use {', '.join(allowed)})")
+
+    duration = params.get("duration")
+    if duration is not None and "duration" in caps:
+        low, high = caps["duration"]
+        if not low <= int(duration) <= high:
+            problems.append(f"duration {duration}s is outside {low}-{high}s")
+
+    if mode == "seedream" and caps:
+        width, height = int(params.get("width", 2048)), int(params.get("height", 2048))
+        low, high = caps["pixels"]
+        if not low <= width * height <= high:
+            problems.append(f"output size {width}x{height} must have between {low} and {high} pixels")
+        low, high = caps["size_ratio"]
+        if not low <= width / height <= high:
+            problems.append(f"output size {width}x{height} has an aspect ratio outside 1:16-16:1")
+        generated = int(params.get("max_images", 1)) if params.get("sequential_image_generation") == "auto" else 1
+        if len(images) + generated > caps["max_total_images"]:
+            problems.append(f"{len(images)} input + {generated} generated images exceed the total of "
+                            f"{caps['max_total_images']}")
+
+    limits = IMAGE_LIMITS[rules["image_limits"]]
+    for index, image in enumerate(images, 1):
+        problems.extend(_image_problems(index, image, limits))
+    return problems
+
+
+def validate_request(mode: str, params: dict, images=()) -> None:
+    """Raise ValueError listing every problem with a request, before it costs encoding or I/O."""
+    if not checks_enabled():
+        return
+    problems = request_problems(mode, params, images)
+    if problems:
+        raise ValueError(f"Invalid {mode} request for {params.get('model') or 'the default model'}: "
+                         + "; ".join(problems) + " (ARK_VALIDATE_REQUESTS=0 skips these checks)")
@@ -0,0 +1,558 @@
+# -*- coding: utf-8 -*-
+# Optional coordination between several ComfyUI hosts using the same ARK
+# account(s). Every node package has a copy; the state is process-wide.
+#
+# COORDINATOR_URL selects a broker (unset = off, nothing changes):
+#   sqlite:////mnt/shared/byteplus.db   SQLite database on a disk all hosts mount
+#   memory://                           in-process stand-in (single host, tests)
+#   python:mypackage.brokers:make       factory returning any Broker implementation
+#
+# Through the broker hosts
+# - register every task they poll (endpoint, region, key label, request params,
+#   heartbeat, final result), so any host can pick up a task by id: see
+#   resume_task() and the "Seedance Resume Task" node;
+# - share a concurrency budget: with COORDINATOR_MAX_CONCURRENT set, each
+#   submission takes a lease in the broker and holds it while its task is being
+#   polled. Leases of hosts that die expire after COORDINATOR_LEASE_SECONDS;
+# - share downloaded outputs: a video one host downloaded to the shared output
+#   directory is reused by the others instead of being fetched again.
+# With COORDINATOR_ADOPT_ORPHANS=1 a host also takes over polling tasks whose
+# owner stopped sending heartbeats, so their results still land in the broker.
+
+import os
+import sys
+import json
+import time
+import uuid
+import types
+import socket
+import threading
+
+from .byteplus_api_utils import (
+    DEFAULT_BASE_URL,
+    _raise_interrupted,
+    configured_regions,
+    create_session,
+    get_api_client,
+    interrupt_scope,
+    key_pool,
+    load_env,
+    poll_task,
+    region_for_task,
+    sleep_interruptible,
+    task_deadline,
+)
+
+LEASE_SECONDS = 300
+ORPHAN_SECONDS = 300
+ADOPT_INTERVAL = 60
+LEASE_RETRY_SECONDS = 2
+# Task statuses that still need someone polling them
+ACTIVE_STATUSES = ("queued", "running")
+_TASK_FIELDS = ("task_id", "host", "owner", "status", "base_url", "region", "key_label",
+                "params", "result", "created", "heartbeat")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        print(f"[BytePlus] Ignoring invalid {name}={os.getenv(name)!r}")
+        return default
+
+
+class Broker:
+    """
+    Storage behind the coordinator. Task records are dicts with the keys in
+    _TASK_FIELDS; params and result are JSON-compatible values. Times are
+    time.time() seconds, so hosts should keep their clocks in sync.
+    """
+
+    def register_task(self, record: dict) -> None:
+        """Insert a task, or take over an existing one (owner, status, heartbeat)."""
+        raise NotImplementedError
+
+    def update_task(self, task_id: str, **fields) -> None:
+        raise NotImplementedError
+
+    def get_task(self, task_id: str) -> dict | None:
+        raise NotImplementedError
+
+    def orphaned_tasks(self, stale_before: float) -> list:
+        """Active tasks whose last heartbeat is older than stale_before."""
+        raise NotImplementedError
+
+    def claim_task(self, task_id: str, owner: str, last_heartbeat: float) -> bool:
+        """Make owner the poller of task_id unless someone else heartbeat it since."""
+        raise NotImplementedError
+
+    def acquire_lease(self, host: str, limit: int, ttl: float) -> str | None:
+        """Take one of limit shared slots, or return None when all are leased."""
+        raise NotImplementedError
+
+    def bind_lease(self, lease_id: str, task_id: str) -> None:
+        raise NotImplementedError
+
+    def renew_leases(self, task_id: str, ttl: float) -> None:
+        raise NotImplementedError
+
+    def release_lease(self, lease_id: str | None = None, task_id: str | None = None) -> None:
+        raise NotImplementedError
+
+    def count_leases(self) -> int:
+        raise NotImplementedError
+
+    def put_output(self, key: str, path: str, host: str) -> None:
+        raise NotImplementedError
+
+    def get_output(self, key: str) -> str | None:
+        raise NotImplementedError
+
+
+class MemoryBroker(Broker):
+    """In-process stand-in with the same semantics as the shared brokers."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.leases = {}    # lease_id -> [task_id, expires]
+        self.outputs = {}
+
+    def register_task(self, record: dict) -> None:
+        with self.lock:
+            existing = self.tasks.get(record["task_id"])
+            if existing is None:
+                self.tasks[record["task_id"]] = dict(record)
+            else:
+                existing.update({k: record[k] for k in ("owner", "status", "heartbeat")})
+
+    def update_task(self, task_id: str, **fields) -> None:
+        with self.lock:
+            if task_id in self.tasks:
+                self.tasks[task_id].update(fields)
+
+    def get_task(self, task_id: str) -> dict | None:
+        with self.lock:
+            record = self.tasks.get(task_id)
+            return dict(record) if record else None
+
+    def orphaned_tasks(self, stale_before: float) -> list:
+        with self.lock:
+            return [dict(r) for r in self.tasks.values()
+                    if r["status"] in ACTIVE_STATUSES and r["heartbeat"] < stale_before]
+
+    def claim_task(self, task_id: str, owner: str, last_heartbeat: float) -> bool:
+        with self.lock:
+            record = self.tasks.get(task_id)
+            if record is None or record["heartbeat"] != last_heartbeat:
+                return False
+            record.update(owner=owner, heartbeat=time.time())
+            return True
+
+    def _expire(self) -> None:
+        now = time.time()
+        for lease_id in [k for k, (_, expires) in self.leases.items() if expires < now]:
+            del self.leases[lease_id]
+
+    def acquire_lease(self, host: str, limit: int, ttl: float) -> str | None:
+        with self.lock:
+            self._expire()
+            if len(self.leases) >= limit:
+                return None
+            lease_id = f"{host}/{uuid.uuid4().hex[:12]}"
+            self.leases[lease_id] = [None, time.time() + ttl]
+            return lease_id
+
+    def bind_lease(self, lease_id: str, task_id: str) -> None:
+        with self.lock:
+            if lease_id in self.leases:
+                self.leases[lease_id][0] = task_id
+
+    def renew_leases(self, task_id: str, ttl: float) -> None:
+        with self.lock:
+            for lease in self.leases.values():
+                if lease[0] == task_id:
+                    lease[1] = time.time() + ttl
+
+    def release_lease(self, lease_id: str | None = None, task_id: str | None = None) -> None:
+        with self.lock:
+            for k in [k for k, (t, _) in self.leases.items() if k == lease_id or (task_id and t == task_id)]:
+                del self.leases[k]
+
+    def count_leases(self) -> int:
+        with self.lock:
+            self._expire()
+            return len(self.leases)
+
+    def put_output(self, key: str, path: str, host: str) -> None:
+        with self.lock:
+            self.outputs[key] = path
+
+    def get_output(self, key: str) -> str | None:
+        with self.lock:
+            return self.outputs.get(key)
+
+
+class SQLiteBroker(Broker):
+    """
+    Broker in a SQLite file that all hosts can open (e.g. on NFS/SMB). Uses the
+    rollback journal rather than WAL, which needs shared memory between hosts.
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS tasks (task_id TEXT PRIMARY KEY, host TEXT, owner TEXT, "
+        "status TEXT, base_url TEXT, region TEXT, key_label TEXT, params TEXT, result TEXT, "
+        "created REAL, heartbeat REAL)",
+        "CREATE INDEX IF NOT EXISTS tasks_active ON tasks (status, heartbeat)",
+        "CREATE TABLE IF NOT EXISTS leases (lease_id TEXT PRIMARY KEY, task_id TEXT, expires REAL)",
+        "CREATE TABLE IF NOT EXISTS outputs (key TEXT PRIMARY KEY, path TEXT, host TEXT, created REAL)",
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        with self._connect() as db:
+            for statement in self._SCHEMA:
+                db.execute(statement)
+
+    def _connect(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            import sqlite3
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=DELETE")
+            db.row_factory = sqlite3.Row
+            self.local.db = db
+        return db
+
+    @staticmethod
+    def _record(row) -> dict | None:
+        if row is None:
+            return None
+        record = dict(row)
+        for field in ("params", "result"):
+            record[field] = json.loads(record[field]) if record[field] else None
+        return record
+
+    def register_task(self, record: dict) -> None:
+        values = dict(record, params=json.dumps(record.get("params")), result=json.dumps(record.get("result")))
+        with self._connect() as db:
+            db.execute(
+                f"INSERT INTO tasks ({', '.join(_TASK_FIELDS)}) VALUES ({', '.join('?' * len(_TASK_FIELDS))}) "
+                "ON CONFLICT(task_id) DO UPDATE SET owner=excluded.owner, status=excluded.status, "
+                "heartbeat=excluded.heartbeat",
+                [values.get(f) for f in _TASK_FIELDS],
+            )
+
+    def update_task(self, task_id: str, **fields) -> None:
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        with self._connect() as db:
+            db.execute(f"UPDATE tasks SET {', '.join(f'{k}=?' for k in fields)} WHERE task_id=?",
+                       [*fields.values(), task_id])
+
+    def get_task(self, task_id: str) -> dict | None:
+        db = self._connect()
+        return self._record(db.execute("SELECT * FROM tasks WHERE task_id=?", (task_id,)).fetchone())
+
+    def orphaned_tasks(self, stale_before: float) -> list:
+        db = self._connect()
+        rows = db.execute(
+            f"SELECT * FROM tasks WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))}) AND heartbeat < ?",
+            (*ACTIVE_STATUSES, stale_before),
+        ).fetchall()
+        return [self._record(row) for row in rows]
+
+    def claim_task(self, task_id: str, owner: str, last_heartbeat: float) -> bool:
+        with self._connect() as db:
+            cursor = db.execute("UPDATE tasks SET owner=?, heartbeat=? WHERE task_id=? AND heartbeat=?",
+                                (owner, time.time(), task_id, last_heartbeat))
+            return cursor.rowcount == 1
+
+    def acquire_lease(self, host: str, limit: int, ttl: float) -> str | None:
+        db = self._connect()
+        now = time.time()
+        # Count and insert in one write transaction so two hosts cannot both take the last slot
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM leases WHERE expires < ?", (now,))
+            (count,) = db.execute("SELECT COUNT(*) FROM leases").fetchone()
+            lease_id = None
+            if count < limit:
+                lease_id = f"{host}/{uuid.uuid4().hex[:12]}"
+                db.execute("INSERT INTO leases (lease_id, task_id, expires) VALUES (?, NULL, ?)",
+                           (lease_id, now + ttl))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return lease_id
+
+    def bind_lease(self, lease_id: str, task_id: str) -> None:
+        with self._connect() as db:
+            db.execute("UPDATE leases SET task_id=? WHERE lease_id=?", (task_id, lease_id))
+
+    def renew_leases(self, task_id: str, ttl: float) -> None:
+        with self._connect() as db:
+            db.execute("UPDATE leases SET expires=? WHERE task_id=?", (time.time() + ttl, task_id))
+
+    def release_lease(self, lease_id: str | None = None, task_id: str | None = None) -> None:
+        with self._connect() as db:
+            db.execute("DELETE FROM leases WHERE lease_id=? OR (? IS NOT NULL AND task_id=?)",
+                       (lease_id, task_id, task_id))
+
+    def count_leases(self) -> int:
+        db = self._connect()
+        (count,) = db.execute("SELECT COUNT(*) FROM leases WHERE expires >= ?", (time.time(),)).fetchone()
+        return count
+
+    def put_output(self, key: str, path: str, host: str) -> None:
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO outputs (key, path, host, created) VALUES (?, ?, ?, ?)",
+                       (key, path, host, time.time()))
+
+    def get_output(self, key: str) -> str | None:
+        row = self._connect().execute("SELECT path FROM outputs WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+
+def open_broker(url: str) -> Broker:
+    """Create the broker for a COORDINATOR_URL, see the module comment."""
+    if url == "memory://":
+        return MemoryBroker()
+    if url.startswith("sqlite:"):
+        path = url[len("sqlite:"):]
+        return SQLiteBroker(path[2:] if path.startswith("//") else path)
+    if url.startswith("python:"):
+        import importlib
+        module, _, factory = url[len("python:"):].partition(":")
+        return getattr(importlib.import_module(module), factory)()
+    raise ValueError(f"Unsupported COORDINATOR_URL: {url}")
+
+
+class TaskClient:
+    """Just enough of an ARK client to poll and cancel any video task by id."""
+
+    def __init__(self, region=None):
+        load_env()
+        self.region = region
+        self.api_key = region.api_key if region else os.getenv('ARK_API_KEY')
+        if not self.api_key:
+            raise ValueError("ARK_API_KEY environment variable is required")
+        self.base_url = region.base_url if region else os.getenv('ARK_API_BASE_URL', DEFAULT_BASE_URL)
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+        self.session = create_session()
+
+    def get_task_status(self, task_id: str) -> dict:
+        r = self.session.get(
+            f"{self.base_url}/contents/generations/tasks/{task_id}",
+            headers=self.headers,
+            timeout=60,
+        )
+        r.raise_for_status()
+        return r.json()
+
+
+def key_label_for_task(api, task_id: str) -> str:
+    """Label ("...abcd") of the API key task_id was submitted with by api."""
+    pool = key_pool(api.api_key, api.region)
+    key = pool.key_for_task(task_id) if pool is not None else None
+    return key.label if key is not None else f"...{api.api_key[-4:]}"
+
+
+class Coordinator:
+    """This host's view of the broker."""
+
+    def __init__(self, broker: Broker, host: str):
+        self.broker = broker
+        self.host = host
+
+    @staticmethod
+    def budget() -> int:
+        return int(_env_float("COORDINATOR_MAX_CONCURRENT", 0))
+
+    @staticmethod
+    def lease_seconds() -> float:
+        return _env_float("COORDINATOR_LEASE_SECONDS", LEASE_SECONDS)
+
+    # -- shared concurrency budget --------------------------------------
+
+    def acquire_budget(self) -> str | None:
+        """Block until a shared slot is free; None when there is no shared budget."""
+        limit = self.budget()
+        if limit <= 0:
+            return None
+        waiting = False
+        while True:
+            lease_id = self.broker.acquire_lease(self.host, limit, self.lease_seconds())
+            if lease_id is not None:
+                return lease_id
+            if not waiting:
+                print(f"[BytePlus] All {limit} shared task slots are in use, waiting")
+                waiting = True
+            if sleep_interruptible(LEASE_RETRY_SECONDS):
+                _raise_interrupted()
+
+    def bind_budget(self, lease_id: str | None, task_id: str) -> None:
+        if lease_id is not None:
+            self.broker.bind_lease(lease_id, task_id)
+
+    def release_budget(self, lease_id: str | None) -> None:
+        if lease_id is not None:
+            self.broker.release_lease(lease_id=lease_id)
+
+    # -- task registry (called from poll_task) --------------------------
+
+    def task_started(self, api, task_id: str, params: dict | None) -> None:
+        now = time.time()
+        scalars = {k: v for k, v in (params or {}).items() if isinstance(v, (str, int, float, bool))}
+        self.broker.register_task({
+            "task_id": task_id, "host": self.host, "owner": self.host, "status": "running",
+            "base_url": api.base_url, "region": api.region.name if api.region else None,
+            "key_label": key_label_for_task(api, task_id), "params": scalars, "result": None,
+            "created": now, "heartbeat": now,
+        })
+
+    def task_polled(self, task_id: str, status: str, result: dict | None = None) -> None:
+        fields = {"status": status, "heartbeat": time.time()}
+        if result is not None:
+            fields["result"] = result
+        self.broker.update_task(task_id, **fields)
+        if status in ACTIVE_STATUSES:
+            self.broker.renew_leases(task_id, self.lease_seconds())
+
+    def finish_task(self, task_id: str) -> None:
+        self.broker.release_lease(task_id=task_id)
+
+    # -- shared outputs --------------------------------------------------
+
+    def shared_output(self, key: str) -> str | None:
+        """A file another host stored for key, if this host can see it."""
+        path = self.broker.get_output(key)
+        return path if path and os.path.isfile(path) else None
+
+    def publish_output(self, key: str, path: str) -> None:
+        self.broker.put_output(key, os.path.abspath(path), self.host)
+
+    def stats(self) -> dict:
+        return {"host": self.host, "budget": self.budget(), "leases": self.broker.count_leases()}
+
+    # -- orphaned tasks --------------------------------------------------
+
+    def adopt_orphans(self) -> list:
+        """Take over polling active tasks whose owner went quiet; returns the adopted ids."""
+        stale_before = time.time() - _env_float("COORDINATOR_ORPHAN_SECONDS", ORPHAN_SECONDS)
+        adopted = []
+        for record in self.broker.orphaned_tasks(stale_before):
+            if self.broker.claim_task(record["task_id"], self.host, record["heartbeat"]):
+                adopted.append(record["task_id"])
+                print(f"[BytePlus] Adopting task {record['task_id']} from {record['owner']}")
+                threading.Thread(target=_resume_quietly, args=(record["task_id"],),
+                                 name=f"byteplus-adopt-{record['task_id']}", daemon=True).start()
+        return adopted
+
+
+def _resume_quietly(task_id: str) -> None:
+    # No prompt waits on an adopted task: a Cancel pressed in ComfyUI is not for it
+    try:
+        with interrupt_scope(threading.Event(), detached=True):
+            resume_task(task_id)
+    except Exception as e:
+        print(f"[BytePlus] Adopted task {task_id} failed: {e}")
+
+
+def _hub():
+    hub = sys.modules.get("_byteplus_coordinator")
+    if hub is None:
+        new = types.ModuleType("_byteplus_coordinator")
+        new.lock = threading.Lock()
+        new.url = None
+        new.coordinator = None
+        new.adopter = None
+        hub = sys.modules.setdefault("_byteplus_coordinator", new)
+    return hub
+
+
+def get_coordinator() -> Coordinator | None:
+    """The process-wide Coordinator for COORDINATOR_URL, or None when coordination is off."""
+    url = os.getenv("COORDINATOR_URL")
+    hub = _hub()
+    if url == hub.url:
+        return hub.coordinator
+    with hub.lock:
+        if url != hub.url:
+            coordinator = None
+            if url:
+                host = os.getenv("COORDINATOR_HOST_ID") or f"{socket.gethostname()}:{os.getpid()}"
+                try:
+                    coordinator = Coordinator(open_broker(url), host)
+                    print(f"[BytePlus] Coordinating tasks through {url} as {host}")
+                except Exception as e:
+                    print(f"[BytePlus] Could not open coordinator {url}: {e}")
+            hub.coordinator, hub.url = coordinator, url
+    if hub.coordinator is not None and os.getenv("COORDINATOR_ADOPT_ORPHANS", "0") == "1":
+        _start_adopter(hub)
+    return hub.coordinator
+
+
+def _start_adopter(hub) -> None:
+    with hub.lock:
+        if hub.adopter is not None:
+            return
+
+        def _adopt_loop():
+            while True:
+                time.sleep(_env_float("COORDINATOR_ADOPT_INTERVAL", ADOPT_INTERVAL))
+                coordinator = hub.coordinator
+                if coordinator is None:
+                    continue
+                try:
+                    coordinator.adopt_orphans()
+                except Exception as e:
+                    print(f"[BytePlus] Orphan scan failed: {e}")
+
+        hub.adopter = threading.Thread(target=_adopt_loop, name="byteplus-adopter", daemon=True)
+        hub.adopter.start()
+
+
+def _bind_task_key(client, task_id: str, key_label: str | None) -> None:
+    """Poll task_id with the pooled key that created it (matched by label)."""
+    pool = key_pool(client.api_key, client.region)
+    if pool is None or not key_label or pool.key_for_task(task_id) is not None:
+        return
+    key = next((k for k in pool.keys if k.label == key_label), None)
+    if key is not None:
+        pool.bind_task(task_id, key, counted=False)
+
+
+def resume_task(task_id: str, max_wait_time: float | None = None, fallback: dict | None = None) -> dict:
+    """
+    Return the finished task object for task_id, which may have been submitted
+    by another host or an earlier run: the broker's stored result when there
+    is one, otherwise the task is polled from here (against the region and key
+    that created it) until it finishes. fallback supplies region / key_label /
+    params for tasks the broker does not know, e.g. from a results manifest.
+    """
+    coordinator = get_coordinator()
+    record = coordinator.broker.get_task(task_id) if coordinator else None
+    if record is None and fallback:
+        record = {"status": None, "result": None, "region": fallback.get("region"),
+                  "key_label": fallback.get("key_label"), "params": fallback.get("params")}
+    if record and record["status"] == "succeeded" and record["result"]:
+        print(f"[BytePlus] Task {task_id}: using the result stored by {record['owner']}")
+        return record["result"]
+
+    if record and record["region"]:
+        region = next((r for r in configured_regions() if r.name == record["region"]), None)
+    else:
+        region = region_for_task(task_id)
+    client = get_api_client(TaskClient, region=region)
+    _bind_task_key(client, task_id, record and record["key_label"])
+    params = (record and record["params"]) or {}
+    if max_wait_time is None:
+        max_wait_time, _ = task_deadline(params)
+    # params is not passed on: the elapsed time of a resumed task says nothing about its model's speed
+    return poll_task(client, task_id, max_wait_time=max_wait_time)
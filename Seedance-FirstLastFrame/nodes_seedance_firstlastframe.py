@@ -9,19 +9,8 @@ Compatible with ComfyUI 0.3.59 and 0.4.x
 """
 
 import os
-import time
-import base64
 import io
-import requests
 from typing import Dict, Any, Optional
-from PIL import Image
-import numpy as np
-
-try:
-    from dotenv import load_dotenv
-    DOTENV_AVAILABLE = True
-except ImportError:
-    DOTENV_AVAILABLE = False
 
 # optional (only used by utils if available)
 try:
@@ -32,6 +21,10 @@ except ImportError:
 
 # ✅ 关键：使用相对导入（同目录内）
 from .byteplus_video_utils import download_url_to_video_output, create_error_video_placeholder, download_url_to_image_output
+from .byteplus_api_utils import load_env, get_api_client, create_session, is_interrupt, poll_task, region_env, task_callback_url, DEFAULT_BASE_URL
+from .byteplus_scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, scheduled
+from .byteplus_capabilities import validate_request
+from .byteplus_transport import JSONBody, image_reference
 
 
 def _extract_video_url_from_result(result: Dict[str, Any]) -> Optional[str]:
@@ -83,11 +76,14 @@ def _extract_last_frame_url_from_result(result: Dict[str, Any]) -> Optional[str]
     return None
 
 
-def _image_to_base64(image_tensor) -> str:
+def _image_to_png(image_tensor) -> bytes:
     """
-    Convert ComfyUI image tensor to base64 string
+    Convert ComfyUI image tensor to PNG bytes
     image_tensor: torch tensor with shape [B, H, W, C] and values in [0, 1]
     """
+    import numpy as np
+    from PIL import Image
+
     # Convert tensor to numpy array
     if hasattr(image_tensor, 'cpu'):
         image_np = image_tensor.cpu().numpy()
@@ -124,41 +120,46 @@ def _image_to_base64(image_tensor) -> str:
     # Convert to PIL Image
     pil_image = Image.fromarray(image_np)
 
-    # Convert to base64
+    # Convert to PNG
     buffer = io.BytesIO()
     pil_image.save(buffer, format='PNG')
-    image_bytes = buffer.getvalue()
-    base64_string = base64.b64encode(image_bytes).decode('utf-8')
-    
-    return f"data:image/png;base64,{base64_string}"
+    return buffer.getvalue()
 
 
 class SeedanceFirstLastFrameAPI:
     """Handles API calls to Seedance First-Last Frame to Video service"""
 
-    def __init__(self):
-        if DOTENV_AVAILABLE:
-            load_dotenv()
+    def __init__(self, region=None):
+        load_env()
 
-        self.api_key = os.getenv('ARK_API_KEY')
+        # region: a RegionProfile when ARK_REGIONS routing is on, see get_api_client()
+        self.region = region
+        self.api_key = region.api_key if region else os.getenv('ARK_API_KEY')
         if not self.api_key:
             raise ValueError("ARK_API_KEY environment variable is required")
 
-        self.base_url = os.getenv('ARK_API_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3')
+        self.base_url = region.base_url if region else os.getenv('ARK_API_BASE_URL', DEFAULT_BASE_URL)
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
         }
+        # Pooled HTTP session, reused for as long as this client is cached
+        self.session = create_session()
+
+    def check_request(self, first_frame_tensor, last_frame_tensor, prompt: str, params: Dict[str, Any]) -> None:
+        """Reject parameters or frames the model does not accept before encoding (see byteplus_capabilities)"""
+        validate_request("flf", params, [first_frame_tensor, last_frame_tensor])
 
+    @scheduled()
     def generate_video(self, first_frame_tensor, last_frame_tensor, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
         # 从环境变量获取模型名称
-        lite_model = os.getenv('SEEDANCE_LITE_I2V_MODEL', 'seedance-1-0-lite-i2v-250428')
+        lite_model = region_env(self.region, 'SEEDANCE_LITE_I2V_MODEL', 'seedance-1-0-lite-i2v-250428')
 
         # 直接使用环境变量中的模型名称
         actual_model = lite_model
-        # Convert images to base64
-        first_frame_base64 = _image_to_base64(first_frame_tensor)
-        last_frame_base64 = _image_to_base64(last_frame_tensor)
+        # Inline base64 or uploaded URLs, see byteplus_transport
+        first_frame_base64 = image_reference(self, _image_to_png(first_frame_tensor), "png", "first_frame.png")
+        last_frame_base64 = image_reference(self, _image_to_png(last_frame_tensor), "png", "last_frame.png")
         
         # Build text content with parameters
         text_content = prompt if prompt.strip() else "A blue-green jingwei bird transforms into a human form."
@@ -194,18 +195,21 @@ class SeedanceFirstLastFrameAPI:
                 }
             ],
         }
+        callback_url = task_callback_url()
+        if callback_url:
+            payload["callback_url"] = callback_url
 
-        r = requests.post(
+        r = self.session.post(
             f"{self.base_url}/contents/generations/tasks",
             headers=self.headers,
-            json=payload,
+            data=JSONBody(payload),   # images are base64-encoded while the body is sent
             timeout=60,
         )
         r.raise_for_status()
         return r.json()
 
     def get_task_status(self, task_id: str) -> Dict[str, Any]:
-        r = requests.get(
+        r = self.session.get(
             f"{self.base_url}/contents/generations/tasks/{task_id}",
             headers=self.headers,
             timeout=30,
@@ -216,23 +220,15 @@ class SeedanceFirstLastFrameAPI:
     def wait_for_completion(
         self,
         task_id: str,
-        max_wait_time: int = 300,
+        max_wait_time: Optional[int] = None,
         poll_interval: int = 5,
+        params: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
-        start_time = time.time()
-        while time.time() - start_time < max_wait_time:
-            result = self.get_task_status(task_id)
-            status = result.get("status", "unknown")
-            
-            if status == "succeeded":
-                return result
-            elif status == "failed":
-                error_msg = result.get("error", {}).get("message", "Unknown error")
-                raise RuntimeError(f"Video generation failed: {error_msg}")
-            
-            time.sleep(poll_interval)
-        
-        raise TimeoutError(f"Video generation timed out after {max_wait_time} seconds")
+        """
+        Poll until done; cancels the remote task on interrupt or timeout (see poll_task).
+        Without max_wait_time the deadline is derived from params (model, resolution, duration).
+        """
+        return poll_task(self, task_id, max_wait_time=max_wait_time, poll_interval=poll_interval, params=params)
 
 
 class SeedanceFirstLastFrameNode:
@@ -241,6 +237,7 @@ class SeedanceFirstLastFrameNode:
     @classmethod
     def INPUT_TYPES(cls):
         # 从环境变量获取模型名称
+        load_env()
         lite_model = os.getenv('SEEDANCE_LITE_I2V_MODEL', 'seedance-1-0-lite-i2v-250428')
 
         return {
@@ -255,7 +252,10 @@ class SeedanceFirstLastFrameNode:
                 "seed": ("INT", {"default": 1, "min": -1, "max": 2147483647, "step": 1}),
                 "camera_fixed": ("BOOLEAN", {"default": False}),
                 "watermark": ("BOOLEAN", {"default": True}),
-            }
+            },
+            "optional": {
+                "priority": (list(PRIORITY_CLASSES), {"default": DEFAULT_PRIORITY}),
+            },
         }
 
     RETURN_TYPES = ("VIDEO", "IMAGE", "STRING")
@@ -294,9 +294,10 @@ class SeedanceFirstLastFrameNode:
         seed: int,
         camera_fixed: bool,
         watermark: bool,
+        priority: str = DEFAULT_PRIORITY,
     ):
         try:
-            api = SeedanceFirstLastFrameAPI()
+            api = get_api_client(SeedanceFirstLastFrameAPI)
             params = {
                 'model': model,
                 'resolution': resolution,
@@ -305,6 +306,7 @@ class SeedanceFirstLastFrameNode:
                 'seed': seed if seed != -1 else None,
                 'camera_fixed': camera_fixed,
                 'watermark': watermark,
+                'priority': priority,
             }
             
             # Start generation task
@@ -328,7 +330,7 @@ class SeedanceFirstLastFrameNode:
 
             # Wait for completion
             print("[Seedance FirstLastFrame] Waiting for video generation to complete...")
-            done = api.wait_for_completion(task_id)
+            done = api.wait_for_completion(task_id, params=params)
 
             # 增强的完成响应信息输出
             print("=" * 60)
@@ -351,12 +353,12 @@ class SeedanceFirstLastFrameNode:
             print(f"[Seedance FirstLastFrame] Last frame URL: {last_frame_url}")
             
             # Download video and last frame
-            video_obj = download_url_to_video_output(video_url)
+            video_obj = download_url_to_video_output(video_url, task_id=task_id, session=api.session)
             
             # Download last frame if available
             if last_frame_url:
                 try:
-                    last_frame_image = download_url_to_image_output(last_frame_url)
+                    last_frame_image = download_url_to_image_output(last_frame_url, task_id=task_id, session=api.session)
                     print(f"[Seedance FirstLastFrame] Last frame downloaded successfully")
                 except Exception as e:
                     print(f"[Seedance FirstLastFrame] Failed to download last frame: {e}")
@@ -387,6 +389,8 @@ class SeedanceFirstLastFrameNode:
             return (video_obj, last_frame_image, response_info)
             
         except Exception as e:
+            if is_interrupt(e):
+                raise
             error_msg = f"Seedance FirstLastFrame generation failed: {str(e)}"
             print(f"[ERROR] {error_msg}")
 
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+# How input images reach the service: inline as a base64 data URL in the JSON
+# body, or uploaded to {base_url}/files and referenced by URL. Every node
+# package has a copy; the measurements and the upload cache are process-wide.
+#
+# ARK_IMAGE_TRANSPORT=auto (the default) decides per image:
+# - an image uploaded before (same bytes, same endpoint) reuses its URL;
+# - images under ARK_INLINE_MAX_BYTES are inlined: an upload round trip costs
+#   more than the base64 overhead of a small image;
+# - larger ones are uploaded when the measured upload speed says that is
+#   quicker than sending 4/3 of the bytes inline (until there are measurements
+#   they are uploaded, which provides the first one).
+# base64 / url force one transport. A failed upload falls back to inline; an
+# endpoint without /files (404/405) is not asked again.
+#
+# Inline images stay as their encoded bytes (InlineImage) until the request is
+# sent: JSONBody serializes the rest of the payload (with orjson when it is
+# installed) and base64-encodes each image chunk by chunk while requests writes
+# the body, so no base64 copy of an image or of the whole document is built.
+
+import os
+import sys
+import time
+import types
+import re
+import json
+import uuid
+import base64
+import hashlib
+import threading
+
+INLINE_MAX_BYTES = 1 << 20
+UPLOAD_CACHE_SECONDS = 1800
+UPLOAD_CACHE_SIZE = 256
+UPLOAD_RETRY_SECONDS = 600
+TRANSPORTS = ("auto", "base64", "url")
+# Raw bytes per base64 chunk of a streamed image; a multiple of 3, so chunks need no padding
+BASE64_CHUNK = 3 << 16
+
+
+def _hub():
+    """Upload statistics and cache shared by every node package's copy of this module."""
+    hub = sys.modules.get("_byteplus_transport")
+    if hub is None:
+        new = types.ModuleType("_byteplus_transport")
+        new.lock = threading.Lock()
+        new.throughput = None       # bytes/s of uploads, EWMA
+        new.overhead = 0.0          # seconds per upload beyond the transfer, EWMA
+        new.cache = {}              # (base_url, sha1) -> (url, expires)
+        new.unavailable = {}        # base_url -> retry uploads after (inf = never)
+        hub = sys.modules.setdefault("_byteplus_transport", new)
+    return hub
+
+
+def transport_mode() -> str:
+    mode = os.getenv("ARK_IMAGE_TRANSPORT", "auto").strip().lower()
+    if mode not in TRANSPORTS:
+        print(f"[BytePlus] Unknown ARK_IMAGE_TRANSPORT={mode!r}, using auto")
+        return "auto"
+    return mode
+
+
+def _inline_max_bytes() -> int:
+    try:
+        return int(float(os.getenv("ARK_INLINE_MAX_BYTES", INLINE_MAX_BYTES)))
+    except ValueError:
+        print(f"[BytePlus] Ignoring invalid ARK_INLINE_MAX_BYTES={os.getenv('ARK_INLINE_MAX_BYTES')!r}")
+        return INLINE_MAX_BYTES
+
+
+def data_url(data: bytes, fmt: str = "png") -> str:
+    return f"data:image/{fmt};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+class InlineImage:
+    """
+    An image to be sent as a base64 data URL. Only JSONBody encodes it, chunk
+    by chunk while the request is written; str() builds the full data URL.
+    """
+
+    __slots__ = ("data", "fmt")
+
+    def __init__(self, data: bytes, fmt: str = "png"):
+        self.data = data
+        self.fmt = fmt
+
+    def prefix(self) -> bytes:
+        return f"data:image/{self.fmt};base64,".encode("ascii")
+
+    def __len__(self) -> int:
+        """Length of the data URL"""
+        return len(self.prefix()) + 4 * ((len(self.data) + 2) // 3)
+
+    def chunks(self):
+        yield self.prefix()
+        view = memoryview(self.data)
+        for start in range(0, len(view), BASE64_CHUNK):
+            yield base64.b64encode(view[start:start + BASE64_CHUNK])
+
+    def __str__(self) -> str:
+        return data_url(self.data, self.fmt)
+
+    def __repr__(self) -> str:
+        return f"<data:image/{self.fmt};base64 of {len(self.data) / (1 << 20):.2f} MB>"
+
+
+def _dumps(payload, default) -> bytes:
+    try:
+        import orjson
+    except ImportError:
+        return json.dumps(payload, default=default).encode("utf-8")
+    return orjson.dumps(payload, default=default)
+
+
+class JSONBody:
+    """
+    A JSON request body for requests' data= argument, with the InlineImage
+    values of payload streamed into it. It has a length, so requests sends a
+    Content-Length rather than chunked encoding, and it can be iterated again
+    to resend the request (replayable, see attach_routing()). Send it with a
+    "Content-Type: application/json" header.
+    """
+
+    replayable = True
+
+    def __init__(self, payload):
+        token = uuid.uuid4().hex
+        images = []
+
+        def default(obj):
+            if isinstance(obj, InlineImage):
+                images.append(obj)
+                return f"@inline-{token}-{len(images) - 1}@"
+            raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+        text = _dumps(payload, default)
+        # Literal JSON pieces alternating with image indexes
+        self.parts = re.split(f'"@inline-{token}-(\\d+)@"'.encode("ascii"), text)
+        self.images = images
+
+    def __iter__(self):
+        for i, part in enumerate(self.parts):
+            if i % 2 == 0:
+                if part:
+                    yield part
+            else:
+                yield b'"'
+                yield from self.images[int(part)].chunks()
+                yield b'"'
+
+    def __len__(self) -> int:
+        literal = sum(len(part) for part in self.parts[::2])
+        return literal + sum(len(self.images[int(i)]) + 2 for i in self.parts[1::2])
+
+    def __bytes__(self) -> bytes:
+        return b"".join(self)
+
+
+def upload_image(api, data: bytes, filename: str, mime: str = "image/png") -> str:
+    """Upload data to {api.base_url}/files and return its URL."""
+    response = api.session.post(
+        f"{api.base_url}/files",
+        headers={"Authorization": f"Bearer {api.api_key}"},
+        files={"file": (filename, data, mime)},
+        timeout=120,
+    )
+    response.raise_for_status()
+    result = response.json()
+    url = result.get("url") or result.get("file_url")
+    if not url:
+        raise RuntimeError(f"No URL in upload response: {result}")
+    return url
+
+
+def _record_upload(hub, nbytes: int, elapsed: float) -> None:
+    with hub.lock:
+        if hub.throughput is None:
+            hub.throughput = nbytes / max(elapsed, 1e-3)
+            return
+        transfer = nbytes / hub.throughput
+        hub.overhead = 0.7 * hub.overhead + 0.3 * max(0.0, elapsed - transfer)
+        hub.throughput = 0.7 * hub.throughput + 0.3 * nbytes / max(elapsed - hub.overhead, 1e-3)
+
+
+def _choose(hub, nbytes: int, base_url: str, mode: str) -> tuple:
+    """(transport, reason) for an image of nbytes that is not in the upload cache."""
+    if mode != "auto":
+        return mode, f"{mode} requested"
+    if hub.unavailable.get(base_url, 0) > time.time():
+        return "base64", "uploads unavailable"
+    limit = _inline_max_bytes()
+    if nbytes < limit:
+        return "base64", f"below {limit / (1 << 20):.1f} MB"
+    if hub.throughput is None:
+        return "url", "no upload measurements yet"
+    # The request body carries the inline bytes anyway, so only the base64
+    # overhead is saved by an upload, which costs a round trip of its own.
+    upload_s = hub.overhead + nbytes / hub.throughput
+    inline_s = nbytes * 4 / 3 / hub.throughput
+    if upload_s < inline_s:
+        return "url", f"upload ~{upload_s:.2f}s < inline ~{inline_s:.2f}s"
+    return "base64", f"inline ~{inline_s:.2f}s <= upload ~{upload_s:.2f}s"
+
+
+def image_reference(api, data: bytes, fmt: str = "png", filename: str | None = None,
+                    mode: str | None = None) -> str:
+    """
+    The value for an image_url / image field: an uploaded URL, or an
+    InlineImage (send the payload as a JSONBody), chosen as described at the
+    top of this module. mode overrides ARK_IMAGE_TRANSPORT for this image.
+    """
+    hub = _hub()
+    mode = mode or transport_mode()
+    size = f"{len(data) / (1 << 20):.2f} MB"
+    key = (api.base_url, hashlib.sha1(data).hexdigest())
+    now = time.time()
+    if mode != "base64":
+        with hub.lock:
+            cached = hub.cache.get(key)
+        if cached and cached[1] > now:
+            print(f"[BytePlus] Image {size}: reusing upload {cached[0]}")
+            return cached[0]
+
+    transport, reason = _choose(hub, len(data), api.base_url, mode)
+    if transport == "url":
+        started = time.monotonic()
+        try:
+            url = upload_image(api, data, filename or f"image.{fmt}", f"image/{fmt}")
+        except Exception as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            retry = float("inf") if status in (404, 405) else now + UPLOAD_RETRY_SECONDS
+            with hub.lock:
+                hub.unavailable[api.base_url] = retry
+            print(f"[BytePlus] Image {size}: upload failed ({e}), sending inline")
+            return InlineImage(data, fmt)
+        elapsed = time.monotonic() - started
+        _record_upload(hub, len(data), elapsed)
+        with hub.lock:
+            if len(hub.cache) >= UPLOAD_CACHE_SIZE:
+                for stale in sorted(hub.cache, key=lambda k: hub.cache[k][1])[:UPLOAD_CACHE_SIZE // 4]:
+                    del hub.cache[stale]
+            hub.cache[key] = (url, now + UPLOAD_CACHE_SECONDS)
+        print(f"[BytePlus] Image {size}: uploaded in {elapsed:.2f}s ({reason})")
+        return url
+
+    print(f"[BytePlus] Image {size}: inline base64, +{len(data) / 3 / (1 << 20):.2f} MB body ({reason})")
+    return InlineImage(data, fmt)
+
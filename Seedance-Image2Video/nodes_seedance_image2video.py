@@ -6,22 +6,15 @@ Compatible with ComfyUI 0.3.59 and 0.4.x
 - Reads API key from env: ARK_API_KEY
 - Calls Seedance API to generate a video from image
 - Uses download_url_to_video_output(...) to return a REAL VIDEO object
+- Chain node: generates consecutive segments from the previous last frame,
+  submitting the next segment while the previous video downloads
 """
 
 import os
 import time
-import base64
+import threading
 import io
-import requests
 from typing import Dict, Any, Optional
-from PIL import Image
-import numpy as np
-
-try:
-    from dotenv import load_dotenv
-    DOTENV_AVAILABLE = True
-except ImportError:
-    DOTENV_AVAILABLE = False
 
 # optional (only used by utils if available)
 try:
@@ -32,6 +25,10 @@ except ImportError:
 
 # ✅ 关键：使用相对导入（同目录内）
 from .byteplus_video_utils import download_url_to_video_output, create_error_video_placeholder, download_url_to_image_output
+from .byteplus_api_utils import load_env, get_api_client, create_session, interrupt_scope, is_interrupt, poll_task, region_env, task_callback_url, DEFAULT_BASE_URL
+from .byteplus_scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, scheduled
+from .byteplus_capabilities import validate_request
+from .byteplus_transport import JSONBody, image_reference
 
 
 def _extract_video_url_from_result(result: Dict[str, Any]) -> Optional[str]:
@@ -83,11 +80,14 @@ def _extract_last_frame_url_from_result(result: Dict[str, Any]) -> Optional[str]
     return None
 
 
-def _image_to_base64(image_tensor) -> str:
+def _image_to_jpeg(image_tensor) -> bytes:
     """
-    Convert ComfyUI image tensor to base64 string
+    Convert ComfyUI image tensor to JPEG bytes
     image_tensor: torch tensor with shape [B, H, W, C] and values in [0, 1]
     """
+    import numpy as np
+    from PIL import Image
+
     # Convert tensor to numpy array
     if hasattr(image_tensor, 'cpu'):
         image_np = image_tensor.cpu().numpy()
@@ -124,35 +124,42 @@ def _image_to_base64(image_tensor) -> str:
     # Convert to PIL Image - ensure it's RGB mode
     pil_image = Image.fromarray(image_np, mode='RGB')
 
-    # Convert to base64
+    # Convert to JPEG
     buffer = io.BytesIO()
     pil_image.save(buffer, format='JPEG', quality=95)
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-
-    return f"data:image/jpeg;base64,{img_str}"
+    return buffer.getvalue()
 
 
 class SeedanceImage2VideoAPI:
     """Handles API calls to Seedance Image-to-Video service"""
 
-    def __init__(self):
-        if DOTENV_AVAILABLE:
-            load_dotenv()
+    def __init__(self, region=None):
+        load_env()
 
-        self.api_key = os.getenv('ARK_API_KEY')
+        # region: a RegionProfile when ARK_REGIONS routing is on, see get_api_client()
+        self.region = region
+        self.api_key = region.api_key if region else os.getenv('ARK_API_KEY')
         if not self.api_key:
             raise ValueError("ARK_API_KEY environment variable is required")
 
-        self.base_url = os.getenv('ARK_API_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3')
+        self.base_url = region.base_url if region else os.getenv('ARK_API_BASE_URL', DEFAULT_BASE_URL)
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
         }
+        # Pooled HTTP session, reused for as long as this client is cached
+        self.session = create_session()
+
+    def check_request(self, image_tensor, prompt: str, params: Dict[str, Any]) -> None:
+        """Reject parameters or an image the model does not accept before encoding (see byteplus_capabilities)"""
+        validate_request("i2v", params, [image_tensor])
 
+    @scheduled()
     def generate_video(self, image_tensor, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """image_tensor may also be an image URL, e.g. the last_frame_url of a previous task"""
         # 从环境变量获取模型名称
-        lite_model = os.getenv('SEEDANCE_LITE_T2V_MODEL', 'seedance-1-0-lite-i2v-250428')
-        pro_model = os.getenv('SEEDANCE_PRO_MODEL', 'seedance-1-0-pro-250528')
+        lite_model = region_env(self.region, 'SEEDANCE_LITE_T2V_MODEL', 'seedance-1-0-lite-i2v-250428')
+        pro_model = region_env(self.region, 'SEEDANCE_PRO_MODEL', 'seedance-1-0-pro-250528')
 
         # 映射用户选择到实际模型名称
         model_mapping = {
@@ -162,8 +169,11 @@ class SeedanceImage2VideoAPI:
             'doubao-seedance-1-0-pro-250528': pro_model,
         }
         actual_model = model_mapping.get(params.get('model'), lite_model)
-        # Convert image to base64
-        image_base64 = _image_to_base64(image_tensor)
+        # Inline base64 or uploaded URL, see byteplus_transport (URLs are passed through as-is)
+        if isinstance(image_tensor, str):
+            image_base64 = image_tensor
+        else:
+            image_base64 = image_reference(self, _image_to_jpeg(image_tensor), "jpeg", "image.jpg")
         
         # Build text content with parameters
         text_content = prompt if prompt.strip() else "Generate a video from this image"
@@ -188,18 +198,21 @@ class SeedanceImage2VideoAPI:
                 {"type": "image_url", "image_url": {"url": image_base64}}
             ],
         }
+        callback_url = task_callback_url()
+        if callback_url:
+            payload["callback_url"] = callback_url
 
-        r = requests.post(
+        r = self.session.post(
             f"{self.base_url}/contents/generations/tasks",
             headers=self.headers,
-            json=payload,
+            data=JSONBody(payload),   # images are base64-encoded while the body is sent
             timeout=60,
         )
         r.raise_for_status()
         return r.json()
 
     def get_task_status(self, task_id: str) -> Dict[str, Any]:
-        r = requests.get(
+        r = self.session.get(
             f"{self.base_url}/contents/generations/tasks/{task_id}",
             headers=self.headers,
             timeout=30,
@@ -210,27 +223,22 @@ class SeedanceImage2VideoAPI:
     def wait_for_completion(
         self,
         task_id: str,
-        max_wait_time: int = 300,
+        max_wait_time: Optional[int] = None,
         poll_interval: int = 5,
+        params: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
-        start_time = time.time()
-        while time.time() - start_time < max_wait_time:
-            result = self.get_task_status(task_id)
-            status = result.get("status", "unknown")
-            
-            if status == "succeeded":
-                return result
-            elif status == "failed":
-                error_msg = result.get("error", {}).get("message", "Unknown error")
-                raise RuntimeError(f"Video generation failed: {error_msg}")
-            
-            time.sleep(poll_interval)
-        
-        raise TimeoutError(f"Video generation timed out after {max_wait_time} seconds")
+        """
+        Poll until done; cancels the remote task on interrupt or timeout (see poll_task).
+        Without max_wait_time the deadline is derived from params (model, resolution, duration).
+        """
+        return poll_task(self, task_id, max_wait_time=max_wait_time, poll_interval=poll_interval, params=params)
 
 
 class SeedanceImage2VideoNode:
-    """ComfyUI Node for Seedance Image-to-Video generation"""
+    """
+    ComfyUI Node for Seedance Image-to-Video generation. A batch of images
+    gives one task, video and last frame per image.
+    """
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -245,11 +253,18 @@ class SeedanceImage2VideoNode:
                 "seed": ("INT", {"default": 1, "min": -1, "max": 2147483647, "step": 1}),
                 "camera_fixed": ("BOOLEAN", {"default": False}),
                 "watermark": ("BOOLEAN", {"default": True}),
-            }
+            },
+            "optional": {
+                "priority": (list(PRIORITY_CLASSES), {"default": DEFAULT_PRIORITY}),
+                "max_parallel": ("INT", {"default": 4, "min": 1, "max": 16, "step": 1,
+                                         "tooltip": "Batch input: tasks submitted and polled at the same time"}),
+            },
         }
 
     RETURN_TYPES = ("VIDEO", "IMAGE", "STRING")
     RETURN_NAMES = ("video", "last_frame", "response_info")
+    # One video and last frame per image of the input batch, in batch order
+    OUTPUT_IS_LIST = (True, True, False)
     FUNCTION = "generate"
     CATEGORY = "BytePlus/Seedance Image to Video"
     OUTPUT_NODE = True
@@ -272,6 +287,120 @@ class SeedanceImage2VideoNode:
         ]
         return "\n".join(info_lines)
 
+    def _generate_one(self, api, image, prompt: str, params: Dict[str, Any], tag: str = "[Seedance Image2Video]"):
+        """Submit, wait for and download one video; returns (video, last_frame, response_info)"""
+        # Start generation task
+        print(f"{tag} Submitting video generation task...")
+        submit_resp = api.generate_video(image, prompt, params)
+
+        # 增强的API响应信息输出
+        print("=" * 60)
+        print(f"{tag} 📤 API提交响应详情:")
+        print(f"  🆔 任务ID: {submit_resp.get('id', 'N/A')}")
+        print(f"  📊 状态: {submit_resp.get('status', 'N/A')}")
+        print(f"  🕐 创建时间: {submit_resp.get('created_at', 'N/A')}")
+        print(f"  📝 完整响应: {submit_resp}")
+        print("=" * 60)
+
+        task_id = submit_resp.get("id")
+        if not task_id:
+            raise ValueError("No task ID returned from API")
+
+        print(f"{tag} Task ID: {task_id}")
+
+        # Wait for completion
+        print(f"{tag} Waiting for video generation to complete...")
+        done = api.wait_for_completion(task_id, params=params)
+
+        # 增强的完成响应信息输出
+        print("=" * 60)
+        print(f"{tag} ✅ 任务完成响应详情:")
+        print(f"  🆔 任务ID: {done.get('id', 'N/A')}")
+        print(f"  📊 最终状态: {done.get('status', 'N/A')}")
+        print(f"  🕐 更新时间: {done.get('updated_at', 'N/A')}")
+        print(f"  🎬 视频信息: {done.get('result', {})}")
+        print(f"  📝 完整响应: {done}")
+        print("=" * 60)
+        video_url = _extract_video_url_from_result(done)
+        
+        if not video_url:
+            raise ValueError("No video URL found in API response")
+        
+        print(f"{tag} Video URL: {video_url}")
+        
+        # Extract last frame URL
+        last_frame_url = _extract_last_frame_url_from_result(done)
+        print(f"{tag} Last frame URL: {last_frame_url}")
+        
+        # Download video and last frame
+        video_obj = download_url_to_video_output(video_url, task_id=task_id, session=api.session)
+        
+        # Download last frame if available
+        if last_frame_url:
+            try:
+                last_frame_image = download_url_to_image_output(last_frame_url, task_id=task_id, session=api.session)
+                print(f"{tag} Last frame downloaded successfully")
+            except Exception as e:
+                print(f"{tag} Failed to download last frame: {e}")
+                # Create empty image tensor as fallback
+                import torch
+                last_frame_image = torch.zeros((1, 512, 512, 3), dtype=torch.float32)
+        else:
+            print(f"{tag} No last frame URL found")
+            # Create empty image tensor as fallback
+            import torch
+            last_frame_image = torch.zeros((1, 512, 512, 3), dtype=torch.float32)
+
+        status = done.get("status", "unknown")
+
+        # 生成响应信息摘要
+        response_info = self._format_response_info(submit_resp, done, video_url, last_frame_url)
+
+        # 最终结果摘要输出
+        print("=" * 60)
+        print(f"{tag} 🎉 生成任务完成摘要:")
+        print(f"  ✅ 状态: {status}")
+        print(f"  🆔 任务ID: {task_id}")
+        print(f"  🎬 视频URL: {video_url}")
+        print(f"  🖼️  最后一帧URL: {last_frame_url}")
+        print(f"  📊 返回值: (VIDEO对象, IMAGE对象, 'response_info')")
+        print("=" * 60)
+
+        return (video_obj, last_frame_image, response_info)
+
+    def _error_outputs(self, image, e: Exception):
+        """Placeholder outputs for a failed generation, sized like the input image"""
+        error_msg = f"Seedance Image2Video generation failed: {str(e)}"
+        print(f"[ERROR] {error_msg}")
+
+        # Try to extract image dimensions for placeholder
+        try:
+            if hasattr(image, 'shape'):
+                if len(image.shape) == 4:
+                    # [B, H, W, C]
+                    height, width = image.shape[1], image.shape[2]
+                else:
+                    # [H, W, C]
+                    height, width = image.shape[0], image.shape[1]
+            else:
+                # Default dimensions
+                height, width = 512, 512
+        except:
+            height, width = 512, 512
+
+        # Always create error placeholder video (no longer returns None)
+        placeholder_video = create_error_video_placeholder(width=width, height=height)
+        
+        # Create empty image tensor for last frame
+        import torch
+        empty_last_frame = torch.zeros((1, height, width, 3), dtype=torch.float32)
+
+        # 错误情况下的响应信息
+        from datetime import datetime
+        error_response_info = f"=== Seedance Image2Video API 错误信息 ===\n错误: {str(e)}\n时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+
+        return (placeholder_video, empty_last_frame, error_response_info)
+
     def generate(
         self,
         image,
@@ -283,135 +412,228 @@ class SeedanceImage2VideoNode:
         seed: int,
         camera_fixed: bool,
         watermark: bool,
+        priority: str = DEFAULT_PRIORITY,
+        max_parallel: int = 4,
     ):
+        params = {
+            'model': model,
+            'resolution': resolution,
+            'aspect_ratio': aspect_ratio,
+            'duration': duration,  # Already integer from INPUT_TYPES
+            'seed': seed if seed != -1 else None,
+            'camera_fixed': camera_fixed,
+            'watermark': watermark,
+            'priority': priority,
+        }
+        batch = int(image.shape[0]) if hasattr(image, 'shape') and len(image.shape) == 4 else 1
+
+        if batch == 1:
+            try:
+                api = get_api_client(SeedanceImage2VideoAPI)
+                video, last_frame, info = self._generate_one(api, image, prompt, params)
+            except Exception as e:
+                if is_interrupt(e):
+                    raise
+                video, last_frame, info = self._error_outputs(image, e)
+            return ([video], [last_frame], info)
+
+        # One task per batch item, at most max_parallel in flight; outputs keep the batch order
+        from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+        workers = max(1, min(int(max_parallel), batch))
+        print(f"[Seedance Image2Video] Batch of {batch} images: one task each, {workers} at a time")
         try:
-            api = SeedanceImage2VideoAPI()
-            params = {
-                'model': model,
-                'resolution': resolution,
-                'aspect_ratio': aspect_ratio,
-                'duration': duration,  # Already integer from INPUT_TYPES
-                'seed': seed if seed != -1 else None,
-                'camera_fixed': camera_fixed,
-                'watermark': watermark,
-            }
-            
-            # Start generation task
-            print("[Seedance Image2Video] Submitting video generation task...")
-            submit_resp = api.generate_video(image, prompt, params)
-
-            # 增强的API响应信息输出
-            print("=" * 60)
-            print("[Seedance Image2Video] 📤 API提交响应详情:")
-            print(f"  🆔 任务ID: {submit_resp.get('id', 'N/A')}")
-            print(f"  📊 状态: {submit_resp.get('status', 'N/A')}")
-            print(f"  🕐 创建时间: {submit_resp.get('created_at', 'N/A')}")
-            print(f"  📝 完整响应: {submit_resp}")
-            print("=" * 60)
-
-            task_id = submit_resp.get("id")
-            if not task_id:
-                raise ValueError("No task ID returned from API")
-
-            print(f"[Seedance Image2Video] Task ID: {task_id}")
-
-            # Wait for completion
-            print("[Seedance Image2Video] Waiting for video generation to complete...")
-            done = api.wait_for_completion(task_id)
-
-            # 增强的完成响应信息输出
-            print("=" * 60)
-            print("[Seedance Image2Video] ✅ 任务完成响应详情:")
-            print(f"  🆔 任务ID: {done.get('id', 'N/A')}")
-            print(f"  📊 最终状态: {done.get('status', 'N/A')}")
-            print(f"  🕐 更新时间: {done.get('updated_at', 'N/A')}")
-            print(f"  🎬 视频信息: {done.get('result', {})}")
-            print(f"  📝 完整响应: {done}")
-            print("=" * 60)
-            video_url = _extract_video_url_from_result(done)
-            
-            if not video_url:
-                raise ValueError("No video URL found in API response")
-            
-            print(f"[Seedance Image2Video] Video URL: {video_url}")
-            
-            # Extract last frame URL
-            last_frame_url = _extract_last_frame_url_from_result(done)
-            print(f"[Seedance Image2Video] Last frame URL: {last_frame_url}")
-            
-            # Download video and last frame
-            video_obj = download_url_to_video_output(video_url)
-            
-            # Download last frame if available
-            if last_frame_url:
+            api = get_api_client(SeedanceImage2VideoAPI)
+        except Exception as e:
+            video, last_frame, info = self._error_outputs(image, e)
+            return ([video] * batch, [last_frame] * batch, info)
+
+        failed = []
+        interrupted = threading.Event()
+
+        def run(i):
+            item = image[i:i + 1]
+            # One interrupt flag for the whole batch: every in-flight item cancels its remote task
+            with interrupt_scope(interrupted):
                 try:
-                    last_frame_image = download_url_to_image_output(last_frame_url)
-                    print(f"[Seedance Image2Video] Last frame downloaded successfully")
+                    return self._generate_one(api, item, prompt, params, f"[Seedance Image2Video {i + 1}/{batch}]")
                 except Exception as e:
-                    print(f"[Seedance Image2Video] Failed to download last frame: {e}")
-                    # Create empty image tensor as fallback
-                    import torch
-                    last_frame_image = torch.zeros((1, 512, 512, 3), dtype=torch.float32)
-            else:
-                print(f"[Seedance Image2Video] No last frame URL found")
-                # Create empty image tensor as fallback
-                import torch
-                last_frame_image = torch.zeros((1, 512, 512, 3), dtype=torch.float32)
+                    if is_interrupt(e):
+                        raise
+                    failed.append(i)
+                    return self._error_outputs(item, e)
 
-            status = done.get("status", "unknown")
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="seedance-i2v")
+        futures = [pool.submit(run, i) for i in range(batch)]
+        try:
+            # Only an interrupt escapes an item; raise it without waiting for the others
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                future.result()
+            results = [future.result() for future in futures]
+        finally:
+            # On an interrupt, items not started yet are dropped and running ones
+            # finish cancelling their tasks in the background
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        info_lines = [f"=== Seedance Image2Video 批量生成: {batch - len(failed)}/{batch} 成功 ==="]
+        for i, (_, _, info) in enumerate(results, 1):
+            info_lines += [f"--- 第 {i}/{batch} 张 ---", info]
+        return ([r[0] for r in results], [r[1] for r in results], "\n".join(info_lines))
+
+
+class SeedanceImage2VideoChainNode:
+    """
+    Generate a sequence of Image-to-Video segments, each starting from the
+    previous segment's last frame (one prompt per line).
 
-            # 生成响应信息摘要
-            response_info = self._format_response_info(submit_resp, done, video_url, last_frame_url)
+    Segment k+1 is submitted as soon as segment k finishes, using its
+    last_frame_url directly, while segment k's mp4 downloads in the
+    background, so transfers overlap with generation.
+    """
 
-            # 最终结果摘要输出
-            print("=" * 60)
-            print("[Seedance Image2Video] 🎉 生成任务完成摘要:")
-            print(f"  ✅ 状态: {status}")
-            print(f"  🆔 任务ID: {task_id}")
-            print(f"  🎬 视频URL: {video_url}")
-            print(f"  🖼️  最后一帧URL: {last_frame_url}")
-            print(f"  📊 返回值: (VIDEO对象, IMAGE对象, 'response_info')")
-            print("=" * 60)
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "image": ("IMAGE",),
+                "prompts": ("STRING", {"multiline": True, "default": "Generate a video from this image"}),
+                "model": (["seedance-1-0-lite-i2v-250428", "seedance-1-0-pro-250528"], {"default": "seedance-1-0-lite-i2v-250428"}),
+                "resolution": (["480p", "720p", "1080p"], {"default": "720p"}),
+                "aspect_ratio": (["16:9", "4:3", "1:1", "3:4", "9:16", "21:9", "adaptive"], {"default": "adaptive"}),
+                "duration": ("INT", {"default": 5, "min": 3, "max": 12, "step": 1, "display": "slider"}),
+                "seed": ("INT", {"default": 1, "min": -1, "max": 2147483647, "step": 1}),
+                "camera_fixed": ("BOOLEAN", {"default": False}),
+                "watermark": ("BOOLEAN", {"default": True}),
+            },
+            "optional": {
+                "priority": (list(PRIORITY_CLASSES), {"default": DEFAULT_PRIORITY}),
+            },
+        }
 
-            return (video_obj, last_frame_image, response_info)
-            
-        except Exception as e:
-            error_msg = f"Seedance Image2Video generation failed: {str(e)}"
-            print(f"[ERROR] {error_msg}")
+    RETURN_TYPES = ("VIDEO", "IMAGE", "STRING")
+    RETURN_NAMES = ("videos", "last_frame", "response_info")
+    OUTPUT_IS_LIST = (True, False, False)
+    FUNCTION = "generate"
+    CATEGORY = "BytePlus/Seedance Image to Video"
+    OUTPUT_NODE = True
 
-            # Try to extract image dimensions for placeholder
+    def generate(
+        self,
+        image,
+        prompts: str,
+        model: str,
+        resolution: str,
+        aspect_ratio: str,
+        duration: int,
+        seed: int,
+        camera_fixed: bool,
+        watermark: bool,
+        priority: str = DEFAULT_PRIORITY,
+    ):
+        from concurrent.futures import ThreadPoolExecutor
+        from datetime import datetime
+
+        segments = [line.strip() for line in prompts.splitlines() if line.strip()]
+        if not segments:
+            segments = ["Generate a video from this image"]
+
+        params = {
+            'model': model,
+            'resolution': resolution,
+            'aspect_ratio': aspect_ratio,
+            'duration': duration,
+            'seed': seed if seed != -1 else None,
+            'camera_fixed': camera_fixed,
+            'watermark': watermark,
+            'priority': priority,
+        }
+
+        start_time = time.time()
+        info_lines = [f"=== Seedance Image2Video Chain ({len(segments)} 段) ==="]
+        downloads = []  # (index, task_id, last_frame_url, video future)
+        error = None
+        source = image
+
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="seedance-chain")
+        try:
+            api = get_api_client(SeedanceImage2VideoAPI)
+            for i, prompt in enumerate(segments, 1):
+                print(f"[Seedance Chain] Submitting segment {i}/{len(segments)}...")
+                submit_resp = api.generate_video(source, prompt, params)
+                task_id = submit_resp.get("id")
+                if not task_id:
+                    raise ValueError(f"No task ID returned from API for segment {i}")
+
+                done = api.wait_for_completion(task_id, params=params)
+                video_url = _extract_video_url_from_result(done)
+                if not video_url:
+                    raise ValueError(f"No video URL found in API response for segment {i}")
+                last_frame_url = _extract_last_frame_url_from_result(done)
+
+                # The next submit only needs the last frame URL, the mp4 can arrive later
+                downloads.append((i, task_id, last_frame_url, pool.submit(
+                    download_url_to_video_output, video_url, task_id=task_id, session=api.session)))
+                info_lines.append(f"段 {i}: 任务ID {task_id}, 状态 {done.get('status', 'N/A')}, 提示词: {prompt}")
+                print(f"[Seedance Chain] Segment {i} done ({time.time() - start_time:.1f}s), video downloading in background")
+
+                if i < len(segments):
+                    if not last_frame_url:
+                        raise ValueError(f"No last frame URL returned for segment {i}, cannot continue the chain")
+                    source = last_frame_url
+        except Exception as e:
+            if is_interrupt(e):
+                # The running segment was cancelled remotely; finished ones keep downloading
+                pool.shutdown(wait=False)
+                raise
+            error = e
+            print(f"[Seedance Chain] ❌ Chain stopped: {e}")
+
+        videos = []
+        try:
+            for i, task_id, _, future in downloads:
+                try:
+                    videos.append(future.result())
+                except Exception as e:
+                    error = error or e
+                    print(f"[Seedance Chain] Failed to download segment {i} ({task_id}): {e}")
+                    break
+        finally:
+            pool.shutdown(wait=True)
+
+        completed = len(videos)
+        last_frame_image = None
+        if completed and downloads[completed - 1][2]:
+            _, task_id, last_frame_url, _ = downloads[completed - 1]
             try:
-                if hasattr(image, 'shape'):
-                    if len(image.shape) == 4:
-                        # [B, H, W, C]
-                        height, width = image.shape[1], image.shape[2]
-                    else:
-                        # [H, W, C]
-                        height, width = image.shape[0], image.shape[1]
-                else:
-                    # Default dimensions
-                    height, width = 512, 512
-            except:
-                height, width = 512, 512
+                last_frame_image = download_url_to_image_output(last_frame_url, task_id=task_id, session=api.session)
+            except Exception as e:
+                print(f"[Seedance Chain] Failed to download last frame: {e}")
 
-            # Always create error placeholder video (no longer returns None)
-            placeholder_video = create_error_video_placeholder(width=width, height=height)
-            
-            # Create empty image tensor for last frame
+        if last_frame_image is None:
             import torch
-            empty_last_frame = torch.zeros((1, height, width, 3), dtype=torch.float32)
-
-            # 错误情况下的响应信息
-            from datetime import datetime
-            error_response_info = f"=== Seedance Image2Video API 错误信息 ===\n错误: {str(e)}\n时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            try:
+                height, width = image.shape[-3], image.shape[-2]
+            except Exception:
+                height, width = 512, 512
+            last_frame_image = torch.zeros((1, height, width, 3), dtype=torch.float32)
+        if not videos:
+            videos = [create_error_video_placeholder(width=last_frame_image.shape[2], height=last_frame_image.shape[1])]
 
-            return (placeholder_video, empty_last_frame, error_response_info)
+        info_lines.append(f"完成段数: {completed}/{len(segments)}")
+        info_lines.append(f"总耗时: {time.time() - start_time:.1f}s")
+        if error:
+            info_lines.append(f"错误: {str(error)}")
+        info_lines.append(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        return (videos, last_frame_image, "\n".join(info_lines))
 
 
 NODE_CLASS_MAPPINGS = {
     "SeedanceImage2Video": SeedanceImage2VideoNode,
+    "SeedanceImage2VideoChain": SeedanceImage2VideoChainNode,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "SeedanceImage2Video": "ByteDance Image to Video",
+    "SeedanceImage2VideoChain": "ByteDance Image to Video Chain",
 }
\ No newline at end of file
@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+# Output storage for downloaded Seedance videos and frames.
+#
+# Layout under the ComfyUI output directory (or the system temp dir):
+#   <subdir>/index.jsonl                       one JSON line per stored file
+#   <subdir>/<YYYY-MM-DD>/<hh>/<prefix><key><ext>
+# where <key> is the task ID (or a random hex id) and <hh> are the first two
+# hex digits of its SHA-1, so no directory grows without bound. Files are
+# written to a ".part" file first and renamed into place, so readers never
+# see a half-written mp4 and two jobs can never overwrite each other.
+#
+# Retention: every subdir can be capped by total size and by file age through
+# environment variables (0 or unset = unlimited), e.g.
+#   RETENTION_SEEDANCE_VIDEOS_MAX_MB=50000
+#   RETENTION_SEEDANCE_VIDEOS_MAX_AGE_HOURS=168
+#   RETENTION_TEMP_VIDEOS_MAX_AGE_HOURS=24
+#   RETENTION_SWEEP_INTERVAL=600            (seconds, 0 disables the sweeper)
+# Eviction is least-recently-used. Files that are still referenced by a VIDEO
+# object alive in ComfyUI's output cache are pinned and never evicted.
+# Derived files stored next to an output as "<output name>.<anything>" (e.g.
+# decoded frame caches) are evicted on their own and together with it.
+#
+# Every Seedance package has a copy of this module; the index cache, pins and
+# the single sweeper thread live in a shared module object so that all copies
+# see the same state. Rewriting index.jsonl takes an exclusive lock on
+# index.jsonl.lock (appends a shared one), so other processes' lines survive.
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import uuid
+import hashlib
+import tempfile
+import types
+import threading
+import weakref
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:     # Windows: only the in-process lock
+    fcntl = None
+
+try:
+    import folder_paths
+    FOLDER_PATHS_AVAILABLE = True
+except ImportError:
+    FOLDER_PATHS_AVAILABLE = False
+
+INDEX_FILENAME = "index.jsonl"
+INDEX_LOCK_FILENAME = "index.jsonl.lock"
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+# Default retention per subdir: (max MB, max age hours). Generated outputs are
+# kept until configured otherwise; error placeholders are disposable.
+DEFAULT_RETENTION = {
+    "temp_videos": (1024, 24),
+}
+# Never evict files younger than this, they may still be in use by a running job
+RETENTION_MIN_AGE_SECONDS = 600
+# Leftover .part files older than this come from crashed downloads
+STALE_PART_SECONDS = 3600
+
+
+def _hub():
+    """Storage state shared by every node package's copy of this module."""
+    hub = sys.modules.get("_byteplus_storage")
+    if hub is None:
+        new = types.ModuleType("_byteplus_storage")
+        new.lock = threading.Lock()         # known_subdirs, sweeper
+        new.known_subdirs = {}              # subdir name -> absolute root, for every subdir used in this process
+        new.sweeper = None                  # retention thread, False when disabled
+        new.index_lock = threading.Lock()
+        new.index_cache = {}                # subdir root -> {key: entry}, loaded lazily from index.jsonl
+        new.pin_lock = threading.Lock()
+        new.pinned = {}                     # absolute path -> reference count of live objects using the file
+        hub = sys.modules.setdefault("_byteplus_storage", new)
+    return hub
+
+
+def _ensure_output_dir(default_subdir: str = "seedance_videos") -> str:
+    if FOLDER_PATHS_AVAILABLE:
+        base = folder_paths.get_output_directory()
+        out = os.path.join(base, default_subdir)
+    else:
+        out = os.path.join(tempfile.gettempdir(), default_subdir)
+    os.makedirs(out, exist_ok=True)
+    hub = _hub()
+    if default_subdir not in hub.known_subdirs:
+        with hub.lock:
+            hub.known_subdirs.setdefault(default_subdir, out)
+        start_retention_sweeper()
+    return out
+
+
+def _safe_key(key: str) -> str:
+    return _UNSAFE_CHARS.sub("_", str(key))[:128]
+
+
+def make_output_path(subdir: str, key: str | None, filename_prefix: str, ext: str) -> tuple[str, str]:
+    """
+    Return (key, absolute path) for a new output file, creating the shard directory.
+    A random key is generated when no task ID is available.
+    """
+    key = _safe_key(key) if key else uuid.uuid4().hex
+    root = _ensure_output_dir(subdir)
+    shard = hashlib.sha1(key.encode("utf-8")).hexdigest()[:2]
+    out_dir = os.path.join(root, time.strftime("%Y-%m-%d"), shard)
+    os.makedirs(out_dir, exist_ok=True)
+    return key, os.path.join(out_dir, f"{filename_prefix}{key}{ext}")
+
+
+def atomic_write_chunks(path: str, chunks) -> int:
+    """
+    Write an iterable of bytes chunks to path via a temporary file and rename.
+    Returns the number of bytes written. The partial file is removed on error.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+                    size += len(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return size
+
+
+def atomic_tee_chunks(path: str, chunks):
+    """
+    Pass chunks through unchanged while writing them to path (via a .part
+    file renamed once the iterable is exhausted). Lets a consumer such as an
+    image decoder read a download while it is being saved, in one pass.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def _index_file_lock(root: str, exclusive: bool = False):
+    """
+    Lock index.jsonl against other processes: shared for appends, exclusive
+    for rewriting it. The lock is on a separate file because a rewrite
+    replaces index.jsonl.
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(os.path.join(root, INDEX_LOCK_FILENAME), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+    finally:
+        os.close(fd)    # releases the lock
+
+
+def _read_index_file(index_path: str) -> tuple[int, dict]:
+    """(number of lines, {key: live entry}) of an index file"""
+    index = {}
+    lines = 0
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("removed"):
+                    index.pop(entry.get("key"), None)
+                else:
+                    index[entry.get("key")] = entry
+    return lines, index
+
+
+def _load_index(root: str) -> dict:
+    """The cached index of root (hub index_lock held)."""
+    cache = _hub().index_cache
+    index = cache.get(root)
+    if index is None:
+        _, index = _read_index_file(os.path.join(root, INDEX_FILENAME))
+        cache[root] = index
+    return index
+
+
+def _append_index(root: str, entry: dict) -> None:
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    # A single O_APPEND write keeps lines intact even with several processes
+    with _index_file_lock(root):
+        fd = os.open(os.path.join(root, INDEX_FILENAME), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+
+def record_output(subdir: str, key: str, path: str, **extra) -> dict:
+    """Add a stored file to the subdir index and return the index entry."""
+    root = _ensure_output_dir(subdir)
+    entry = {
+        "key": key,
+        "path": os.path.relpath(path, root),
+        "size": os.path.getsize(path),
+        "created": time.time(),
+    }
+    entry.update(extra)
+    with _hub().index_lock:
+        _load_index(root)[key] = entry
+        _append_index(root, entry)
+    return entry
+
+
+def find_output_entry(subdir: str, key: str) -> dict | None:
+    """Return the index entry for key in subdir with an absolute "path", or None if unknown or deleted."""
+    root = _ensure_output_dir(subdir)
+    with _hub().index_lock:
+        entry = _load_index(root).get(_safe_key(key))
+    if not entry:
+        return None
+    path = os.path.join(root, entry["path"])
+    return dict(entry, path=path) if os.path.exists(path) else None
+
+
+def find_output(subdir: str, key: str) -> str | None:
+    """Return the absolute path stored for key in subdir, or None if unknown or deleted."""
+    entry = find_output_entry(subdir, key)
+    return entry["path"] if entry else None
+
+
+def subdir_for_path(path: str) -> str | None:
+    """Return the known output subdir whose tree contains path, if any."""
+    path = os.path.abspath(path)
+    for subdir, root in list(_hub().known_subdirs.items()):
+        if path.startswith(os.path.join(os.path.abspath(root), "")):
+            return subdir
+    return None
+
+
+def store_download(
+    url: str,
+    subdir: str,
+    key: str | None,
+    filename_prefix: str,
+    ext: str,
+    timeout: int | None = 300,
+    session=None,
+) -> str:
+    """
+    Stream url into the sharded store and return the final path.
+    If key was already stored and the file still exists, the download is skipped.
+    """
+    if key:
+        existing = find_output(subdir, key)
+        if existing:
+            print(f"[Seedance] Reusing stored output for {key}: {existing}")
+            return existing
+
+    import requests
+
+    key, path = make_output_path(subdir, key, filename_prefix, ext)
+    http = session or requests
+    with http.get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        atomic_write_chunks(path, r.iter_content(chunk_size=1 << 16))
+
+    record_output(subdir, key, path, url=url.split("?", 1)[0])
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Retention
+# ---------------------------------------------------------------------------
+
+def pin_output(path: str, owner=None) -> None:
+    """
+    Protect path from eviction. With an owner object the pin is released
+    automatically when the owner is garbage collected (e.g. when ComfyUI drops
+    the cached node output holding the VIDEO object); otherwise call unpin_output().
+    """
+    path = os.path.abspath(path)
+    hub = _hub()
+    with hub.pin_lock:
+        hub.pinned[path] = hub.pinned.get(path, 0) + 1
+    if owner is not None:
+        try:
+            weakref.finalize(owner, unpin_output, path)
+        except TypeError:
+            # Not weak-referenceable; fall back to the minimum-age grace period
+            unpin_output(path)
+
+
+def unpin_output(path: str) -> None:
+    path = os.path.abspath(path)
+    hub = _hub()
+    with hub.pin_lock:
+        count = hub.pinned.get(path, 0) - 1
+        if count > 0:
+            hub.pinned[path] = count
+        else:
+            hub.pinned.pop(path, None)
+
+
+def is_pinned(path: str) -> bool:
+    hub = _hub()
+    with hub.pin_lock:
+        return os.path.abspath(path) in hub.pinned
+
+
+def get_retention_policy(subdir: str) -> tuple[float, float]:
+    """Return (max_bytes, max_age_seconds) for subdir; 0 means unlimited."""
+    default_mb, default_hours = DEFAULT_RETENTION.get(subdir, (0, 0))
+    name = _UNSAFE_CHARS.sub("_", subdir).upper()
+    try:
+        max_mb = float(os.getenv(f"RETENTION_{name}_MAX_MB", default_mb))
+        max_hours = float(os.getenv(f"RETENTION_{name}_MAX_AGE_HOURS", default_hours))
+    except ValueError:
+        print(f"[Seedance] Invalid retention settings for {subdir}, using defaults")
+        max_mb, max_hours = default_mb, default_hours
+    return max_mb * 1024 * 1024, max_hours * 3600
+
+
+def _remove_index_entries(root: str, rel_paths: set) -> None:
+    with _hub().index_lock:
+        index = _load_index(root)
+        for key, entry in list(index.items()):
+            if entry.get("path") in rel_paths:
+                del index[key]
+                _append_index(root, {"key": key, "removed": True, "time": time.time()})
+
+
+def _compact_index(root: str) -> None:
+    """Rewrite index.jsonl with only the live entries once it is mostly tombstones."""
+    index_path = os.path.join(root, INDEX_FILENAME)
+    hub = _hub()
+    with hub.index_lock, _index_file_lock(root, exclusive=True):
+        # From the file, not the cache: other processes append to it too
+        try:
+            lines, index = _read_index_file(index_path)
+        except OSError:
+            return
+        if lines < 1000 or lines < 2 * len(index):
+            return
+        body = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in index.values())
+        atomic_write_chunks(index_path, [body.encode("utf-8")])
+        hub.index_cache[root] = index
+
+
+def _prune_empty_dirs(root: str) -> None:
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if dirpath != root and not dirnames and not filenames:
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+
+
+def sweep_outputs(subdir: str, now: float | None = None) -> dict:
+    """
+    Apply the retention policy to one subdir and return eviction stats.
+    Age-expired files go first, then least-recently-used files until the
+    subdir fits in its size budget. Pinned and very young files are skipped.
+    """
+    now = now or time.time()
+    max_bytes, max_age = get_retention_policy(subdir)
+    root = _hub().known_subdirs.get(subdir) or _ensure_output_dir(subdir)
+
+    files = []
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if dirpath == root and name in (INDEX_FILENAME, INDEX_LOCK_FILENAME):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith(".part"):
+                if now - st.st_mtime > STALE_PART_SECONDS:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                continue
+            last_used = max(st.st_atime, st.st_mtime)
+            files.append((last_used, st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    files.sort()
+    removed, freed = [], 0
+    for last_used, mtime, size, path in files:
+        expired = max_age and now - mtime > max_age
+        over_budget = max_bytes and total - freed > max_bytes
+        if not (expired or over_budget):
+            continue
+        if now - mtime < RETENTION_MIN_AGE_SECONDS or is_pinned(path):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed.append(path)
+        freed += size
+        # Derived files go together with their source output
+        for sidecar in glob.glob(glob.escape(path) + ".*"):
+            if sidecar.endswith(".part") or is_pinned(sidecar):
+                continue
+            try:
+                sidecar_size = os.path.getsize(sidecar)
+                os.remove(sidecar)
+            except OSError:
+                continue
+            removed.append(sidecar)
+            freed += sidecar_size
+
+    if removed:
+        _remove_index_entries(root, {os.path.relpath(p, root) for p in removed})
+        _prune_empty_dirs(root)
+        print(f"[Seedance] Retention: removed {len(removed)} file(s), {freed / 1048576:.1f} MB from {subdir}")
+    _compact_index(root)
+    return {"subdir": subdir, "removed": len(removed), "freed_bytes": freed, "remaining_bytes": total - freed}
+
+
+def sweep_all_outputs() -> list:
+    """Run sweep_outputs() for every subdir this process has written to."""
+    stats = []
+    for subdir in list(_hub().known_subdirs):
+        try:
+            stats.append(sweep_outputs(subdir))
+        except Exception as e:
+            print(f"[Seedance] Retention sweep of {subdir} failed: {e}")
+    return stats
+
+
+def start_retention_sweeper() -> None:
+    """Start the background sweeper thread once per process, for all packages (no-op if disabled)."""
+    hub = _hub()
+    with hub.lock:
+        if hub.sweeper is not None:
+            return
+        try:
+            interval = float(os.getenv("RETENTION_SWEEP_INTERVAL", "600"))
+        except ValueError:
+            interval = 600.0
+        if interval <= 0:
+            hub.sweeper = False
+            return
+
+        def _run():
+            while True:
+                time.sleep(interval)
+                sweep_all_outputs()
+
+        thread = threading.Thread(target=_run, name="seedance-retention", daemon=True)
+        hub.sweeper = thread
+        thread.start()
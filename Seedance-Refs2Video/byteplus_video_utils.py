@@ -2,36 +2,31 @@
 # Utility helpers to convert a remote video URL into a REAL Comfy VIDEO object.
 # Compatible with ComfyUI 0.3.59 and 0.4.x
 
+# Heavy dependencies (requests, numpy, PIL, torch, cv2) are imported inside the
+# functions that need them so that loading the node package stays cheap.
+# This file is shared verbatim by all Seedance node packages.
+
 import os
 import time
-import tempfile
-import requests
-import numpy as np
-from PIL import Image
-import torch
-import io
-
-try:
-    import folder_paths
-    FOLDER_PATHS_AVAILABLE = True
-except ImportError:
-    FOLDER_PATHS_AVAILABLE = False
-
-try:
-    import cv2
-    CV2_AVAILABLE = True
-except ImportError:
-    CV2_AVAILABLE = False
+import uuid
+import shutil
+import hashlib
+import threading
 
-
-def _ensure_output_dir(default_subdir: str = "seedance_videos") -> str:
-    if FOLDER_PATHS_AVAILABLE:
-        base = folder_paths.get_output_directory()
-        out = os.path.join(base, default_subdir)
-    else:
-        out = os.path.join(tempfile.gettempdir(), default_subdir)
-    os.makedirs(out, exist_ok=True)
-    return out
+from .byteplus_storage import (
+    _ensure_output_dir,
+    atomic_tee_chunks,
+    find_output,
+    find_output_entry,
+    make_output_path,
+    pin_output,
+    record_output,
+    store_download,
+    subdir_for_path,
+    unpin_output,
+)
+from .byteplus_image_utils import decode_image_stream, iter_url_chunks, pil_to_tensor
+from .byteplus_coordinator import get_coordinator
 
 
 def _make_comfy_video_from_path(video_path: str):
@@ -99,6 +94,148 @@ def _make_comfy_video_from_path(video_path: str):
     )
 
 
+def download_url_to_video_output(
+    video_url: str,
+    timeout: int | None = 300,
+    subdir: str = "seedance_videos",
+    filename_prefix: str = "seedance_",
+    task_id: str | None = None,
+    session=None,
+):
+    """
+    Download a remote video URL to mp4, then return a REAL Comfy VIDEO object.
+    The file is named after task_id (or a random id) in a date/hash sharded
+    directory, see byteplus_storage, and passed through postprocess_video().
+    """
+    # With a coordinator, reuse a copy another host already stored on the shared disk
+    coordinator = get_coordinator() if task_id else None
+    shared_key = f"{subdir}/{task_id}"
+    video_path = coordinator.shared_output(shared_key) if coordinator else None
+    if video_path:
+        print(f"[Seedance] Reusing shared output for {task_id}: {video_path}")
+    else:
+        video_path = store_download(video_url, subdir, task_id, filename_prefix, ".mp4", timeout=timeout, session=session)
+        if coordinator:
+            coordinator.publish_output(shared_key, video_path)
+
+    print(f"[Seedance] Video saved to: {video_path}")
+    postprocess_video(video_path)
+    video = _make_comfy_video_from_path(video_path)
+    # Keep the file out of retention sweeps while ComfyUI still holds the VIDEO object
+    pin_output(video_path, owner=video)
+    return video
+
+
+# Pre-rendered placeholder clips, keyed by (width, height, fps, duration, text).
+# Error paths reuse these files instead of encoding black frames on every failure.
+_PLACEHOLDER_LOCK = threading.Lock()
+_PLACEHOLDER_CLIPS = {}
+
+
+def _render_placeholder_clip(path: str, width: int, height: int, fps: int, frame_count: int, text: str | None):
+    import cv2
+    import numpy as np
+
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    if text:
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        text_size = cv2.getTextSize(text, font, 1, 2)[0]
+        text_x = (width - text_size[0]) // 2
+        text_y = (height + text_size[1]) // 2
+        cv2.putText(frame, text, (text_x, text_y), font, 1, (255, 255, 255), 2)
+
+    # cv2 picks the container from the extension, so the temp name must end in .mp4
+    tmp_path = f"{path[:-4]}.{uuid.uuid4().hex[:8]}.part.mp4"
+    out = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not out.isOpened():
+        raise RuntimeError(f"cv2.VideoWriter could not open {tmp_path}")
+    try:
+        for _ in range(max(frame_count, 1)):
+            out.write(frame)
+    finally:
+        out.release()
+    os.replace(tmp_path, path)
+
+
+def get_placeholder_clip(width: int = 512, height: int = 512, fps: int = 24,
+                         duration: float = 1.0, text: str | None = None) -> str:
+    """
+    Return the path of a cached black placeholder mp4, rendering it on first use.
+    Clips live in temp_videos/placeholders and are shared by all failures with
+    the same (width, height, fps, duration, text).
+    """
+    width, height, fps = int(width), int(height), int(fps)
+    key = (width, height, fps, float(duration), text or "")
+    path = _PLACEHOLDER_CLIPS.get(key)
+    if path and os.path.exists(path):
+        return path
+
+    with _PLACEHOLDER_LOCK:
+        path = _PLACEHOLDER_CLIPS.get(key)
+        if path and os.path.exists(path):
+            return path
+        name = f"placeholder_{width}x{height}_{fps}fps_{float(duration):g}s"
+        if text:
+            name += "_" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:8]
+        out_dir = os.path.join(_ensure_output_dir("temp_videos"), "placeholders")
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"{name}.mp4")
+        # Another worker process may already have rendered it
+        if not os.path.exists(path):
+            _render_placeholder_clip(path, width, height, fps, int(duration * fps), text)
+            print(f"[Seedance] Rendered placeholder clip: {path}")
+        _PLACEHOLDER_CLIPS[key] = path
+        return path
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """Hardlink src to dst, falling back to a copy across filesystems."""
+    try:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def create_empty_video_object(width: int = 512, height: int = 512, duration_seconds: float = 1.0, fps: int = 24):
+    """
+    Create an empty/dummy video object for error handling.
+    Returns a video object that can be used when API calls fail.
+    """
+    try:
+        # Reuse the cached black clip for this size instead of encoding a new one
+        clip_path = get_placeholder_clip(width, height, fps, duration_seconds)
+        video = _make_comfy_video_from_path(clip_path)
+        pin_output(clip_path, owner=video)
+        return video
+
+    except Exception as e:
+        print(f"[Seedance] Warning: Failed to create empty video object: {e}")
+        # Return a simple wrapper as last resort
+        class EmptyVideoWrapper:
+            def __init__(self):
+                self.width = width
+                self.height = height
+
+            def get_dimensions(self):
+                return self.width, self.height
+
+            def save_to(self, output_path, format=None, codec=None, metadata=None):
+                # Copy a minimal cached clip
+                try:
+                    _link_or_copy(get_placeholder_clip(self.width, self.height, 1, 1.0), output_path)
+                    return output_path
+                except Exception:
+                    # If even this fails, just create an empty file
+                    with open(output_path, 'w') as f:
+                        f.write("")
+                    return output_path
+
+        return EmptyVideoWrapper()
+
+
+
 def create_error_video_placeholder(width=512, height=512, duration=1.0, fps=30, subdir="seedance_videos"):
     """
     Create a simple black video as a placeholder when generation fails.
@@ -119,30 +256,14 @@ def create_error_video_placeholder(width=512, height=512, duration=1.0, fps=30,
 
         def save_to(self, output_path, format=None, codec=None, metadata=None):
             """Minimal save implementation for compatibility"""
-            # If cv2 is available, create a real video file
-            if CV2_AVAILABLE:
-                try:
-                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                    out = cv2.VideoWriter(output_path, fourcc, self.fps, (self.width, self.height))
-
-                    # Create black frames with error text
-                    black_frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-
-                    # Add text to indicate error
-                    text = "Generation Failed"
-                    font = cv2.FONT_HERSHEY_SIMPLEX
-                    text_size = cv2.getTextSize(text, font, 1, 2)[0]
-                    text_x = (self.width - text_size[0]) // 2
-                    text_y = (self.height + text_size[1]) // 2
-                    cv2.putText(black_frame, text, (text_x, text_y), font, 1, (255, 255, 255), 2)
-
-                    for _ in range(self.frame_count):
-                        out.write(black_frame)
-
-                    out.release()
-                    print(f"[Seedance] Error video saved to: {output_path}")
-                except Exception as e:
-                    print(f"[Seedance] Failed to create error video: {e}")
+            # Link the cached pre-rendered clip instead of re-encoding frames on every save
+            try:
+                clip_path = get_placeholder_clip(self.width, self.height, self.fps, self.duration,
+                                                 text="Generation Failed")
+                _link_or_copy(clip_path, output_path)
+                print(f"[Seedance] Error video saved to: {output_path}")
+            except Exception as e:
+                print(f"[Seedance] Failed to create error video: {e}")
 
             return output_path
 
@@ -152,57 +273,827 @@ def create_error_video_placeholder(width=512, height=512, duration=1.0, fps=30,
     return MinimalVideoPlaceholder()
 
 
-def download_url_to_video_output(
-    video_url: str,
+def download_url_to_image_output(
+    image_url: str,
     timeout: int | None = 300,
-    subdir: str = "seedance_videos",
-    filename_prefix: str = "seedance_",
+    subdir: str = "seedance_images",
+    filename_prefix: str = "seedance_frame_",
+    task_id: str | None = None,
+    session=None,
+    save: bool = False,
+    dtype: str = "float32",
 ):
     """
-    Download a remote video URL to mp4, then return a REAL Comfy VIDEO object.
+    Download a remote image URL and return a ComfyUI IMAGE tensor.
+    ComfyUI IMAGE format: torch.Tensor with shape [batch, height, width, channels]
+    Values should be in range [0, 1] and dtype float32 (see byteplus_image_utils
+    for the float16 / uint8 variants).
+
+    The HTTP body is streamed straight into the decoder; nothing touches the
+    disk unless save=True, in which case the bytes are written to the sharded
+    store while they are being decoded.
     """
-    out_dir = _ensure_output_dir(subdir)
-    ts = int(time.time())
-    video_path = os.path.join(out_dir, f"{filename_prefix}{ts}.mp4")
+    existing = find_output(subdir, task_id) if save and task_id else None
+    if existing:
+        with open(existing, "rb") as f:
+            image = decode_image_stream(iter(lambda: f.read(1 << 16), b""))
+    elif save:
+        # Keep the original extension when the URL has a known one
+        ext = os.path.splitext(image_url.split("?", 1)[0])[1].lower()
+        if ext not in (".jpg", ".jpeg", ".png", ".webp"):
+            ext = ".jpg"
+        key, image_path = make_output_path(subdir, task_id, filename_prefix, ext)
+        chunks = iter_url_chunks(image_url, session=session, timeout=timeout)
+        image = decode_image_stream(atomic_tee_chunks(image_path, chunks))
+        record_output(subdir, key, image_path, url=image_url.split("?", 1)[0])
+        print(f"[Seedance] Image saved to: {image_path}")
+    else:
+        image = decode_image_stream(iter_url_chunks(image_url, session=session, timeout=timeout))
 
-    with requests.get(video_url, stream=True, timeout=timeout) as r:
-        r.raise_for_status()
-        with open(video_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+    image_tensor = pil_to_tensor(image, dtype=dtype).unsqueeze(0)  # [1, H, W, 3]
+    print(f"[Seedance] Image downloaded: {tuple(image_tensor.shape)}")
+    return image_tensor
 
-    print(f"[Seedance] Video saved to: {video_path}")
-    return _make_comfy_video_from_path(video_path)
+
+def video_source(video):
+    """
+    Return something the decoders can open for a VIDEO object: a file path when
+    the video is backed by a file, otherwise a file-like object. Plain path
+    strings and file objects pass through unchanged.
+    """
+    if isinstance(video, (str, os.PathLike)):
+        return os.fspath(video)
+    if hasattr(video, "read"):
+        return video
+    get_source = getattr(video, "get_stream_source", None)
+    if callable(get_source):
+        source = get_source()
+        if source is not None:
+            return source
+    path = getattr(video, "path", None)
+    if path:
+        return path
+    # Last resort: let the object write itself out (placeholders, custom wrappers)
+    out_dir = _ensure_output_dir("temp_videos")
+    tmp_path = os.path.join(out_dir, f"decode_{uuid.uuid4().hex[:8]}.mp4")
+    video.save_to(tmp_path)
+    return tmp_path
+
+
+def _target_size(src_width: int, src_height: int, width: int = 0, height: int = 0) -> tuple[int, int]:
+    """Resolve the output size; a 0 side keeps the aspect ratio, both 0 keep the source size."""
+    if width and height:
+        return int(width), int(height)
+    if width:
+        return int(width), max(1, round(src_height * width / src_width))
+    if height:
+        return max(1, round(src_width * height / src_height)), int(height)
+    return src_width, src_height
+
+
+def _iter_frames_av(source, stride: int, width: int, height: int, info: dict):
+    import av
+
+    container = av.open(source)
+    try:
+        stream = container.streams.video[0]
+        # Let FFmpeg decode on all cores (frame + slice threading)
+        stream.thread_type = "AUTO"
+        ctx = stream.codec_context
+        info["fps"] = float(stream.average_rate or stream.guessed_rate or 0) or 24.0
+        info["size"] = _target_size(ctx.width, ctx.height, width, height)
+        total = stream.frames
+        if not total:
+            # No frame count in the header: count packets (no decoding) and rewind
+            total = sum(1 for packet in container.demux(stream) if packet.size)
+            container.seek(0)
+        info["total"] = total
+        out_w, out_h = info["size"]
+        for i, frame in enumerate(container.decode(stream)):
+            if i % stride == 0:
+                # swscale does the resize and the YUV->RGB conversion in one step
+                yield frame.to_ndarray(width=out_w, height=out_h, format="rgb24")
+    finally:
+        container.close()
+
+
+def _iter_frames_cv2(path: str, stride: int, width: int, height: int, info: dict):
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"cv2 could not open video: {path}")
+    try:
+        if hasattr(cv2, "CAP_PROP_N_THREADS"):
+            cap.set(cv2.CAP_PROP_N_THREADS, os.cpu_count() or 1)
+        src_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        src_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        info["fps"] = float(cap.get(cv2.CAP_PROP_FPS) or 0) or 24.0
+        info["size"] = _target_size(src_w, src_h, width, height)
+        info["total"] = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        out_w, out_h = info["size"]
+        i = 0
+        while True:
+            # grab() decodes without the BGR conversion, which skipped frames don't need
+            if not cap.grab():
+                break
+            if i % stride == 0:
+                ok, bgr = cap.retrieve()
+                if not ok:
+                    break
+                if (bgr.shape[1], bgr.shape[0]) != (out_w, out_h):
+                    bgr = cv2.resize(bgr, (out_w, out_h), interpolation=cv2.INTER_AREA)
+                yield cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+            i += 1
+    finally:
+        cap.release()
 
 
-def download_url_to_image_output(image_url: str, timeout: int = 30):
+def iter_video_frames(source, stride: int = 1, width: int = 0, height: int = 0, info: dict | None = None):
     """
-    Download a remote image URL and return a ComfyUI IMAGE tensor.
-    Returns tensor with shape [1, H, W, 3] and values in [0, 1].
-    """
-    try:
-        # Download the image
-        response = requests.get(image_url, timeout=timeout)
-        response.raise_for_status()
-        
-        # Load image with PIL
-        image = Image.open(io.BytesIO(response.content))
-        
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert to numpy array
-        image_np = np.array(image, dtype=np.float32) / 255.0
-        
-        # Convert to torch tensor and add batch dimension
-        image_tensor = torch.from_numpy(image_np).unsqueeze(0)  # [1, H, W, 3]
-        
-        print(f"[Seedance] Image downloaded: {image_tensor.shape}")
-        return image_tensor
-        
+    Yield decoded uint8 RGB frames [H, W, 3] of a video one at a time.
+
+    Uses PyAV (bundled with ComfyUI) with multithreaded decoding when it is
+    available, OpenCV otherwise. Only every stride-th frame is converted and
+    frames are resized during conversion. info, if given, is filled with
+    fps, output size and source frame count once decoding starts.
+    """
+    stride = max(1, int(stride))
+    info = {} if info is None else info
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        av = None
+    if av is not None:
+        return _iter_frames_av(source, stride, width, height, info)
+    if not isinstance(source, str):
+        # cv2 can only read from a path
+        tmp_path = os.path.join(_ensure_output_dir("temp_videos"), f"decode_{uuid.uuid4().hex[:8]}.mp4")
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(source, f)
+        source = tmp_path
+    return _iter_frames_cv2(source, stride, width, height, info)
+
+
+def _stream_to_tensor(frames, info: dict, stride: int, max_frames: int, chunk_size: int, dtype: str):
+    """
+    Convert frames from iter_video_frames() into one tensor. The output is
+    allocated once from the frame count and filled chunk_size frames at a time
+    from a small uint8 staging buffer.
+    """
+    import math
+    import numpy as np
+    import torch
+    from .byteplus_image_utils import _torch_dtype
+
+    out = staging = None
+    parts = []  # only used when the header under-reports the frame count
+    count = staged = 0
+    filled = 0  # rows of out written; count - filled frames are in parts
+    scale = None
+
+    def flush():
+        nonlocal count, filled, staged
+        if not staged:
+            return
+        # The rows that still fit go into out, the rest into an overflow part
+        fit = min(staged, out.shape[0] - filled)
+        copies = [(out[filled:filled + fit], staging[:fit])] if fit else []
+        if fit < staged:
+            extra = torch.empty((staged - fit,) + tuple(out.shape[1:]), dtype=out.dtype)
+            parts.append(extra)
+            copies.append((extra, staging[fit:staged]))
+        for target, source in copies:
+            if scale is None:
+                np.copyto(target.numpy(), source)
+            else:
+                np.multiply(source, scale, out=target.numpy(), casting="unsafe")
+        filled += fit
+        count += staged
+        staged = 0
+
+    try:
+        for rgb in frames:
+            if out is None:
+                out_w, out_h = info["size"]
+                expected = math.ceil(info["total"] / stride) if info.get("total") else chunk_size
+                if max_frames:
+                    expected = min(expected, int(max_frames))
+                out = torch.empty((expected, out_h, out_w, 3), dtype=_torch_dtype(dtype))
+                staging = np.empty((chunk_size, out_h, out_w, 3), dtype=np.uint8)
+                if out.dtype != torch.uint8:
+                    scale = out.numpy().dtype.type(1.0 / 255.0)
+            staging[staged] = rgb
+            staged += 1
+            if staged == chunk_size:
+                flush()
+            if max_frames and count + staged >= max_frames:
+                break
+        if out is None:
+            raise RuntimeError("Video contains no decodable frames")
+        flush()
+    finally:
+        close = getattr(frames, "close", None)
+        if close:
+            close()
+
+    return out[:filled] if not parts else torch.cat([out] + parts)
+
+
+def _array_to_tensor(frames, chunk_size: int, dtype: str):
+    """Convert a uint8 [N, H, W, 3] array (e.g. a frame cache memmap) into a tensor chunk by chunk."""
+    import numpy as np
+    import torch
+    from .byteplus_image_utils import _torch_dtype
+
+    out = torch.empty(frames.shape, dtype=_torch_dtype(dtype))
+    target = out.numpy()
+    scale = target.dtype.type(1.0 / 255.0)
+    for i in range(0, frames.shape[0], chunk_size):
+        np.multiply(frames[i:i + chunk_size], scale, out=target[i:i + chunk_size], casting="unsafe")
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Decoded frame cache
+# ---------------------------------------------------------------------------
+# Decoded uint8 frames are kept as raw "<video>.<key>.frames" files next to
+# stored videos (or in FRAME_CACHE_SUBDIR for videos from elsewhere) and
+# registered in the subdir index with their shape and fps. Later requests map
+# the file instead of decoding again. The key covers the video content hash
+# and the decode parameters; retention evicts caches with their video.
+
+FRAME_CACHE_SUBDIR = "seedance_frame_cache"
+
+_DIGEST_LOCK = threading.Lock()
+# (path, size, mtime_ns) -> sha1 hex digest
+_FILE_DIGESTS = {}
+
+
+def file_digest(path: str) -> str:
+    """SHA-1 of a file's content, memoized per (path, size, mtime)."""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    memo_key = (path, st.st_size, st.st_mtime_ns)
+    with _DIGEST_LOCK:
+        digest = _FILE_DIGESTS.get(memo_key)
+    if digest:
+        return digest
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _DIGEST_LOCK:
+        _FILE_DIGESTS[memo_key] = digest
+    return digest
+
+
+def _open_frame_cache(entry: dict):
+    import numpy as np
+
+    path = entry["path"]
+    # Copy-on-write mapping: writable for torch.from_numpy, never written back
+    frames = np.memmap(path, dtype=np.uint8, mode="c", shape=tuple(entry["shape"]))
+    # Count this as a use for LRU eviction, mmap reads may not update atime
+    os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+    return frames
+
+
+def cached_video_frames(video_path: str, stride: int = 1, max_frames: int = 0, width: int = 0, height: int = 0):
+    """
+    Return (frames, fps) where frames is a uint8 [N, H, W, 3] copy-on-write
+    np.memmap of the decoded video (writes never reach the file). The first call decodes straight into the
+    cache file; later calls with the same video content and parameters only
+    map it.
+    """
+    import math
+    import numpy as np
+
+    stride = max(1, int(stride))
+    max_frames = int(max_frames)
+    cache_key = f"frames_{file_digest(video_path)[:16]}_s{stride}_n{max_frames}_{int(width)}x{int(height)}"
+    subdir = subdir_for_path(video_path) or FRAME_CACHE_SUBDIR
+
+    entry = find_output_entry(subdir, cache_key)
+    if entry:
+        try:
+            frames = _open_frame_cache(entry)
+            print(f"[Seedance] Using cached frames: {entry['path']}")
+            return frames, entry["fps"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[Seedance] Frame cache unusable, decoding again: {e}")
+
+    if subdir == FRAME_CACHE_SUBDIR:
+        _, path = make_output_path(subdir, cache_key, "", ".frames")
+    else:
+        path = f"{video_path}.{cache_key}.frames"
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+
+    info = {}
+    frames = iter_video_frames(video_path, stride, width, height, info)
+    mm = None
+    count = 0
+    try:
+        for rgb in frames:
+            if mm is None or count == mm.shape[0]:
+                if mm is None:
+                    out_w, out_h = info["size"]
+                    capacity = math.ceil(info["total"] / stride) if info.get("total") else 16
+                    if max_frames:
+                        capacity = min(capacity, max_frames)
+                else:
+                    # Header under-reported the frame count: grow the file in place
+                    mm.flush()
+                    del mm
+                    capacity = count + max(16, count // 2)
+                with open(tmp_path, "ab") as f:
+                    f.truncate(capacity * out_h * out_w * 3)
+                mm = np.memmap(tmp_path, dtype=np.uint8, mode="r+", shape=(capacity, out_h, out_w, 3))
+            mm[count] = rgb
+            count += 1
+            if max_frames and count >= max_frames:
+                break
+        if mm is None:
+            raise RuntimeError("Video contains no decodable frames")
+        mm.flush()
+        del mm
+        os.truncate(tmp_path, count * out_h * out_w * 3)
+        os.replace(tmp_path, path)
+    finally:
+        frames.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    fps = info.get("fps", 24.0) / stride
+    entry = record_output(subdir, cache_key, path, shape=[count, out_h, out_w, 3], fps=fps,
+                          source=os.path.basename(video_path))
+    print(f"[Seedance] Cached {count} decoded frames: {path}")
+    return _open_frame_cache(dict(entry, path=path)), fps
+
+
+def decode_video_frames(source, stride: int = 1, max_frames: int = 0, width: int = 0, height: int = 0,
+                        chunk_size: int = 16, dtype: str = "float32", cache: bool = False):
+    """
+    Decode a video into a ComfyUI IMAGE batch [N, H, W, 3] with bounded memory.
+
+    Frames are converted into the output tensor chunk_size at a time, so peak
+    memory is the output itself plus one chunk, instead of a list of float
+    frames plus a stacked copy. stride, max_frames and width/height shrink the
+    output before anything is allocated.
+
+    With cache=True (file-backed videos only) frames come from the decoded
+    frame cache, see cached_video_frames(); dtype="uint8" then returns a
+    zero-copy view of the cache file.
+    Returns (frames, fps) where fps accounts for the stride.
+    """
+    stride = max(1, int(stride))
+    chunk_size = max(1, int(chunk_size))
+    source = video_source(source)
+
+    if cache and isinstance(source, str):
+        cached, fps = cached_video_frames(source, stride, max_frames, width, height)
+        if dtype == "uint8":
+            import torch
+            result = torch.from_numpy(cached)
+            # The mapping stays valid while the tensor is alive, keep the file too
+            pin_output(cached.filename, owner=result)
+        else:
+            result = _array_to_tensor(cached, chunk_size, dtype)
+    else:
+        info = {}
+        frames = iter_video_frames(source, stride, width, height, info)
+        result = _stream_to_tensor(frames, info, stride, max_frames, chunk_size, dtype)
+        fps = info.get("fps", 24.0) / stride
+
+    print(f"[Seedance] Decoded {result.shape[0]} frames {tuple(result.shape[1:3])} @ {fps:g} fps")
+    return result, fps
+
+
+# ---------------------------------------------------------------------------
+# Concatenation
+# ---------------------------------------------------------------------------
+
+def _copy_streams(container) -> list:
+    """The streams a concat carries over: the first video and (if any) the first audio stream."""
+    streams = [container.streams.video[0]] if container.streams.video else []
+    if container.streams.audio:
+        streams.append(container.streams.audio[0])
+    return streams
+
+
+def _stream_signature(stream) -> dict:
+    """Codec parameters that must match for packets to be stream-copied into one track."""
+    ctx = stream.codec_context
+    signature = {"type": stream.type, "codec": ctx.name, "profile": ctx.profile}
+    if stream.type == "video":
+        signature.update(width=ctx.width, height=ctx.height, pix_fmt=getattr(ctx.format, "name", None))
+    else:
+        signature.update(sample_rate=ctx.sample_rate, layout=getattr(ctx.layout, "name", None))
+    signature["extradata"] = bytes(ctx.extradata or b"")
+    return signature
+
+
+def concat_mismatch(paths: list) -> str | None:
+    """Return why paths cannot be joined by stream copy, or None if they can."""
+    import av
+
+    reference = None
+    for path in paths:
+        with av.open(path) as container:
+            signature = [_stream_signature(s) for s in _copy_streams(container)]
+        name = os.path.basename(path)
+        if not signature or signature[0]["type"] != "video":
+            return f"{name} has no video stream"
+        if reference is None:
+            reference = signature
+            continue
+        if [s["type"] for s in signature] != [s["type"] for s in reference]:
+            return f"{name} has different streams than {os.path.basename(paths[0])}"
+        for ref, sig in zip(reference, signature):
+            diff = [k for k in ref if ref[k] != sig[k]]
+            if diff:
+                shown = ", ".join(k if k == "extradata" else f"{k} {ref[k]} != {sig[k]}" for k in diff)
+                return f"{name} {sig['type']}: {shown}"
+    return None
+
+
+def _remux_concat(paths: list, out_path: str) -> None:
+    """Join files with identical codec parameters by rewriting packet timestamps only."""
+    import av
+
+    with av.open(out_path, "w", format="mp4", options={"movflags": "+faststart"}) as out:
+        out_streams = None
+        next_dts = {}  # output stream slot -> end of the previous file's track, in seconds
+        for path in paths:
+            with av.open(path) as inp:
+                streams = _copy_streams(inp)
+                if out_streams is None:
+                    if hasattr(out, "add_stream_from_template"):
+                        out_streams = [out.add_stream_from_template(s) for s in streams]
+                    else:
+                        out_streams = [out.add_stream(template=s) for s in streams]
+                shifts, ends = {}, {}
+                for packet in inp.demux(*streams):
+                    if packet.dts is None:
+                        continue  # demuxer flush packet
+                    slot = streams.index(packet.stream)
+                    tb = packet.time_base
+                    if slot not in shifts:
+                        # Start this file's track where the previous one ended (0 for the first file)
+                        shifts[slot] = round(next_dts[slot] / tb) - packet.dts if slot in next_dts else 0
+                    packet.dts += shifts[slot]
+                    if packet.pts is not None:
+                        packet.pts += shifts[slot]
+                    duration = packet.duration
+                    if not duration and packet.stream.type == "video" and packet.stream.average_rate:
+                        duration = round(1 / (packet.stream.average_rate * tb))
+                    ends[slot] = (packet.dts + (duration or 0)) * tb
+                    packet.stream = out_streams[slot]
+                    out.mux(packet)
+                next_dts.update(ends)
+
+
+def _reencode_concat(paths: list, out_path: str) -> None:
+    """Decode every input and encode one H.264 (or MPEG-4) track at the first file's size and rate."""
+    import av
+    from fractions import Fraction
+
+    with av.open(paths[0]) as first:
+        ctx = first.streams.video[0].codec_context
+        width, height = ctx.width, ctx.height
+        rate = first.streams.video[0].average_rate or Fraction(24)
+
+    with av.open(out_path, "w", format="mp4", options={"movflags": "+faststart"}) as out:
+        stream = None
+        for codec in ("libx264", "h264", "mpeg4"):
+            try:
+                stream = out.add_stream(codec, rate=rate)
+                break
+            except Exception:
+                continue
+        if stream is None:
+            raise RuntimeError("No H.264 or MPEG-4 encoder available")
+        stream.width, stream.height, stream.pix_fmt = width, height, "yuv420p"
+        pts = 0
+        for path in paths:
+            with av.open(path) as inp:
+                source = inp.streams.video[0]
+                source.thread_type = "AUTO"
+                for frame in inp.decode(source):
+                    frame = frame.reformat(width=width, height=height, format="yuv420p")
+                    frame.pts, frame.time_base = pts, 1 / rate
+                    pts += 1
+                    for packet in stream.encode(frame):
+                        out.mux(packet)
+        for packet in stream.encode(None):
+            out.mux(packet)
+
+
+def _reencode_concat_cv2(paths: list, out_path: str) -> None:
+    import cv2
+
+    cap = cv2.VideoCapture(paths[0])
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 24
+    cap.release()
+    writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"cv2.VideoWriter could not open {out_path}")
+    try:
+        for path in paths:
+            cap = cv2.VideoCapture(path)
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                if (frame.shape[1], frame.shape[0]) != (width, height):
+                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                writer.write(frame)
+            cap.release()
+    finally:
+        writer.release()
+
+
+def concat_videos(paths: list, output_path: str, reencode: bool = False) -> str:
+    """
+    Join video files into output_path and return the method used.
+
+    Files whose codec parameters match (codec, size, pixel format, profile
+    and SPS/PPS extradata, as for segments of one Seedance model) are joined
+    by stream copy: packets are remuxed with shifted timestamps and no frame
+    is decoded. Anything else, or reencode=True, falls back to a re-encode
+    at the first file's size and frame rate. Without PyAV only the cv2
+    re-encode is available.
+    """
+    if not paths:
+        raise ValueError("No videos to concatenate")
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        av = None
+
+    # cv2 picks the container from the extension, so the temp name must end in .mp4
+    tmp_path = f"{output_path[:-4]}.{uuid.uuid4().hex[:8]}.part.mp4"
+    try:
+        if av is None:
+            method = "re-encode (cv2, PyAV not installed)"
+            _reencode_concat_cv2(paths, tmp_path)
+        else:
+            reason = "requested" if reencode else concat_mismatch(paths)
+            if reason is None:
+                method = "stream copy"
+                _remux_concat(paths, tmp_path)
+            else:
+                method = f"re-encode ({reason})"
+                _reencode_concat(paths, tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    print(f"[Seedance] Concatenated {len(paths)} videos by {method}: {output_path}")
+    return method
+
+
+def concat_video_outputs(videos: list, reencode: bool = False, subdir: str = "seedance_videos"):
+    """
+    Concatenate VIDEO objects into a stored mp4 and return (VIDEO, method).
+    The result is keyed by the content of its inputs, so joining the same
+    segments again reuses the stored file.
+    """
+    paths = []
+    for video in videos:
+        source = video_source(video)
+        if not isinstance(source, str):
+            tmp_path = os.path.join(_ensure_output_dir("temp_videos"), f"concat_{uuid.uuid4().hex[:8]}.mp4")
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(source, f)
+            source = tmp_path
+        paths.append(source)
+
+    digest = hashlib.sha1("".join(file_digest(p) for p in paths).encode("ascii")).hexdigest()[:20]
+    key = f"concat_{digest}" + ("_reencode" if reencode else "")
+    entry = find_output_entry(subdir, key)
+    if entry:
+        print(f"[Seedance] Reusing stored output for {key}: {entry['path']}")
+        output_path, method = entry["path"], entry.get("method", "stream copy")
+    else:
+        key, output_path = make_output_path(subdir, key, "seedance_", ".mp4")
+        method = concat_videos(paths, output_path, reencode=reencode)
+        record_output(subdir, key, output_path, method=method, parts=len(paths))
+
+    video = _make_comfy_video_from_path(output_path)
+    pin_output(output_path, owner=video)
+    return video, method
+
+
+# ---------------------------------------------------------------------------
+# Post-download processing: faststart, proxy clip, thumbnail
+# ---------------------------------------------------------------------------
+# Configured in .env:
+#   SEEDANCE_FASTSTART=1       move the moov box to the front of downloaded mp4s (default on)
+#   SEEDANCE_PROXY_HEIGHT=0    also write a small "<video>.proxy.mp4" at this height (0 = off)
+#   SEEDANCE_THUMBNAIL=0       also write a "<video>.thumb.jpg" (1 = on)
+# Proxies and thumbnails are sidecar files, so retention evicts them with the video.
+
+# Boxes whose children lead to the chunk offset tables
+_MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+_POSTPROCESS = {"pool": None}
+_POSTPROCESS_LOCK = threading.Lock()
+
+
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _iter_boxes(f, start: int, end: int):
+    """Yield (type, offset, size, header_size) for the boxes in f[start:end]."""
+    import struct
+
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            raise ValueError(f"Corrupt mp4 box {box_type!r} at {offset}")
+        yield box_type, offset, size, header
+        offset += size
+
+
+def _shift_chunk_offsets(moov: bytearray, delta: int) -> None:
+    """Add delta to every stco / co64 entry inside a moov box, in place."""
+    import io
+    import struct
+
+    def walk(start, end):
+        for box_type, offset, size, header in _iter_boxes(io.BytesIO(moov), start, end):
+            body = offset + header
+            if box_type in _MP4_CONTAINERS:
+                walk(body, offset + size)
+            elif box_type in (b"stco", b"co64"):
+                count = struct.unpack_from(">I", moov, body + 4)[0]
+                fmt = ">%dI" % count if box_type == b"stco" else ">%dQ" % count
+                entries = [e + delta for e in struct.unpack_from(fmt, moov, body + 8)]
+                if box_type == b"stco" and entries and max(entries) > 0xFFFFFFFF:
+                    raise ValueError("Chunk offsets overflow 32 bits, stco would need co64")
+                struct.pack_into(fmt, moov, body + 8, *entries)
+
+    walk(0, len(moov))
+
+
+def faststart_mp4(path: str) -> bool:
+    """
+    Move the moov box in front of the media data so players can start before
+    the whole file has arrived (what ffmpeg's -movflags +faststart does).
+    Pure box rewrite: the moov is moved, its chunk offsets shifted and mdat
+    copied as-is. Returns True if the file was rewritten, False if it was
+    already faststart or is not a plain mp4 (e.g. fragmented).
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        boxes = list(_iter_boxes(f, 0, file_size))
+        types = [b[0] for b in boxes]
+        if b"moov" not in types or b"mdat" not in types or b"moof" in types:
+            return False
+        moov_index, mdat_index = types.index(b"moov"), types.index(b"mdat")
+        # Only the simple "moov after every mdat" layout is rewritten
+        if moov_index < mdat_index or any(t == b"mdat" for t in types[moov_index + 1:]):
+            return False
+        _, moov_offset, moov_size, _ = boxes[moov_index]
+        f.seek(moov_offset)
+        moov = bytearray(f.read(moov_size))
+        _shift_chunk_offsets(moov, moov_size)
+
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+        try:
+            with open(tmp_path, "wb") as out:
+                for i, (box_type, offset, size, _) in enumerate(boxes):
+                    if i == mdat_index:
+                        out.write(moov)
+                    if i == moov_index:
+                        continue
+                    f.seek(offset)
+                    remaining = size
+                    while remaining:
+                        chunk = f.read(min(remaining, 1 << 20))
+                        if not chunk:
+                            raise ValueError("Truncated mp4")
+                        out.write(chunk)
+                        remaining -= len(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return True
+
+
+def proxy_path(video_path: str) -> str:
+    return f"{video_path}.proxy.mp4"
+
+
+def thumbnail_path(video_path: str) -> str:
+    return f"{video_path}.thumb.jpg"
+
+
+def make_proxy_clip(video_path: str, height: int = 240, out_path: str | None = None) -> str:
+    """Write a small H.264 preview of video_path (faststart, no audio) and return its path."""
+    import av
+
+    out_path = out_path or proxy_path(video_path)
+    tmp_path = f"{out_path[:-4]}.{uuid.uuid4().hex[:8]}.part.mp4"
+    try:
+        with av.open(video_path) as inp:
+            source = inp.streams.video[0]
+            source.thread_type = "AUTO"
+            ctx = source.codec_context
+            width = max(2, round(ctx.width * height / ctx.height / 2) * 2)
+            rate = source.average_rate or 24
+            with av.open(tmp_path, "w", format="mp4", options={"movflags": "+faststart"}) as out:
+                stream = out.add_stream("libx264", rate=rate)
+                stream.width, stream.height, stream.pix_fmt = width, height, "yuv420p"
+                stream.options = {"crf": "30", "preset": "veryfast"}
+                for i, frame in enumerate(inp.decode(source)):
+                    frame = frame.reformat(width=width, height=height, format="yuv420p")
+                    frame.pts, frame.time_base = i, 1 / rate
+                    for packet in stream.encode(frame):
+                        out.mux(packet)
+                for packet in stream.encode(None):
+                    out.mux(packet)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return out_path
+
+
+def make_thumbnail(video_path: str, max_size: int = 320, out_path: str | None = None) -> str:
+    """Save a JPEG of the frame in the middle of video_path and return its path."""
+    from PIL import Image
+
+    out_path = out_path or thumbnail_path(video_path)
+    info = {}
+    frames = iter_video_frames(video_path, info=info)
+    try:
+        frame = next(frames)
+        middle = info.get("total", 0) // 2
+        for i, later in enumerate(frames, 1):
+            if i > middle:
+                break
+            frame = later
+    finally:
+        frames.close()
+    image = Image.fromarray(frame)
+    image.thumbnail((max_size, max_size))
+    tmp_path = f"{out_path}.{uuid.uuid4().hex[:8]}.part"
+    image.save(tmp_path, format="JPEG", quality=85)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def _postprocess_job(video_path: str, proxy_height: int, thumbnail: bool) -> None:
+    try:
+        if proxy_height and not os.path.exists(proxy_path(video_path)):
+            print(f"[Seedance] Proxy clip saved to: {make_proxy_clip(video_path, proxy_height)}")
+        if thumbnail and not os.path.exists(thumbnail_path(video_path)):
+            print(f"[Seedance] Thumbnail saved to: {make_thumbnail(video_path)}")
     except Exception as e:
-        print(f"[Seedance] Failed to download image from {image_url}: {e}")
-        # Return empty tensor as fallback
-        return torch.zeros((1, 512, 512, 3), dtype=torch.float32)
+        print(f"[Seedance] Post-processing of {video_path} failed: {e}")
+    finally:
+        unpin_output(video_path)
+
+
+def postprocess_video(video_path: str):
+    """
+    Run the post-download stage configured in .env on a stored mp4: faststart
+    in place (cheap, done inline), then proxy clip / thumbnail on a background
+    worker. Returns the background future, or None if nothing was queued.
+    """
+    if _env_flag("SEEDANCE_FASTSTART", "1"):
+        try:
+            if faststart_mp4(video_path):
+                print(f"[Seedance] Moved moov to the front: {video_path}")
+        except Exception as e:
+            print(f"[Seedance] Faststart of {video_path} failed, keeping the file as-is: {e}")
+
+    try:
+        proxy_height = int(os.getenv("SEEDANCE_PROXY_HEIGHT", "0"))
+    except ValueError:
+        proxy_height = 0
+    thumbnail = _env_flag("SEEDANCE_THUMBNAIL")
+    if not proxy_height and not thumbnail:
+        return None
+
+    with _POSTPROCESS_LOCK:
+        if _POSTPROCESS["pool"] is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _POSTPROCESS["pool"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="seedance-postprocess")
+    # Keep the video out of retention sweeps until the job has read it
+    pin_output(video_path)
+    return _POSTPROCESS["pool"].submit(_postprocess_job, video_path, proxy_height, thumbnail)
@@ -9,19 +9,8 @@ Compatible with ComfyUI 0.3.59 and 0.4.x
 """
 
 import os
-import time
-import base64
 import io
-import requests
 from typing import Dict, Any, Optional, List
-from PIL import Image
-import numpy as np
-
-try:
-    from dotenv import load_dotenv
-    DOTENV_AVAILABLE = True
-except ImportError:
-    DOTENV_AVAILABLE = False
 
 # optional (only used by utils if available)
 try:
@@ -32,6 +21,10 @@ except ImportError:
 
 # ✅ 关键：使用相对导入（同目录内）
 from .byteplus_video_utils import download_url_to_video_output, create_error_video_placeholder, download_url_to_image_output
+from .byteplus_api_utils import load_env, get_api_client, create_session, is_interrupt, poll_task, region_env, task_callback_url, DEFAULT_BASE_URL
+from .byteplus_scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, scheduled
+from .byteplus_capabilities import MODES, validate_request
+from .byteplus_transport import JSONBody, image_reference
 
 
 def _extract_video_url_from_result(result: Dict[str, Any]) -> Optional[str]:
@@ -83,11 +76,14 @@ def _extract_last_frame_url_from_result(result: Dict[str, Any]) -> Optional[str]
     return None
 
 
-def _image_to_base64(image_tensor) -> str:
+def _image_to_png(image_tensor) -> bytes:
     """
-    Convert ComfyUI image tensor to base64 string
+    Convert ComfyUI image tensor to PNG bytes
     image_tensor: torch tensor with shape [B, H, W, C] and values in [0, 1]
     """
+    import numpy as np
+    from PIL import Image
+
     # Convert tensor to numpy array
     if hasattr(image_tensor, 'cpu'):
         image_np = image_tensor.cpu().numpy()
@@ -124,13 +120,10 @@ def _image_to_base64(image_tensor) -> str:
     # Convert to PIL Image
     pil_image = Image.fromarray(image_np)
 
-    # Convert to base64
+    # Convert to PNG
     buffer = io.BytesIO()
     pil_image.save(buffer, format='PNG')
-    image_bytes = buffer.getvalue()
-    base64_string = base64.b64encode(image_bytes).decode('utf-8')
-
-    return f"data:image/png;base64,{base64_string}"
+    return buffer.getvalue()
 
 
 def _validate_images(images: List[Any]) -> List[Any]:
@@ -152,23 +145,34 @@ def _validate_images(images: List[Any]) -> List[Any]:
 class SeedanceRefs2VideoAPI:
     """Handles API calls to Seedance Reference Images to Video service"""
 
-    def __init__(self):
-        if DOTENV_AVAILABLE:
-            load_dotenv()
+    def __init__(self, region=None):
+        load_env()
 
-        self.api_key = os.getenv('ARK_API_KEY')
+        # region: a RegionProfile when ARK_REGIONS routing is on, see get_api_client()
+        self.region = region
+        self.api_key = region.api_key if region else os.getenv('ARK_API_KEY')
         if not self.api_key:
             raise ValueError("ARK_API_KEY environment variable is required")
 
-        self.base_url = os.getenv('ARK_API_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3')
+        self.base_url = region.base_url if region else os.getenv('ARK_API_BASE_URL', DEFAULT_BASE_URL)
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
         }
+        # Pooled HTTP session, reused for as long as this client is cached
+        self.session = create_session()
+
+    def check_request(self, images: List[Any], prompt: str, params: Dict[str, Any]) -> None:
+        """Reject parameters or images the model does not accept before encoding (see byteplus_capabilities)"""
+        validate_request("refs", params, images)
 
+    @scheduled()
     def generate_video(self, images: List[Any], prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
         # 直接使用传入的模型名称，因为它已经是从环境变量读取的正确值
         actual_model = params.get('model', 'seedance-1-0-lite-i2v-250428')
+        # The UI lists the global model name; a routed client uses its region's name for it
+        if self.region and actual_model == os.getenv('SEEDANCE_LITE_I2V_MODEL', 'seedance-1-0-lite-i2v-250428'):
+            actual_model = region_env(self.region, 'SEEDANCE_LITE_I2V_MODEL', actual_model)
         # Validate images
         valid_images = _validate_images(images)
 
@@ -212,12 +216,15 @@ class SeedanceRefs2VideoAPI:
                 {"type": "text", "text": text_content}
             ],
         }
+        callback_url = task_callback_url()
+        if callback_url:
+            payload["callback_url"] = callback_url
 
         # Add reference images with 'role' field
         for i, image_tensor in enumerate(valid_images, 1):
             print(f"[Seedance Refs2Video] Processing reference image {i}")
-            image_base64 = _image_to_base64(image_tensor)
-            print(f"[Seedance Refs2Video] Image {i} converted to base64 (length: {len(image_base64)})")
+            image_base64 = image_reference(self, _image_to_png(image_tensor), "png", f"reference_{i}.png")
+            print(f"[Seedance Refs2Video] Image {i} prepared (length: {len(image_base64)})")
             payload["content"].append({
                 "type": "image_url",
                 "image_url": {"url": image_base64},
@@ -227,10 +234,10 @@ class SeedanceRefs2VideoAPI:
         print(f"[Seedance Refs2Video] Total content items: {len(payload['content'])} (1 text + {len(valid_images)} images)")
         print(f"[Seedance Refs2Video] Final payload keys: {list(payload.keys())}")
 
-        r = requests.post(
+        r = self.session.post(
             f"{self.base_url}/contents/generations/tasks",
             headers=self.headers,
-            json=payload,
+            data=JSONBody(payload),   # images are base64-encoded while the body is sent
             timeout=60,
         )
 
@@ -248,7 +255,7 @@ class SeedanceRefs2VideoAPI:
         return r.json()
 
     def get_task_status(self, task_id: str) -> Dict[str, Any]:
-        r = requests.get(
+        r = self.session.get(
             f"{self.base_url}/contents/generations/tasks/{task_id}",
             headers=self.headers,
             timeout=30,
@@ -259,23 +266,15 @@ class SeedanceRefs2VideoAPI:
     def wait_for_completion(
         self,
         task_id: str,
-        max_wait_time: int = 300,
+        max_wait_time: Optional[int] = None,
         poll_interval: int = 5,
+        params: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
-        start_time = time.time()
-        while time.time() - start_time < max_wait_time:
-            result = self.get_task_status(task_id)
-            status = result.get("status", "unknown")
-            
-            if status == "succeeded":
-                return result
-            elif status == "failed":
-                error_msg = result.get("error", {}).get("message", "Unknown error")
-                raise RuntimeError(f"Video generation failed: {error_msg}")
-            
-            time.sleep(poll_interval)
-        
-        raise TimeoutError(f"Video generation timed out after {max_wait_time} seconds")
+        """
+        Poll until done; cancels the remote task on interrupt or timeout (see poll_task).
+        Without max_wait_time the deadline is derived from params (model, resolution, duration).
+        """
+        return poll_task(self, task_id, max_wait_time=max_wait_time, poll_interval=poll_interval, params=params)
 
 
 class SeedanceRefs2VideoNode:
@@ -284,8 +283,7 @@ class SeedanceRefs2VideoNode:
     @classmethod
     def INPUT_TYPES(cls):
         # Load model name from environment variable
-        if DOTENV_AVAILABLE:
-            load_dotenv()
+        load_env()
         model_name = os.getenv('SEEDANCE_LITE_I2V_MODEL', 'seedance-1-0-lite-i2v-250428')
 
         return {
@@ -293,8 +291,9 @@ class SeedanceRefs2VideoNode:
                 "images": ("IMAGE",),
                 "prompt": ("STRING", {"multiline": True, "default": "Generate a video from these reference images"}),
                 "model": ([model_name], {"default": model_name}),
-                "resolution": (["480p", "720p", "1080p"], {"default": "720p"}),
-                "aspect_ratio": (["16:9", "4:3", "1:1", "3:4", "9:16", "21:9"], {"default": "16:9"}),
+                # Only what the service accepts for reference images, see byteplus_capabilities
+                "resolution": (list(MODES["refs"]["resolutions"]), {"default": "720p"}),
+                "aspect_ratio": (list(MODES["refs"]["ratios"]), {"default": "16:9"}),
                 "duration": ("INT", {"default": 5, "min": 3, "max": 12, "step": 1, "display": "slider"}),
                 "seed": ("INT", {"default": 1, "min": -1, "max": 2147483647, "step": 1}),
                 "camera_fixed": ("BOOLEAN", {"default": False}),
@@ -305,6 +304,7 @@ class SeedanceRefs2VideoNode:
                 "image2": ("IMAGE",),
                 "image3": ("IMAGE",),
                 "image4": ("IMAGE",),
+                "priority": (list(PRIORITY_CLASSES), {"default": DEFAULT_PRIORITY}),
             }
         }
 
@@ -347,13 +347,14 @@ class SeedanceRefs2VideoNode:
         image2=None,
         image3=None,
         image4=None,
+        priority: str = DEFAULT_PRIORITY,
     ):
         try:
             # Collect all images
             all_images = [images, image2, image3, image4]
             print(f"[Seedance Refs2Video] Collected images: image1={images is not None}, image2={image2 is not None}, image3={image3 is not None}, image4={image4 is not None}")
             
-            api = SeedanceRefs2VideoAPI()
+            api = get_api_client(SeedanceRefs2VideoAPI)
             params = {
                 'model': model,
                 'resolution': resolution,
@@ -362,6 +363,7 @@ class SeedanceRefs2VideoNode:
                 'seed': seed if seed != -1 else None,
                 'camera_fixed': camera_fixed,
                 'watermark': watermark,
+                'priority': priority,
                 'auto_add_image_refs': auto_add_image_refs,
             }
 
@@ -386,7 +388,7 @@ class SeedanceRefs2VideoNode:
 
             # Wait for completion
             print("[Seedance Refs2Video] Waiting for video generation to complete...")
-            done = api.wait_for_completion(task_id)
+            done = api.wait_for_completion(task_id, params=params)
 
             # 增强的完成响应信息输出
             print("=" * 60)
@@ -410,12 +412,12 @@ class SeedanceRefs2VideoNode:
             print(f"[Seedance Refs2Video] Last frame URL: {last_frame_url}")
             
             # Download video and last frame
-            video_obj = download_url_to_video_output(video_url)
+            video_obj = download_url_to_video_output(video_url, task_id=task_id, session=api.session)
             
             # Download last frame if available
             if last_frame_url:
                 try:
-                    last_frame_image = download_url_to_image_output(last_frame_url)
+                    last_frame_image = download_url_to_image_output(last_frame_url, task_id=task_id, session=api.session)
                     print(f"[Seedance Refs2Video] Last frame downloaded successfully")
                 except Exception as e:
                     print(f"[Seedance Refs2Video] Failed to download last frame: {e}")
@@ -446,6 +448,8 @@ class SeedanceRefs2VideoNode:
             return (video_obj, last_frame_image, response_info)
             
         except Exception as e:
+            if is_interrupt(e):
+                raise
             error_msg = f"Seedance Refs2Video generation failed: {str(e)}"
             print(f"[ERROR] {error_msg}")
 
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Seedance video tool nodes
+Compatible with ComfyUI 0.3.59 and 0.4.x
+
+- Seedance Video to Frames: decode a VIDEO (e.g. a Seedance output) into an
+  IMAGE batch with bounded memory, see byteplus_video_utils.decode_video_frames.
+  Decoded frames are cached on disk next to the video, so decoding the same
+  clip again with the same options only maps the cache file.
+- Seedance Video Concat: join videos (e.g. the segments of an Image2Video
+  chain) by stream copy, re-encoding only when codec parameters differ
+- Seedance Resume Task: fetch the result of a task by id, e.g. one submitted
+  by another host or before a restart, see byteplus_coordinator.resume_task
+
+This file is shared verbatim by all Seedance node packages; registering the
+same node name from several packages is harmless.
+"""
+
+from typing import Dict, Any, Optional
+
+from .byteplus_coordinator import resume_task
+from .byteplus_video_utils import concat_video_outputs, decode_video_frames, download_url_to_image_output, \
+    download_url_to_video_output
+
+
+class SeedanceVideoToFramesNode:
+    """Decode a video into an IMAGE batch with frame stride and target size options"""
+
+    @classmethod
+    def INPUT_TYPES(cls) -> Dict[str, Any]:
+        return {
+            "required": {
+                "video": ("VIDEO",),
+                "stride": ("INT", {"default": 1, "min": 1, "max": 120, "step": 1}),
+                "max_frames": ("INT", {"default": 0, "min": 0, "max": 10000, "step": 1}),
+                "width": ("INT", {"default": 0, "min": 0, "max": 4096, "step": 8}),
+                "height": ("INT", {"default": 0, "min": 0, "max": 4096, "step": 8}),
+            },
+            "optional": {
+                "cache_frames": ("BOOLEAN", {"default": True}),
+            },
+        }
+
+    RETURN_TYPES = ("IMAGE", "FLOAT", "INT")
+    RETURN_NAMES = ("frames", "fps", "frame_count")
+    FUNCTION = "decode"
+    CATEGORY = "BytePlus/Seedance Video Tools"
+
+    def decode(self, video, stride: int = 1, max_frames: int = 0, width: int = 0, height: int = 0,
+               cache_frames: bool = True):
+        # width / height of 0 keep the source size (or its aspect ratio when only one is set)
+        frames, fps = decode_video_frames(video, stride=stride, max_frames=max_frames,
+                                          width=width, height=height, cache=cache_frames)
+        return (frames, fps, int(frames.shape[0]))
+
+
+class SeedanceVideoConcatNode:
+    """Concatenate a list of videos in order, without re-encoding when possible"""
+
+    @classmethod
+    def INPUT_TYPES(cls) -> Dict[str, Any]:
+        return {
+            "required": {
+                "videos": ("VIDEO",),
+            },
+            "optional": {
+                "force_reencode": ("BOOLEAN", {"default": False}),
+            },
+        }
+
+    # videos arrives as one list (e.g. the list output of the chain node)
+    INPUT_IS_LIST = True
+    RETURN_TYPES = ("VIDEO", "STRING")
+    RETURN_NAMES = ("video", "info")
+    FUNCTION = "concat"
+    CATEGORY = "BytePlus/Seedance Video Tools"
+
+    def concat(self, videos, force_reencode=None):
+        reencode = bool(force_reencode[0]) if force_reencode else False
+        video, method = concat_video_outputs(list(videos), reencode=reencode)
+        return (video, f"{len(videos)} videos joined by {method}")
+
+
+def _result_url(result: Dict[str, Any], field: str) -> Optional[str]:
+    """field ("video_url" / "last_frame_url") from the content of a finished task"""
+    content = result.get("content")
+    if isinstance(content, dict) and content.get(field):
+        return content[field]
+    if isinstance(content, list):
+        for item in content:
+            if isinstance(item, dict) and item.get(field):
+                return item[field]
+    return result.get(field)
+
+
+class SeedanceResumeTaskNode:
+    """Wait for (or look up) a Seedance task by id and download its video and last frame"""
+
+    @classmethod
+    def INPUT_TYPES(cls) -> Dict[str, Any]:
+        return {
+            "required": {
+                "task_id": ("STRING", {"default": ""}),
+            },
+        }
+
+    RETURN_TYPES = ("VIDEO", "IMAGE", "STRING")
+    RETURN_NAMES = ("video", "last_frame", "response_info")
+    FUNCTION = "resume"
+    CATEGORY = "BytePlus/Seedance Video Tools"
+    OUTPUT_NODE = True
+
+    def resume(self, task_id: str):
+        import torch
+
+        task_id = task_id.strip()
+        if not task_id:
+            raise ValueError("task_id is required")
+        done = resume_task(task_id)
+        video_url = _result_url(done, "video_url")
+        if not video_url:
+            raise RuntimeError(f"No video URL in completed result. Response: {done}")
+        video = download_url_to_video_output(video_url, task_id=task_id)
+        last_frame_url = _result_url(done, "last_frame_url")
+        if last_frame_url:
+            last_frame = download_url_to_image_output(last_frame_url, task_id=task_id)
+        else:
+            last_frame = torch.zeros((1, 512, 512, 3), dtype=torch.float32)
+        info = f"任务ID: {task_id}\n完成状态: {done.get('status', 'N/A')}\n视频URL: {video_url}"
+        return (video, last_frame, info)
+
+
+NODE_CLASS_MAPPINGS = {
+    "SeedanceVideoToFrames": SeedanceVideoToFramesNode,
+    "SeedanceVideoConcat": SeedanceVideoConcatNode,
+    "SeedanceResumeTask": SeedanceResumeTaskNode,
+}
+
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "SeedanceVideoToFrames": "Seedance Video to Frames",
+    "SeedanceVideoConcat": "Seedance Video Concat",
+    "SeedanceResumeTask": "Seedance Resume Task",
+}
@@ -1,5 +1,12 @@
 # -*- coding: utf-8 -*-
 from .nodes_seedance_text2video import NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS
+from .nodes_seedance_video_tools import (
+    NODE_CLASS_MAPPINGS as _TOOLS_CLASS_MAPPINGS,
+    NODE_DISPLAY_NAME_MAPPINGS as _TOOLS_DISPLAY_NAME_MAPPINGS,
+)
+
+NODE_CLASS_MAPPINGS = {**NODE_CLASS_MAPPINGS, **_TOOLS_CLASS_MAPPINGS}
+NODE_DISPLAY_NAME_MAPPINGS = {**NODE_DISPLAY_NAME_MAPPINGS, **_TOOLS_DISPLAY_NAME_MAPPINGS}
 
 __all__ = ["NODE_CLASS_MAPPINGS", "NODE_DISPLAY_NAME_MAPPINGS"]
 
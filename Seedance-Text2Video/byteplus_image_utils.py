@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Image decoding helpers shared by the BytePlus nodes.
+#
+# Downloads are fed chunk by chunk from the HTTP stream into PIL's incremental
+# parser (no temp file, no second buffered copy of the body) and converted
+# into the output tensor in one pass: the decoded uint8 pixels are scaled
+# straight into a preallocated float32 / float16 / uint8 tensor, so no
+# full-size float intermediates are created. Several downloads can be decoded
+# one at a time into a single batch, so only one decoded image is held at once.
+#
+# With max_side the (much smaller) encoded body is buffered instead: JPEGs are
+# then decoded at 1/2, 1/4 or 1/8 scale by the decoder itself (PIL's draft
+# mode), so the full-size pixels never exist. Other formats are decoded at
+# full size and resized.
+
+# Tensor dtypes supported for decoded images. float32 is the ComfyUI IMAGE default.
+TENSOR_DTYPES = ("float32", "float16", "uint8")
+
+# Modes PIL can expose as an array directly, with their full-scale value
+_DIRECT_MODES = {
+    "L": 255.0,
+    "LA": 255.0,
+    "RGB": 255.0,
+    "RGBA": 255.0,
+    "RGBX": 255.0,
+    "I;16": 65535.0,
+    "I;16L": 65535.0,
+    "I;16B": 65535.0,
+    "I;16N": 65535.0,
+    "I": 65535.0,
+    "F": 1.0,
+}
+
+
+def _torch_dtype(dtype: str):
+    import torch
+
+    if dtype not in TENSOR_DTYPES:
+        raise ValueError(f"Unsupported image dtype: {dtype}. Expected one of {TENSOR_DTYPES}")
+    return getattr(torch, dtype)
+
+
+def iter_url_chunks(url: str, session=None, timeout: int | None = 300, chunk_size: int = 1 << 16):
+    """Yield the body of url in chunks without buffering the whole response."""
+    import requests
+
+    http = session or requests
+    with http.get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+
+
+def decode_image_stream(chunks):
+    """Decode an iterable of encoded bytes chunks into a loaded PIL image."""
+    from PIL import ImageFile
+
+    parser = ImageFile.Parser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def downscale_image(image, max_side: int = 0):
+    """
+    Resize a decoded image so that neither side exceeds max_side, keeping its
+    aspect ratio (0 or a larger max_side leaves it as is). One Lanczos resize;
+    reducing_gap lets PIL box-reduce large factors first, which is faster.
+    """
+    if not max_side or max(image.size) <= max_side:
+        return image
+    from PIL import Image
+
+    image, _ = _normalize_mode(image)
+    scale = max_side / max(image.size)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+
+
+def decode_image_bytes(data: bytes, max_side: int = 0):
+    """
+    Decode an encoded image, no side larger than max_side (0 = full size).
+    JPEGs are decoded at the smallest DCT scale that is still at least the
+    target size, then resized the rest of the way.
+    """
+    import io
+    import math
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    if max_side and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        # A no-op for formats other than JPEG
+        image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    image.load()
+    return downscale_image(image, max_side)
+
+
+def download_image(url: str, session=None, timeout: int | None = 300, max_side: int = 0):
+    """
+    Download and decode an image URL into a PIL image, streaming into the
+    decoder. With max_side the encoded body is buffered and decoded by
+    decode_image_bytes(), at reduced scale for JPEGs.
+    """
+    chunks = iter_url_chunks(url, session=session, timeout=timeout)
+    if not max_side:
+        return decode_image_stream(chunks)
+    return decode_image_bytes(b"".join(chunks), max_side)
+
+
+def _normalize_mode(image):
+    """Return (image, full_scale) with image in a mode that maps directly to an array."""
+    if image.mode in ("P", "PA"):
+        has_alpha = image.mode == "PA" or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    elif image.mode not in _DIRECT_MODES:
+        # 1, CMYK, YCbCr, LAB, HSV, ...
+        image = image.convert("RGB")
+    return image, _DIRECT_MODES[image.mode]
+
+
+def image_size(image) -> tuple[int, int]:
+    """Return (height, width) of a PIL image."""
+    return image.height, image.width
+
+
+def pil_to_tensor(image, dtype: str = "float32", out=None):
+    """
+    Convert a PIL image to a [H, W, 3] tensor in a single pass.
+
+    Palette images are expanded, alpha is dropped (as PIL's convert("RGB")
+    does), grayscale is broadcast to three channels and 16-bit images are
+    scaled from 0..65535. When out is given (e.g. a slice of a preallocated
+    batch) the pixels are written into it and it is returned.
+    """
+    import numpy as np
+    import torch
+
+    image, scale = _normalize_mode(image)
+    pixels = np.asarray(image)
+    if pixels.ndim == 2:
+        pixels = pixels[..., None]
+    elif pixels.shape[2] == 2:
+        pixels = pixels[..., :1]
+    else:
+        pixels = pixels[..., :3]
+
+    height, width = pixels.shape[:2]
+    if out is None:
+        out = torch.empty((height, width, 3), dtype=_torch_dtype(dtype))
+    elif tuple(out.shape) != (height, width, 3):
+        raise ValueError(f"Image is {width}x{height}, expected {out.shape[1]}x{out.shape[0]}")
+
+    target = out.numpy()
+    if target.dtype == np.uint8:
+        if scale == 255.0:
+            np.copyto(target, pixels, casting="unsafe")
+        else:
+            np.multiply(pixels, np.float32(255.0 / scale), out=target, casting="unsafe")
+    else:
+        np.multiply(pixels, target.dtype.type(1.0 / scale), out=target, casting="unsafe")
+        if scale == 1.0:
+            np.clip(target, 0.0, 1.0, out=target)
+    return out
+
+
+def images_to_batch(images, dtype: str = "float32"):
+    """
+    Convert same-sized PIL images into one [N, H, W, 3] tensor, writing each
+    image into its slice of a single preallocated buffer (no np.stack copy).
+    """
+    import torch
+
+    if not images:
+        raise ValueError("No images to batch")
+    height, width = image_size(images[0])
+    for i, image in enumerate(images[1:], 1):
+        if image_size(image) != (height, width):
+            raise ValueError(
+                f"Image {i} is {image.width}x{image.height}, expected {width}x{height}; cannot batch different sizes"
+            )
+    batch = torch.empty((len(images), height, width, 3), dtype=_torch_dtype(dtype))
+    for i, image in enumerate(images):
+        pil_to_tensor(image, out=batch[i])
+    return batch
+
+
+def download_images_to_batch(urls, session=None, timeout: int | None = 300, dtype: str = "float32",
+                             max_side: int = 0):
+    """
+    Download same-sized images into one [N, H, W, 3] tensor. Each image is
+    written into its slice as soon as it is decoded (at reduced size with
+    max_side, see download_image()), so only the batch and one decoded image
+    are in memory at a time.
+    """
+    import torch
+
+    urls = list(urls)
+    if not urls:
+        raise ValueError("No images to batch")
+    batch = None
+    for i, url in enumerate(urls):
+        image = download_image(url, session=session, timeout=timeout, max_side=max_side)
+        if batch is None:
+            height, width = image_size(image)
+            batch = torch.empty((len(urls), height, width, 3), dtype=_torch_dtype(dtype))
+        elif image_size(image) != tuple(batch.shape[1:3]):
+            raise ValueError(f"Image {i} is {image.width}x{image.height}, expected "
+                             f"{batch.shape[2]}x{batch.shape[1]}; cannot batch different sizes")
+        pil_to_tensor(image, out=batch[i])
+        del image
+    return batch
+
+
+def download_image_tensor(url: str, session=None, timeout: int | None = 300, dtype: str = "float32"):
+    """Download an image URL straight into a [1, H, W, 3] tensor."""
+    image = download_image(url, session=session, timeout=timeout)
+    return pil_to_tensor(image, dtype=dtype).unsqueeze(0)
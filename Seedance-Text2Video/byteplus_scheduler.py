@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+# Priority scheduler in front of the ARK generation calls, shared by all
+# BytePlus nodes (every node package has a copy; the state is process-wide).
+#
+# Each generate_video / generate_image call first takes a slot of its priority
+# class (params["priority"]: interactive, normal or batch). A video slot is held
+# until poll_task() stops waiting for the task, an image slot until the call
+# returns. SCHEDULER_MAX_CONCURRENT caps all slots and SCHEDULER_MAX_<CLASS>
+# one class; 0 (the default) is unlimited, so without limits nothing waits and
+# only the metrics are kept. A freed slot goes to the waiting job of the
+# highest class, and every SCHEDULER_AGING_SECONDS of waiting lifts a job by
+# one class so batch work cannot starve. Queue metrics are printed when a job
+# has to wait and served as JSON at GET /byteplus/scheduler. With a
+# coordinator (byteplus_coordinator) a job then also takes a lease of the
+# budget shared between hosts.
+
+import os
+import sys
+import time
+import types
+import functools
+import threading
+
+from .byteplus_api_utils import processing_interrupted, _raise_interrupted
+from .byteplus_coordinator import get_coordinator
+
+PRIORITY_CLASSES = ("interactive", "normal", "batch")
+DEFAULT_PRIORITY = "normal"
+_CLASS_RANK = {"interactive": 2, "normal": 1, "batch": 0}
+AGING_SECONDS = 120
+METRICS_ROUTE = "/byteplus/scheduler"
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        print(f"[BytePlus] Ignoring invalid {name}={os.getenv(name)!r}")
+        return default
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued", "event", "granted")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+
+
+class Scheduler:
+    """Admission control for generation jobs by priority class."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiting = []       # _Waiter, in arrival order
+        self.running = {c: 0 for c in PRIORITY_CLASSES}
+        self.tasks = {}         # task_id -> priority class holding a slot
+        self.admitted = {c: 0 for c in PRIORITY_CLASSES}
+        self.wait_total = {c: 0.0 for c in PRIORITY_CLASSES}
+        self.wait_max = {c: 0.0 for c in PRIORITY_CLASSES}
+
+    @staticmethod
+    def limits() -> tuple[int, dict, float]:
+        """(total cap, per-class caps, aging seconds) from the environment; 0 = unlimited."""
+        total = int(_env_number("SCHEDULER_MAX_CONCURRENT", 0))
+        caps = {c: int(_env_number(f"SCHEDULER_MAX_{c.upper()}", 0)) for c in PRIORITY_CLASSES}
+        return total, caps, _env_number("SCHEDULER_AGING_SECONDS", AGING_SECONDS)
+
+    def _can_run(self, priority: str, total: int, caps: dict) -> bool:
+        if total and sum(self.running.values()) >= total:
+            return False
+        return not caps[priority] or self.running[priority] < caps[priority]
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiters, best effective class first (lock held)."""
+        total, caps, aging = self.limits()
+        now = time.monotonic()
+
+        def rank(w):
+            waited = (now - w.enqueued) / aging if aging > 0 else 0.0
+            return _CLASS_RANK[w.priority] + waited
+
+        while self.waiting:
+            eligible = [w for w in self.waiting if self._can_run(w.priority, total, caps)]
+            if not eligible:
+                return
+            # max() keeps the earliest arrival among equal ranks
+            waiter = max(eligible, key=rank)
+            self.waiting.remove(waiter)
+            self._admit(waiter.priority, now - waiter.enqueued)
+            waiter.granted = True
+            waiter.event.set()
+
+    def _admit(self, priority: str, waited: float) -> None:
+        self.running[priority] += 1
+        self.admitted[priority] += 1
+        self.wait_total[priority] += waited
+        self.wait_max[priority] = max(self.wait_max[priority], waited)
+
+    def acquire(self, priority: str) -> None:
+        """Block until a slot of this class is free; raises on a ComfyUI interrupt."""
+        waiter = _Waiter(priority)
+        with self.lock:
+            self.waiting.append(waiter)
+            self._dispatch()
+            if not waiter.granted:
+                others = len(self.waiting) - 1
+                print(f"[BytePlus] {priority} job queued, {others} others waiting ({self.describe()})")
+        while not waiter.event.wait(0.2):
+            if processing_interrupted():
+                with self.lock:
+                    if waiter.granted:
+                        self._release(priority)
+                    else:
+                        self.waiting.remove(waiter)
+                _raise_interrupted()
+
+    def _release(self, priority: str) -> None:
+        self.running[priority] = max(0, self.running[priority] - 1)
+        self._dispatch()
+
+    def release(self, priority: str) -> None:
+        with self.lock:
+            self._release(priority)
+
+    def bind_task(self, task_id: str, priority: str) -> None:
+        """Keep the slot taken for task_id until finish_task(task_id)."""
+        with self.lock:
+            self.tasks[task_id] = priority
+
+    def finish_task(self, task_id: str) -> None:
+        with self.lock:
+            priority = self.tasks.pop(task_id, None)
+            if priority is not None:
+                self._release(priority)
+
+    def describe(self) -> str:
+        total, _, _ = self.limits()
+        running = ", ".join(f"{c} {self.running[c]}" for c in PRIORITY_CLASSES)
+        return f"running: {running}; limit {total or 'none'}"
+
+    def snapshot(self) -> dict:
+        """Queue depth, running jobs and wait times per class."""
+        total, caps, aging = self.limits()
+        now = time.monotonic()
+        with self.lock:
+            classes = {}
+            for c in PRIORITY_CLASSES:
+                queued = [w for w in self.waiting if w.priority == c]
+                classes[c] = {
+                    "cap": caps[c],
+                    "running": self.running[c],
+                    "queued": len(queued),
+                    "oldest_wait": round(max((now - w.enqueued for w in queued), default=0.0), 1),
+                    "admitted": self.admitted[c],
+                    "mean_wait": round(self.wait_total[c] / self.admitted[c], 1) if self.admitted[c] else 0.0,
+                    "max_wait": round(self.wait_max[c], 1),
+                }
+        return {"limit": total, "aging_seconds": aging, "classes": classes}
+
+
+def _hub():
+    """One scheduler per process, whichever node package's copy of this module asks."""
+    hub = sys.modules.get("_byteplus_scheduler")
+    if hub is None:
+        new = types.ModuleType("_byteplus_scheduler")
+        new.scheduler = Scheduler()
+        new.route_registered = False
+        hub = sys.modules.setdefault("_byteplus_scheduler", new)
+    return hub
+
+
+def get_scheduler() -> Scheduler:
+    return _hub().scheduler
+
+
+def scheduler_stats() -> dict:
+    stats = get_scheduler().snapshot()
+    coordinator = get_coordinator()
+    if coordinator is not None:
+        stats["shared"] = coordinator.stats()
+    return stats
+
+
+def normalize_priority(priority) -> str:
+    if priority in _CLASS_RANK:
+        return priority
+    if priority:
+        print(f"[BytePlus] Unknown priority {priority!r}, using {DEFAULT_PRIORITY}")
+    return DEFAULT_PRIORITY
+
+
+def scheduled(until_done: bool = True):
+    """
+    Decorate an API method taking params as its last argument so that it runs
+    under a scheduler slot of params["priority"]. With until_done the slot is
+    kept for the task id the method returns until poll_task() finishes with it.
+    If the API class has a check_request method it is called with the same
+    arguments first, so an invalid request fails before it queues.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            params = kwargs.get("params", args[-1] if args else None) or {}
+            check_request = getattr(self, "check_request", None)
+            if check_request is not None:
+                check_request(*args, **kwargs)
+            priority = normalize_priority(params.get("priority"))
+            scheduler = get_scheduler()
+            scheduler.acquire(priority)
+            coordinator = get_coordinator()
+            lease = None
+            try:
+                # The shared (multi-host) budget, after this host's own admission
+                if coordinator is not None:
+                    lease = coordinator.acquire_budget()
+                result = method(self, *args, **kwargs)
+            except BaseException:
+                scheduler.release(priority)
+                if coordinator is not None:
+                    coordinator.release_budget(lease)
+                raise
+            task_id = result.get("id") if until_done and isinstance(result, dict) else None
+            if task_id:
+                scheduler.bind_task(task_id, priority)
+                if coordinator is not None:
+                    coordinator.bind_budget(lease, task_id)
+            else:
+                scheduler.release(priority)
+                if coordinator is not None:
+                    coordinator.release_budget(lease)
+            return result
+        return wrapper
+    return decorate
+
+
+def register_metrics_route() -> bool:
+    """Serve scheduler_stats() on ComfyUI's PromptServer (once per process)."""
+    server = sys.modules.get("server")
+    instance = getattr(getattr(server, "PromptServer", None), "instance", None)
+    if instance is None:
+        return False
+    hub = _hub()
+    if hub.route_registered:
+        return True
+    hub.route_registered = True
+
+    async def _scheduler_metrics(request):
+        from aiohttp import web
+        return web.json_response(scheduler_stats())
+
+    instance.routes.get(METRICS_ROUTE)(_scheduler_metrics)
+    return True
+
+register_metrics_route()
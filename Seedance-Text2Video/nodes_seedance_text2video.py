@@ -9,16 +9,8 @@ Compatible with ComfyUI 0.3.59 and 0.4.x
 """
 
 import os
-import time
-import requests
 from typing import Dict, Any, Optional
 
-try:
-    from dotenv import load_dotenv
-    DOTENV_AVAILABLE = True
-except ImportError:
-    DOTENV_AVAILABLE = False
-
 # optional (only used by utils if available)
 try:
     import folder_paths  # noqa: F401
@@ -28,6 +20,9 @@ except ImportError:
 
 # ✅ 关键：使用相对导入（同目录内）
 from .byteplus_video_utils import download_url_to_video_output, download_url_to_image_output, create_empty_video_object
+from .byteplus_api_utils import load_env, get_api_client, create_session, is_interrupt, poll_task, region_env, task_callback_url, DEFAULT_BASE_URL
+from .byteplus_scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, scheduled
+from .byteplus_capabilities import validate_request
 
 
 def _extract_video_url_from_result(result: Dict[str, Any]) -> Optional[str]:
@@ -85,24 +80,34 @@ def _extract_last_frame_url_from_result(result: Dict[str, Any]) -> Optional[str]
 class SeedanceText2VideoAPI:
     """Handles API calls to Seedance Text-to-Video service"""
 
-    def __init__(self):
-        if DOTENV_AVAILABLE:
-            load_dotenv()
+    def __init__(self, region=None):
+        load_env()
 
-        self.api_key = os.getenv('ARK_API_KEY')
+        # region: a RegionProfile when ARK_REGIONS routing is on, see get_api_client()
+        self.region = region
+        self.api_key = region.api_key if region else os.getenv('ARK_API_KEY')
         if not self.api_key:
             raise ValueError("ARK_API_KEY environment variable is required")
 
-        self.base_url = os.getenv('ARK_API_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3')
+        self.base_url = region.base_url if region else os.getenv('ARK_API_BASE_URL', DEFAULT_BASE_URL)
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
         }
+        # Pooled HTTP session, reused for as long as this client is cached
+        self.session = create_session()
 
+    def check_request(self, prompt: str, params: Dict[str, Any]) -> None:
+        """Reject parameters the model does not support before queueing (see byteplus_capabilities)"""
+        validate_request("t2v", params)
+
+    @scheduled()
     def generate_video(self, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        import requests
+
         # 从环境变量获取模型名称
-        lite_model = os.getenv('SEEDANCE_LITE_T2V_MODEL', 'seedance-1-0-lite-t2v-250428')
-        pro_model = os.getenv('SEEDANCE_PRO_MODEL', 'seedance-1-0-pro-250528')
+        lite_model = region_env(self.region, 'SEEDANCE_LITE_T2V_MODEL', 'seedance-1-0-lite-t2v-250428')
+        pro_model = region_env(self.region, 'SEEDANCE_PRO_MODEL', 'seedance-1-0-pro-250528')
 
         # 映射用户选择到实际模型名称
         model_mapping = {
@@ -131,6 +136,9 @@ class SeedanceText2VideoAPI:
             "return_last_frame": True,  # 布尔值，用于获取最后一帧图片
             "content": [{"type": "text", "text": text_content}],
         }
+        callback_url = task_callback_url()
+        if callback_url:
+            payload["callback_url"] = callback_url
 
         # 调试输出
         print(f"[Seedance Debug] User selected model: {params.get('model')}")
@@ -139,7 +147,7 @@ class SeedanceText2VideoAPI:
         print(f"[Seedance Debug] API endpoint: {self.base_url}/contents/generations/tasks")
 
         try:
-            r = requests.post(
+            r = self.session.post(
                 f"{self.base_url}/contents/generations/tasks",
                 headers=self.headers,
                 json=payload,
@@ -159,7 +167,7 @@ class SeedanceText2VideoAPI:
             raise
 
     def get_task_status(self, task_id: str) -> Dict[str, Any]:
-        r = requests.get(
+        r = self.session.get(
             f"{self.base_url}/contents/generations/tasks/{task_id}",
             headers=self.headers,
             timeout=60,
@@ -170,25 +178,15 @@ class SeedanceText2VideoAPI:
     def wait_for_completion(
         self,
         task_id: str,
-        max_wait_time: int = 300,
+        max_wait_time: Optional[int] = None,
         poll_interval: int = 5,
+        params: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
-        start = time.time()
-        while time.time() - start < max_wait_time:
-            result = self.get_task_status(task_id)
-            status = result.get('status')
-
-            if status == 'succeeded':
-                return result
-            if status == 'failed':
-                raise RuntimeError(f"Video generation failed: {result.get('error', 'Unknown error')}")
-            if status in ('queued', 'running'):
-                time.sleep(poll_interval)
-                continue
-
-            raise RuntimeError(f"Unknown status: {status}")
-
-        raise RuntimeError(f"Task {task_id} did not complete within {max_wait_time} seconds")
+        """
+        Poll until done; cancels the remote task on interrupt or timeout (see poll_task).
+        Without max_wait_time the deadline is derived from params (model, resolution, duration).
+        """
+        return poll_task(self, task_id, max_wait_time=max_wait_time, poll_interval=poll_interval, params=params)
 
 
 class SeedanceText2VideoNode:
@@ -206,7 +204,10 @@ class SeedanceText2VideoNode:
                 "seed": ("INT", {"default": 1, "min": -1, "max": 2**32 - 1, "step": 1}),
                 "camera_fixed": ("BOOLEAN", {"default": False}),
                 "watermark": ("BOOLEAN", {"default": True}),
-            }
+            },
+            "optional": {
+                "priority": (list(PRIORITY_CLASSES), {"default": DEFAULT_PRIORITY}),
+            },
         }
 
     RETURN_TYPES = ("VIDEO", "IMAGE", "STRING")
@@ -243,9 +244,10 @@ class SeedanceText2VideoNode:
         seed: int,
         camera_fixed: bool,
         watermark: bool,
+        priority: str = DEFAULT_PRIORITY,
     ):
         try:
-            api = SeedanceText2VideoAPI()
+            api = get_api_client(SeedanceText2VideoAPI)
             params = {
                 "model": model,
                 "resolution": resolution,
@@ -253,6 +255,7 @@ class SeedanceText2VideoNode:
                 "duration": duration,
                 "camera_fixed": camera_fixed,
                 "watermark": watermark,
+                "priority": priority,
             }
             if seed != -1:
                 params["seed"] = seed
@@ -275,7 +278,7 @@ class SeedanceText2VideoNode:
             print(f"[Seedance] Task ID: {task_id}")
 
             print("[Seedance] Waiting for video generation to complete...")
-            done = api.wait_for_completion(task_id)
+            done = api.wait_for_completion(task_id, params=params)
             
             # 增强的完成响应信息输出
             print("=" * 60)
@@ -297,13 +300,13 @@ class SeedanceText2VideoNode:
             print(f"[Seedance] Last Frame URL: {last_frame_url}")
 
             # 下载并封装为真正的 VIDEO 对象
-            video_obj = download_url_to_video_output(video_url)
+            video_obj = download_url_to_video_output(video_url, task_id=task_id, session=api.session)
             
             # 下载并封装为 IMAGE 对象
             last_frame_obj = None
             if last_frame_url:
                 try:
-                    last_frame_obj = download_url_to_image_output(last_frame_url)
+                    last_frame_obj = download_url_to_image_output(last_frame_url, task_id=task_id, session=api.session)
                     print("[Seedance] Last frame image downloaded successfully")
                 except Exception as img_e:
                     print(f"[Seedance] Warning: Failed to download last frame image: {img_e}")
@@ -329,6 +332,8 @@ class SeedanceText2VideoNode:
             return (video_obj, last_frame_obj, response_info)
 
         except Exception as e:
+            if is_interrupt(e):
+                raise
             print(f"[Seedance] ❌ 生成视频时出错: {str(e)}")
             
             # 错误情况下的响应信息
@@ -1,33 +1,91 @@
 import os
 import time
-import requests
-from typing import Dict, Any, Tuple
-from PIL import Image
-import numpy as np
-import tempfile
+import threading
+from typing import TYPE_CHECKING, Dict, Any, Tuple
 import io
-import torch
 import base64
-from dotenv import load_dotenv
+
+# requests / numpy / PIL / torch are imported lazily inside the methods that
+# use them so that registering the node at ComfyUI startup stays cheap.
+from .byteplus_api_utils import load_env, get_api_client, create_session, interrupt_scope, is_interrupt, region_env, DEFAULT_BASE_URL
+from .byteplus_scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, scheduled
+from .byteplus_capabilities import validate_request
+from .byteplus_transport import JSONBody, image_reference, upload_image as _upload_image
+from .byteplus_image_utils import download_image as _download_image, download_images_to_batch, \
+    images_to_batch
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+SIZE_PRESETS = {
+    "2048x2048 (1:1)": (2048, 2048),
+    "2304x1728 (4:3)": (2304, 1728),
+    "1728x2304 (3:4)": (1728, 2304),
+    "2560x1440 (16:9)": (2560, 1440),
+    "1440x2560 (9:16)": (1440, 2560),
+    "2496x1664 (3:2)": (2496, 1664),
+    "1664x2496 (2:3)": (1664, 2496),
+    "3024x1296 (21:9)": (3024, 1296),
+    "4096x4096 (1:1)": (4096, 4096),
+}
+
+
+# Memory of the output batch: float16 halves float32; max_side shrinks each
+# image, e.g. for previews (JPEGs are decoded at reduced scale, other formats
+# decoded and then resized, see byteplus_image_utils). Both keep IMAGE's 0-1 float range
+# (uint8 tensors would break every node that computes 255 * image).
+OUTPUT_DTYPES = ("float32", "float16")
+OUTPUT_OPTIONS = {
+    "output_dtype": (list(OUTPUT_DTYPES), {"default": "float32",
+                                           "tooltip": "float32 is the ComfyUI default; float16 halves memory"}),
+    "max_side": ("INT", {"default": 0, "min": 0, "max": 4096, "step": 64,
+                         "tooltip": "Downscale outputs so no side exceeds this (0 = full size); "
+                                    "JPEGs are decoded at reduced scale"}),
+}
+
+
+def match_input_size(width: int, height: int, pixels: int = 2048 * 2048) -> Tuple[int, int]:
+    """An output size with the input's aspect ratio and about `pixels` pixels, in steps of 64"""
+    # The service takes aspect ratios between 1:16 and 16:1
+    ratio = min(max(width / height, 1 / 16), 16)
+    out_w = max(64, round((pixels * ratio) ** 0.5 / 64) * 64)
+    out_h = max(64, round((pixels / ratio) ** 0.5 / 64) * 64)
+    return out_w, out_h
+
+
+def _image_to_png(img_tensor) -> bytes:
+    """Encode one [H, W, C] image tensor with values in [0, 1] as PNG bytes, in memory"""
+    import numpy as np
+    from PIL import Image
+
+    img_np = (img_tensor.cpu().numpy() * 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(img_np).save(buffer, format="PNG")
+    return buffer.getvalue()
+
 
 class SeedreamAPI:
     """Handles API calls to Seedream 4.0 service"""
 
-    def __init__(self):
+    def __init__(self, region=None):
         # Load environment variables from .env file
-        load_dotenv()
-        self.api_key = os.getenv("ARK_API_KEY")
+        load_env()
+        # region: a RegionProfile when ARK_REGIONS routing is on, see get_api_client()
+        self.region = region
+        self.api_key = region.api_key if region else os.getenv("ARK_API_KEY")
         if not self.api_key:
             raise ValueError("ARK_API_KEY not found in .env file")
         
         # Load model ID from environment variable
-        self.default_model_id = os.getenv("MODEL_SEEDANCE_ID", "doubao-seedream-4-0-250828")
+        self.default_model_id = region_env(region, "MODEL_SEEDANCE_ID", "doubao-seedream-4-0-250828")
 
-        self.base_url = os.getenv('ARK_API_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3')
+        self.base_url = region.base_url if region else os.getenv('ARK_API_BASE_URL', DEFAULT_BASE_URL)
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        # Pooled HTTP session, reused for as long as this client is cached
+        self.session = create_session()
 
     def encode_image_to_base64(self, image_data: bytes) -> str:
         """Encode image data to base64 string"""
@@ -35,20 +93,18 @@ class SeedreamAPI:
 
     def upload_image(self, image_data: bytes, filename: str) -> str:
         """Upload image and return URL"""
-        upload_endpoint = f"{self.base_url}/files"
-        files = {'file': (filename, image_data, 'image/png')}
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-
-        response = requests.post(upload_endpoint, headers=headers, files=files)
-        response.raise_for_status()
-        result = response.json()
-        return result.get("url") or result.get("file_url")
+        return _upload_image(self, image_data, filename)
 
     def image_to_base64_data_url(self, image_data: bytes, format: str = "png") -> str:
         """Convert image bytes to base64 data URL"""
         base64_str = self.encode_image_to_base64(image_data)
         return f"data:image/{format};base64,{base64_str}"
 
+    def check_request(self, prompt: str, params: Dict[str, Any]) -> None:
+        """Reject sizes, image counts or oversized inputs before queueing (see byteplus_capabilities)"""
+        validate_request("seedream", params, params.get("image_data") or [])
+
+    @scheduled(until_done=False)
     def generate_image(self, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """Submit image generation task"""
         endpoint = f"{self.base_url}/images/generations"
@@ -60,8 +116,13 @@ class SeedreamAPI:
         # Create size string in "widthxheight" format
         size = f"{width}x{height}"
 
+        model = params.get("model", self.default_model_id)
+        # The UI lists the global model name; a routed client uses its region's name for it
+        if self.region and model == os.getenv("MODEL_SEEDANCE_ID", "doubao-seedream-4-0-250828"):
+            model = self.default_model_id
+
         payload = {
-            "model": params.get("model", self.default_model_id),
+            "model": model,
             "prompt": prompt,
             "sequential_image_generation": params.get("sequential_image_generation", "disabled"),
             "response_format": "url",
@@ -84,15 +145,14 @@ class SeedreamAPI:
                 "max_images": params.get("max_images", 1)
             }
 
-        response = requests.post(endpoint, headers=self.headers, json=payload)
+        # Inline input images are base64-encoded while the body is sent
+        response = self.session.post(endpoint, headers=self.headers, data=JSONBody(payload))
         response.raise_for_status()
         return response.json()
 
-    def download_image(self, image_url: str) -> Image.Image:
-        """Download image from URL"""
-        response = requests.get(image_url)
-        response.raise_for_status()
-        return Image.open(io.BytesIO(response.content))
+    def download_image(self, image_url: str, max_side: int = 0) -> "Image.Image":
+        """Download image from URL, streaming the body straight into the decoder"""
+        return _download_image(image_url, session=self.session, max_side=max_side)
 
 class Seedream4Node:
     """ComfyUI node for Seedream 4.0 image generation"""
@@ -100,7 +160,7 @@ class Seedream4Node:
     @classmethod
     def INPUT_TYPES(cls):
         # Load default model ID from environment variable
-        load_dotenv()
+        load_env()
         default_model = os.getenv("MODEL_SEEDANCE_ID", "doubao-seedream-4-0-250828")
         
         return {
@@ -111,18 +171,7 @@ class Seedream4Node:
                     "default": "",
                     "placeholder": "Enter your image prompt"
                 }),
-                "size_preset": ([
-                    "Custom",
-                    "2048x2048 (1:1)",
-                    "2304x1728 (4:3)",
-                    "1728x2304 (3:4)",
-                    "2560x1440 (16:9)",
-                    "1440x2560 (9:16)",
-                    "2496x1664 (3:2)",
-                    "1664x2496 (2:3)",
-                    "3024x1296 (21:9)",
-                    "4096x4096 (1:1)"
-                ], {
+                "size_preset": (["Custom"] + list(SIZE_PRESETS), {
                     "default": "Custom"
                 }),
                 "width": ("INT", {
@@ -153,12 +202,14 @@ class Seedream4Node:
                 "watermark": ("BOOLEAN", {
                     "default": True
                 }),
-                "image_encoding": (["url", "base64"], {
-                    "default": "base64"
+                "image_encoding": (["auto", "url", "base64"], {
+                    "default": "auto"
                 })
             },
             "optional": {
                 "input_images": ("IMAGE",),
+                "priority": (list(PRIORITY_CLASSES), {"default": DEFAULT_PRIORITY}),
+                **OUTPUT_OPTIONS,
             }
         }
 
@@ -167,82 +218,59 @@ class Seedream4Node:
     CATEGORY = "BytePlus/Seedream"
 
     def generate(self, model: str, prompt: str, size_preset: str,
-                width: int, height: int, sequential_image_generation: str, max_images: int, seed: int, watermark: bool, image_encoding: str, input_images=None):
+                width: int, height: int, sequential_image_generation: str, max_images: int, seed: int, watermark: bool, image_encoding: str, input_images=None,
+                priority: str = DEFAULT_PRIORITY, output_dtype: str = "float32", max_side: int = 0):
         """Execute image generation"""
-
         if not prompt:
             raise ValueError("Prompt is required")
 
         # Apply size preset if not Custom
-        if size_preset != "Custom":
-            preset_sizes = {
-                "2048x2048 (1:1)": (2048, 2048),
-                "2304x1728 (4:3)": (2304, 1728),
-                "1728x2304 (3:4)": (1728, 2304),
-                "2560x1440 (16:9)": (2560, 1440),
-                "1440x2560 (9:16)": (1440, 2560),
-                "2496x1664 (3:2)": (2496, 1664),
-                "1664x2496 (2:3)": (1664, 2496),
-                "3024x1296 (21:9)": (3024, 1296),
-                "4096x4096 (1:1)": (4096, 4096)
-            }
-            if size_preset in preset_sizes:
-                width, height = preset_sizes[size_preset]
+        if size_preset in SIZE_PRESETS:
+            width, height = SIZE_PRESETS[size_preset]
 
-        # Initialize API client
-        api = SeedreamAPI()
+        # Prepare parameters - pass width and height directly
+        params = {
+            "model": model,
+            "width": width,
+            "height": height,
+            "sequential_image_generation": sequential_image_generation,
+            "max_images": max_images,
+            "seed": seed,
+            "watermark": watermark,
+            "image_data": None,
+            "priority": priority,
+        }
 
-        # Handle input images if provided
-        image_data = []
-        input_image_count = 0
-        if input_images is not None and sequential_image_generation == "auto":
+        # Input images are only sent with sequential generation
+        use_inputs = input_images is not None and sequential_image_generation == "auto"
+        if use_inputs:
             # Limit input images to ensure total doesn't exceed 15
             max_input_images = min(input_images.shape[0], 15 - max_images)
 
             if max_input_images <= 0:
                 raise ValueError(f"max_images ({max_images}) is too large. Total images (input + generated) cannot exceed 15.")
 
-            # Convert tensor images to PIL
-            for i in range(max_input_images):
-                img_tensor = input_images[i]
-                img_np = (img_tensor.cpu().numpy() * 255).astype(np.uint8)
-                pil_img = Image.fromarray(img_np)
+        # Check sizes and counts before anything is encoded or uploaded
+        validate_request("seedream", params, [input_images[i] for i in range(max_input_images)] if use_inputs else [])
+
+        # Initialize API client
+        api = get_api_client(SeedreamAPI)
 
-                # Convert to bytes
-                img_bytes = io.BytesIO()
-                pil_img.save(img_bytes, format='PNG')
-                img_bytes.seek(0)
-                img_data = img_bytes.getvalue()
+        # Handle input images if provided
+        image_data = []
+        if use_inputs:
+            # Encode each tensor image to PNG in memory
+            for i in range(max_input_images):
+                img_data = _image_to_png(input_images[i])
 
                 try:
-                    if image_encoding == "base64":
-                        # Use base64 encoding
-                        base64_data_url = api.image_to_base64_data_url(img_data, "png")
-                        image_data.append(base64_data_url)
-                    else:
-                        # Upload image and get URL
-                        image_url = api.upload_image(img_data, f"input_{i}.png")
-                        image_data.append(image_url)
-                    input_image_count += 1
+                    # auto: inline or upload per image by size and upload speed, see byteplus_transport
+                    mode = None if image_encoding == "auto" else image_encoding
+                    image_data.append(image_reference(api, img_data, "png", f"input_{i}.png", mode=mode))
                 except Exception as e:
                     print(f"Warning: Failed to process image {i}: {e}")
 
-            # Validate total image count
-            total_images = input_image_count + max_images
-            if total_images > 15:
-                raise ValueError(f"Total images ({input_image_count} input + {max_images} generated = {total_images}) cannot exceed 15.")
-
-        # Prepare parameters - pass width and height directly
-        params = {
-            "model": model,
-            "width": width,
-            "height": height,
-            "sequential_image_generation": sequential_image_generation,
-            "max_images": max_images,
-            "seed": seed,
-            "watermark": watermark,
-            "image_data": image_data if image_data else None
-        }
+        params["image_data"] = image_data if image_data else None
 
         try:
             # Submit generation task
@@ -250,43 +278,34 @@ class Seedream4Node:
 
             # Handle direct response with URLs
             if "data" in response:
-                images = []
-                for item in response["data"]:
-                    image_url = item.get("url")
-                    if image_url:
-                        pil_image = api.download_image(image_url)
-
-                        # Convert PIL image to tensor (ComfyUI format)
-                        img_array = np.array(pil_image).astype(np.float32) / 255.0
-                        if len(img_array.shape) == 2:
-                            img_array = np.expand_dims(img_array, axis=-1)
-                            img_array = np.repeat(img_array, 3, axis=-1)
-                        elif img_array.shape[-1] == 4:
-                            img_array = img_array[:, :, :3]
-
-                        images.append(img_array)
-
-                if not images:
+                urls = [item.get("url") for item in response["data"] if item.get("url")]
+                if not urls:
                     raise RuntimeError("No images generated")
 
-                # Stack images into batch
-                batch = torch.from_numpy(np.stack(images))
+                # Decode each download straight into one preallocated [N, H, W, 3] tensor (ComfyUI format)
+                batch = download_images_to_batch(urls, session=api.session, dtype=output_dtype, max_side=max_side)
                 return (batch,)
             else:
                 raise RuntimeError("Invalid API response format")
 
         except Exception as e:
+            if is_interrupt(e):
+                raise
             raise RuntimeError(f"Seedream generation failed: {str(e)}")
 
 class Seedream4ImageToImageNode:
-    """ComfyUI node for Seedream 4.0 image-to-image generation"""
+    """
+    ComfyUI node for Seedream 4.0 image-to-image generation: each image of the
+    input batch is sent as the image of its own request, up to max_parallel
+    at a time, and the results come back as one batch in input order.
+    """
 
     @classmethod
     def INPUT_TYPES(cls):
         # Load default model ID from environment variable
-        load_dotenv()
+        load_env()
         default_model = os.getenv("MODEL_SEEDANCE_ID", "doubao-seedream-4-0-250828")
-        
+
         return {
             "required": {
                 "image": ("IMAGE",),
@@ -294,13 +313,10 @@ class Seedream4ImageToImageNode:
                 "prompt": ("STRING", {
                     "multiline": True,
                     "default": "",
-                    "placeholder": "Enter your image prompt"
+                    "placeholder": "Describe the edit"
                 }),
-                "strength": ("FLOAT", {
-                    "default": 0.75,
-                    "min": 0.0,
-                    "max": 1.0,
-                    "step": 0.05
+                "size_preset": (["Match input"] + list(SIZE_PRESETS), {
+                    "default": "Match input"
                 }),
                 "seed": ("INT", {
                     "default": 0,
@@ -309,7 +325,16 @@ class Seedream4ImageToImageNode:
                 }),
                 "watermark": ("BOOLEAN", {
                     "default": True
+                }),
+                "image_encoding": (["auto", "url", "base64"], {
+                    "default": "auto"
                 })
+            },
+            "optional": {
+                "priority": (list(PRIORITY_CLASSES), {"default": DEFAULT_PRIORITY}),
+                "max_parallel": ("INT", {"default": 4, "min": 1, "max": 16, "step": 1,
+                                         "tooltip": "Batch input: requests sent at the same time"}),
+                **OUTPUT_OPTIONS,
             }
         }
 
@@ -317,42 +342,90 @@ class Seedream4ImageToImageNode:
     FUNCTION = "generate"
     CATEGORY = "BytePlus/Seedream"
 
-    def generate(self, image, model: str, prompt: str,
-                strength: float, seed: int, watermark: bool):
+    def generate(self, image, model: str, prompt: str, size_preset: str, seed: int, watermark: bool,
+                 image_encoding: str, priority: str = DEFAULT_PRIORITY, max_parallel: int = 4,
+                 output_dtype: str = "float32", max_side: int = 0):
         """Execute image-to-image generation"""
+        from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 
         if not prompt:
             raise ValueError("Prompt is required")
+        if not hasattr(image, "shape") or len(image.shape) != 4:
+            raise ValueError("Invalid image format")
 
-        # Convert tensor to PIL image
-        if isinstance(image, torch.Tensor):
-            image_np = (image[0].cpu().numpy() * 255).astype(np.uint8)
-            pil_image = Image.fromarray(image_np)
+        batch, in_height, in_width = int(image.shape[0]), int(image.shape[1]), int(image.shape[2])
+        if size_preset in SIZE_PRESETS:
+            width, height = SIZE_PRESETS[size_preset]
         else:
-            raise ValueError("Invalid image format")
+            width, height = match_input_size(in_width, in_height)
 
-        # Save image to temporary file for upload
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_file:
-            pil_image.save(tmp_file.name, "PNG")
-            tmp_path = tmp_file.name
+        params = {
+            "model": model,
+            "width": width,
+            "height": height,
+            "sequential_image_generation": "disabled",
+            "seed": seed,
+            "watermark": watermark,
+            "image_data": None,
+            "priority": priority,
+        }
+        # Every item has the same size, so checking the first covers the batch
+        validate_request("seedream", params, [image[0]])
+
+        api = get_api_client(SeedreamAPI)
+        mode = None if image_encoding == "auto" else image_encoding
+
+        def run(i):
+            # Encoded in memory; inline images are base64-encoded while the request is sent
+            reference = image_reference(api, _image_to_png(image[i]), "png", f"input_{i}.png", mode=mode)
+            response = api.generate_image(prompt, {**params, "image_data": [reference]})
+            urls = [item.get("url") for item in response.get("data") or [] if item.get("url")]
+            if not urls:
+                raise RuntimeError(f"No image in response: {response}")
+            return [api.download_image(url, max_side=max_side) for url in urls]
+
+        workers = max(1, min(int(max_parallel), batch))
+        if batch > 1:
+            print(f"[Seedream] Image-to-image batch of {batch}: {workers} requests at a time")
+        failures = []
+
+        interrupted = threading.Event()
+
+        def attempt(i):
+            # One interrupt flag for the whole batch, also seen by the scheduler and lease waits
+            with interrupt_scope(interrupted):
+                try:
+                    return run(i)
+                except Exception as e:
+                    if is_interrupt(e):
+                        raise
+                    failures.append(f"image {i + 1}: {e}")
+                    return []
 
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="seedream-i2i")
+        futures = [pool.submit(attempt, i) for i in range(batch)]
         try:
-            # Initialize API client
-            api = SeedreamAPI()
-
-            # Note: The current API doesn't support image-to-image in the provided example
-            # This would need to be implemented based on the actual img2img endpoint
-            raise NotImplementedError("Image-to-image functionality not yet implemented for this API version")
-
+            # Only an interrupt escapes an item; raise it without waiting for the others
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                future.result()
+            results = [future.result() for future in futures]
         finally:
-            # Clean up temporary file
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+            # On an interrupt, images not started yet are dropped
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if failures:
+            raise RuntimeError(f"Seedream image-to-image failed for {len(failures)}/{batch} images: "
+                               + "; ".join(sorted(failures)))
+        # Same download/decode path as Seedream4Node: one preallocated [N, H, W, 3] tensor
+        return (images_to_batch([img for images in results for img in images], dtype=output_dtype),)
 
 NODE_CLASS_MAPPINGS = {
     "Seedream4": Seedream4Node,
+    "Seedream4ImageToImage": Seedream4ImageToImageNode,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "Seedream4": "Seedream 4.0",
-}
\ No newline at end of file
+    "Seedream4ImageToImage": "Seedream 4.0 Image to Image",
+}
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Import-time benchmark for the BytePlus node packages.
+
+Each package is imported the way ComfyUI does it (spec_from_file_location on
+the package __init__.py) in a fresh interpreter, so module caches from one run
+never leak into the next. For every package we report:
+
+- cold import time of the package
+- which heavy modules (torch, numpy, PIL, requests, dotenv, cv2) were pulled in
+- the average cost of one INPUT_TYPES() call (ComfyUI calls it for every
+  /object_info request)
+
+Usage:
+    python benchmarks/bench_import_time.py [--tree PATH] [--runs N]
+
+To compare against an older revision, check it out with `git worktree add`
+and point --tree at it.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PACKAGES = [
+    "Seedance-Text2Video",
+    "Seedance-Image2Video",
+    "Seedance-FirstLastFrame",
+    "Seedance-Refs2Video",
+    "Seedream4.0",
+]
+
+HEAVY_MODULES = ["torch", "numpy", "PIL", "requests", "dotenv", "cv2"]
+
+_CHILD = r"""
+import importlib.util, json, os, sys, time
+pkg_dir, heavy = sys.argv[1], sys.argv[2].split(",")
+name = "bench_" + os.path.basename(pkg_dir).replace("-", "_").replace(".", "_")
+t0 = time.perf_counter()
+spec = importlib.util.spec_from_file_location(
+    name, os.path.join(pkg_dir, "__init__.py"), submodule_search_locations=[pkg_dir]
+)
+module = importlib.util.module_from_spec(spec)
+sys.modules[name] = module
+spec.loader.exec_module(module)
+import_s = time.perf_counter() - t0
+loaded = [m for m in heavy if m in sys.modules]
+calls = 200
+t0 = time.perf_counter()
+for _ in range(calls):
+    for cls in module.NODE_CLASS_MAPPINGS.values():
+        cls.INPUT_TYPES()
+input_types_s = (time.perf_counter() - t0) / calls
+print(json.dumps({"import_s": import_s, "heavy": loaded, "input_types_s": input_types_s}))
+"""
+
+
+def _run_once(pkg_dir: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD, pkg_dir, ",".join(HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tree", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="repository checkout to benchmark (default: this one)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per package")
+    args = parser.parse_args()
+
+    print(f"tree: {args.tree}")
+    print(f"{'package':<26}{'import ms':>12}{'INPUT_TYPES us':>17}  heavy modules loaded")
+    total = 0.0
+    for pkg in PACKAGES:
+        pkg_dir = os.path.join(args.tree, pkg)
+        if not os.path.isdir(pkg_dir):
+            continue
+        runs = [_run_once(pkg_dir) for _ in range(args.runs)]
+        import_ms = statistics.median(r["import_s"] for r in runs) * 1000
+        input_types_us = statistics.median(r["input_types_s"] for r in runs) * 1e6
+        total += import_ms
+        heavy = ", ".join(runs[0]["heavy"]) or "-"
+        print(f"{pkg:<26}{import_ms:>12.1f}{input_types_us:>17.1f}  {heavy}")
+    print(f"{'total':<26}{total:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
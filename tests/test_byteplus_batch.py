@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the headless batch runner (tools/byteplus_batch.py): manifest
+parsing, value coercion and the choice between resuming, retrying and
+skipping a job. Video jobs run against a fake API class; nothing leaves the
+machine.
+
+Run with: python -m pytest tests
+"""
+
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_batch():
+    name = "test_byteplus_batch_tool"
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, "tools", "byteplus_batch.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+batch = _load_batch()
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return str(path)
+
+
+def _write_results(out_dir, *records):
+    _write(os.path.join(out_dir, "results.jsonl"), "".join(json.dumps(r) + "\n" for r in records))
+
+
+def test_jsonl_manifest_numbers_rows_without_id(tmp_path):
+    path = _write(tmp_path / "jobs.jsonl",
+                  '{"kind": "t2v", "prompt": "a"}\n\n{"id": "cat", "kind": "seedream", "prompt": "b"}\n')
+    rows = batch.read_manifest(path)
+    assert [row["id"] for row in rows] == ["1", "cat"]
+    assert rows[1]["prompt"] == "b"
+
+
+def test_csv_manifest_splits_lists_and_drops_empty_cells(tmp_path):
+    path = _write(tmp_path / "jobs.csv",
+                  "id,kind,prompt,images,seed\n"
+                  "r1,refs,two refs,a.png | b.png|,\n"
+                  "s1,seedream,plain,,7\n")
+    rows = batch.read_manifest(path)
+    assert rows[0]["images"] == ["a.png", "b.png"]
+    assert "seed" not in rows[0]
+    assert rows[1] == {"id": "s1", "kind": "seedream", "prompt": "plain", "seed": "7"}
+
+
+@pytest.mark.parametrize("text, message", [
+    ('{"id": "a", "kind": "t2v"}\n{"id": "a", "kind": "i2v"}\n', "duplicate job id"),
+    ('{"id": "a", "kind": "video"}\n', "unknown kind"),
+    ('{"id": "a", "kind": "t2v"\n', "invalid JSON"),
+])
+def test_bad_manifest_stops_the_run(tmp_path, text, message):
+    path = _write(tmp_path / "jobs.jsonl", text)
+    with pytest.raises(SystemExit, match=message):
+        batch.read_manifest(path)
+
+
+@pytest.mark.parametrize("value, default, expected", [
+    ("true", False, True),
+    ("0", True, False),
+    ("5", 10, 5),
+    ("2.5", 1.0, 2.5),
+    ("720p", "480p", "720p"),
+    ("x", None, "x"),
+    (3, 10, 3),
+])
+def test_coerce_follows_the_node_default(value, default, expected):
+    result = batch._coerce(value, default)
+    assert result == expected
+    assert type(result) is type(expected)
+
+
+def test_pending_and_resume_selection(tmp_path):
+    _write_results(
+        tmp_path,
+        {"id": "done", "kind": "t2v", "status": "submitted", "task_id": "cgt-done"},
+        {"id": "done", "kind": "t2v", "status": "succeeded", "task_id": "cgt-done"},
+        {"id": "polled", "kind": "t2v", "status": "submitted", "task_id": "cgt-1"},
+        {"id": "retry", "kind": "i2v", "status": "failed", "error": "boom"},
+        {"id": "image", "kind": "seedream", "status": "submitted", "task_id": "cgt-2"},
+        {"id": "odd", "kind": "t2v", "status": "queued", "task_id": "cgt-3"},
+        {"id": "moved", "kind": "t2v", "status": "submitted", "task_id": "cgt-4"},
+    )
+    with open(tmp_path / "results.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"id": "cut", "kind": "t2v", "sta')    # crashed mid-write
+    runner = batch.BatchRunner(str(tmp_path), str(tmp_path))
+    rows = [{"id": job_id, "kind": kind} for job_id, kind in
+            (("done", "t2v"), ("polled", "t2v"), ("retry", "i2v"), ("image", "seedream"),
+             ("odd", "t2v"), ("moved", "flf"), ("cut", "t2v"), ("new", "t2v"))]
+
+    assert [row["id"] for row in runner.pending(rows)] == [
+        "polled", "retry", "image", "odd", "moved", "cut", "new"]
+    assert {row["id"]: runner.resumable_task(row) for row in rows} == {
+        "done": None, "polled": "cgt-1", "retry": None, "image": None,
+        "odd": None, "moved": None, "cut": None, "new": None}
+    # Records the runner cannot have written are dropped, not trusted
+    assert "image" not in runner.previous and "odd" not in runner.previous
+
+
+class FakeVideoAPI:
+    """Stand-in for the Seedance API classes: records what the runner asks of it"""
+
+    region = None
+    session = None
+
+    def __init__(self):
+        self.calls = []
+
+    def generate_video(self, prompt, params):
+        self.calls.append(("generate_video", prompt))
+        return {"id": "cgt-new"}
+
+    def wait_for_completion(self, task_id, max_wait_time=None, params=None):
+        self.calls.append(("wait_for_completion", task_id))
+        return {"id": task_id, "status": "succeeded", "content": {"video_url": f"https://cdn.example/{task_id}.mp4"}}
+
+
+@pytest.fixture
+def fake_t2v(monkeypatch):
+    package = batch.load_package(batch.KINDS["t2v"][0])
+    api = FakeVideoAPI()
+    resumed = []
+
+    def resume_task(task_id, max_wait_time=None, fallback=None):
+        resumed.append((task_id, fallback["params"]["priority"]))
+        return {"id": task_id, "status": "succeeded", "content": {"video_url": f"https://cdn.example/{task_id}.mp4"}}
+
+    monkeypatch.setattr(package.byteplus_api_utils, "get_api_client", lambda cls: api)
+    monkeypatch.setattr(package.byteplus_coordinator, "resume_task", resume_task)
+    monkeypatch.setattr(package.byteplus_coordinator, "key_label_for_task", lambda api, task_id: "key-1")
+    monkeypatch.setattr(batch.BatchRunner, "_download", lambda self, api, url, path: path)
+    return api, resumed
+
+
+def _records(out_dir):
+    with open(os.path.join(out_dir, "results.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_submitted_task_is_resumed_not_resubmitted(tmp_path, fake_t2v):
+    api, resumed = fake_t2v
+    _write_results(tmp_path, {"id": "a", "kind": "t2v", "status": "submitted", "task_id": "cgt-old"})
+    runner = batch.BatchRunner(str(tmp_path), str(tmp_path))
+
+    record = runner.run({"id": "a", "kind": "t2v", "prompt": "a cat"})
+    assert record["status"] == "succeeded"
+    assert record["task_id"] == "cgt-old"
+    assert resumed == [("cgt-old", batch.BATCH_PRIORITY)]
+    assert api.calls == []
+
+
+def test_failed_job_is_submitted_again(tmp_path, fake_t2v):
+    api, resumed = fake_t2v
+    _write_results(tmp_path, {"id": "a", "kind": "t2v", "status": "failed", "task_id": "cgt-old"})
+    runner = batch.BatchRunner(str(tmp_path), str(tmp_path))
+
+    record = runner.run({"id": "a", "kind": "t2v", "prompt": "a cat"})
+    assert record["status"] == "succeeded"
+    assert record["outputs"] == [os.path.join(str(tmp_path), "a.mp4")]
+    assert resumed == []
+    assert api.calls == [("generate_video", "a cat"), ("wait_for_completion", "cgt-new")]
+    # The task is on record before the wait, so an interrupted run can resume it
+    assert [(r["status"], r.get("task_id")) for r in _records(tmp_path)[1:]] == [
+        ("submitted", "cgt-new"), ("succeeded", "cgt-new")]
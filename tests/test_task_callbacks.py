@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the task completion callbacks of byteplus_api_utils (shared
+verbatim by every package; the Text2Video copy is tested). Everything runs
+against local stand-ins: a fake ARK client, a fake ComfyUI PromptServer and
+the standalone listener on an ephemeral localhost port.
+
+Run with: python -m pytest tests
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+import types
+import urllib.error
+import urllib.request
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIR = os.path.join(ROOT, "Seedance-Text2Video")
+
+
+def _load_api_utils():
+    name = "test_seedance_text2video"
+    if name not in sys.modules:
+        # Imported the way ComfyUI does it, so the relative imports resolve
+        spec = importlib.util.spec_from_file_location(
+            name, os.path.join(PACKAGE_DIR, "__init__.py"), submodule_search_locations=[PACKAGE_DIR]
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[f"{name}.byteplus_api_utils"]
+
+
+api_utils = _load_api_utils()
+
+
+@pytest.fixture(autouse=True)
+def fresh_callbacks(monkeypatch):
+    """A new callback hub per test, no callback settings, no ComfyUI server."""
+    for name in ("TASK_CALLBACK_URL", "TASK_CALLBACK_LISTEN", "TASK_CALLBACK_POLL_INTERVAL"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.delitem(sys.modules, "_byteplus_callback_hub", raising=False)
+    monkeypatch.delitem(sys.modules, "server", raising=False)
+    yield
+    listener = getattr(sys.modules.get("_byteplus_callback_hub"), "listener", None)
+    if listener is not None:
+        listener.shutdown()
+        listener.server_close()
+
+
+class FakePromptServer:
+    """Records the routes a node package adds to ComfyUI's server"""
+
+    def __init__(self):
+        self.handlers = {}
+        outer = self
+
+        class Routes:
+            def post(self, path):
+                def add(handler):
+                    outer.handlers[path] = handler
+                    return handler
+                return add
+
+        self.routes = Routes()
+
+
+def _install_prompt_server(monkeypatch):
+    instance = FakePromptServer()
+    server = types.ModuleType("server")
+    server.PromptServer = types.SimpleNamespace(instance=instance)
+    monkeypatch.setitem(sys.modules, "server", server)
+    return instance
+
+
+def _post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), method="POST",
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def _local_url(listener, token=None):
+    url = f"http://127.0.0.1:{listener.server_address[1]}{api_utils.CALLBACK_ROUTE}"
+    return url if token is None else f"{url}?token={token}"
+
+
+def test_no_route_without_callback_url(monkeypatch):
+    server = _install_prompt_server(monkeypatch)
+    assert api_utils.register_callback_route() is False
+    assert server.handlers == {}
+    assert api_utils.task_callback_url() is None
+
+
+def test_no_route_when_the_standalone_listener_receives(monkeypatch):
+    server = _install_prompt_server(monkeypatch)
+    monkeypatch.setenv("TASK_CALLBACK_URL", "https://comfy.example.com/byteplus/task_callback")
+    monkeypatch.setenv("TASK_CALLBACK_LISTEN", "127.0.0.1:0")
+    assert api_utils.register_callback_route() is False
+    assert server.handlers == {}
+
+
+def test_route_registered_when_enabled(monkeypatch):
+    server = _install_prompt_server(monkeypatch)
+    monkeypatch.setenv("TASK_CALLBACK_URL", "https://comfy.example.com/byteplus/task_callback?token=s3cret")
+    assert api_utils.register_callback_route() is True
+    assert list(server.handlers) == [api_utils.CALLBACK_ROUTE]
+
+
+def test_callback_url_keeps_its_token(monkeypatch):
+    monkeypatch.setenv("TASK_CALLBACK_URL", "https://comfy.example.com/byteplus/task_callback?token=s3cret")
+    assert api_utils.task_callback_url().endswith("?token=s3cret")
+
+
+def test_callback_url_gets_a_generated_token(monkeypatch):
+    monkeypatch.setenv("TASK_CALLBACK_URL", "https://comfy.example.com/byteplus/task_callback?x=1")
+    url = api_utils.task_callback_url()
+    token = parse_qs(urlsplit(url).query)["token"][0]
+    assert len(token) >= 16
+    assert api_utils.task_callback_url() == url
+
+
+def test_listener_starts_even_with_a_comfyui_server(monkeypatch):
+    _install_prompt_server(monkeypatch)
+    monkeypatch.setenv("TASK_CALLBACK_URL", "http://127.0.0.1/byteplus/task_callback?token=s3cret")
+    monkeypatch.setenv("TASK_CALLBACK_LISTEN", "127.0.0.1:0")
+    api_utils.register_callback_route()
+    assert api_utils.task_callback_url() is not None
+    assert sys.modules["_byteplus_callback_hub"].listener is not None
+
+
+def test_listener_rejects_missing_or_wrong_token(monkeypatch):
+    monkeypatch.setenv("TASK_CALLBACK_URL", "http://127.0.0.1/byteplus/task_callback?token=s3cret")
+    monkeypatch.setenv("TASK_CALLBACK_LISTEN", "127.0.0.1:0")
+    api_utils.task_callback_url()
+    listener = sys.modules["_byteplus_callback_hub"].listener
+    event = api_utils._expect_callback("cgt-1")
+
+    assert _post(_local_url(listener), {"id": "cgt-1"})[0] == 403
+    assert _post(_local_url(listener, "wrong"), {"id": "cgt-1"})[0] == 403
+    assert not event.is_set()
+    assert sys.modules["_byteplus_callback_hub"].early == {}
+
+    status, body = _post(_local_url(listener, "s3cret"), {"id": "cgt-1"})
+    assert (status, body) == (200, {"ok": True, "waiting": True})
+    assert event.is_set()
+
+
+class FakeArk:
+    """Stand-in client: the task is running until its callback has been sent"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.polls = 0
+
+    def get_task_status(self, task_id):
+        self.polls += 1
+        return {"id": task_id, "status": "succeeded" if self.done.is_set() else "running"}
+
+
+def test_callback_ends_polling_early(monkeypatch):
+    monkeypatch.setenv("TASK_CALLBACK_URL", "http://127.0.0.1/byteplus/task_callback?token=s3cret")
+    monkeypatch.setenv("TASK_CALLBACK_LISTEN", "127.0.0.1:0")
+    monkeypatch.setenv("TASK_CALLBACK_POLL_INTERVAL", "30")
+    api_utils.task_callback_url()
+    listener = sys.modules["_byteplus_callback_hub"].listener
+    ark = FakeArk()
+
+    def finish():
+        time.sleep(0.5)
+        ark.done.set()
+        _post(_local_url(listener, "s3cret"), {"id": "cgt-2", "status": "succeeded"})
+
+    threading.Thread(target=finish, daemon=True).start()
+    started = time.monotonic()
+    result = api_utils.poll_task(ark, "cgt-2", max_wait_time=20)
+    assert result["status"] == "succeeded"
+    # Without the callback the next poll would only come after 30 s
+    assert time.monotonic() - started < 5
+    assert ark.polls == 2
+
+
+def test_route_rejects_wrong_token(monkeypatch):
+    pytest.importorskip("aiohttp")
+    import asyncio
+
+    server = _install_prompt_server(monkeypatch)
+    monkeypatch.setenv("TASK_CALLBACK_URL", "https://comfy.example.com/byteplus/task_callback?token=s3cret")
+    api_utils.register_callback_route()
+    handler = server.handlers[api_utils.CALLBACK_ROUTE]
+    event = api_utils._expect_callback("cgt-3")
+
+    class Request:
+        def __init__(self, token):
+            self.query = {"token": token} if token else {}
+
+        async def json(self):
+            return {"id": "cgt-3"}
+
+    assert asyncio.run(handler(Request(None))).status == 403
+    assert asyncio.run(handler(Request("wrong"))).status == 403
+    assert not event.is_set()
+    assert asyncio.run(handler(Request("s3cret"))).status == 200
+    assert event.is_set()
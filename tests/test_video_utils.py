@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the frame decoding buffers of byteplus_video_utils (shared verbatim
+by the Seedance packages; the Text2Video copy is tested).
+
+Run with: python -m pytest tests
+"""
+
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIR = os.path.join(ROOT, "Seedance-Text2Video")
+
+
+def _load_video_utils():
+    name = "test_seedance_text2video"
+    if name not in sys.modules:
+        # Imported the way ComfyUI does it, so the relative imports resolve
+        spec = importlib.util.spec_from_file_location(
+            name, os.path.join(PACKAGE_DIR, "__init__.py"), submodule_search_locations=[PACKAGE_DIR]
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[f"{name}.byteplus_video_utils"]
+
+
+video_utils = _load_video_utils()
+
+WIDTH, HEIGHT = 8, 6
+
+
+def _frames(n):
+    """n uint8 frames, frame i filled with the value i + 1"""
+    for i in range(n):
+        yield np.full((HEIGHT, WIDTH, 3), i + 1, dtype=np.uint8)
+
+
+def _convert(real, header_total, chunk_size=16, max_frames=0, dtype="uint8"):
+    info = {"size": (WIDTH, HEIGHT), "total": header_total}
+    return video_utils._stream_to_tensor(_frames(real), info, stride=1, max_frames=max_frames,
+                                         chunk_size=chunk_size, dtype=dtype)
+
+
+def _frame_values(tensor):
+    return [int(v) for v in tensor[:, 0, 0, 0]]
+
+
+@pytest.mark.parametrize("header_total", [20, 16, 1, 0])
+def test_header_underestimate_keeps_every_frame_in_order(header_total):
+    out = _convert(36, header_total)
+    assert tuple(out.shape) == (36, HEIGHT, WIDTH, 3)
+    assert _frame_values(out) == list(range(1, 37))
+    # Every pixel of a frame was written, not only the first
+    assert bool((out == out[:, :1, :1, :1]).all())
+
+
+def test_header_overestimate_is_trimmed():
+    out = _convert(10, 40)
+    assert _frame_values(out) == list(range(1, 11))
+
+
+def test_exact_header_with_partial_last_chunk():
+    out = _convert(36, 36)
+    assert _frame_values(out) == list(range(1, 37))
+
+
+def test_max_frames_stops_decoding():
+    out = _convert(36, 20, max_frames=25)
+    assert _frame_values(out) == list(range(1, 26))
+
+
+def test_float_output_is_scaled():
+    out = _convert(36, 20, dtype="float32")
+    assert out.dtype == torch.float32
+    expected = (np.arange(1, 37, dtype=np.float32) / 255.0).tolist()
+    assert out[:, 0, 0, 0].tolist() == pytest.approx(expected)
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+Headless batch runner for the BytePlus node packages.
+
+Runs the jobs of a JSONL or CSV manifest through the same API classes the
+ComfyUI nodes use, so .env, ARK_REGIONS routing, API key pools, the priority
+scheduler, task deadlines and COORDINATOR_URL all apply unchanged. Results are
+downloaded into --out and every job event is appended to <out>/results.jsonl.
+
+Manifest rows (JSONL objects, or CSV columns with list cells split on "|"):
+    id            unique job id (default: the row number)
+    kind          t2v | i2v | flf | refs | seedream
+    prompt        text prompt
+    image         i2v: image path or URL (URLs are passed to the API as-is)
+    first_frame   flf: image path or URL
+    last_frame    flf: image path or URL
+    images        refs: 1-4 image paths or URLs
+    input_images  seedream: optional reference image paths or URLs
+    any other input of the node (model, resolution, aspect_ratio, duration,
+    seed, camera_fixed, watermark, auto_add_image_refs, width, height,
+    sequential_image_generation, max_images, priority); missing inputs take
+    the node's defaults, except priority, which defaults to "batch"
+
+Running again with the same --out resumes: succeeded jobs are skipped, jobs
+whose task was submitted but never downloaded are polled instead of being
+submitted again, and failed jobs are retried.
+
+Usage:
+    python tools/byteplus_batch.py manifest.jsonl --out renders/ [--jobs 4]
+"""
+
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# kind -> (package directory, node module, API class, node class)
+KINDS = {
+    "t2v": ("Seedance-Text2Video", "nodes_seedance_text2video", "SeedanceText2VideoAPI", "SeedanceText2VideoNode"),
+    "i2v": ("Seedance-Image2Video", "nodes_seedance_image2video", "SeedanceImage2VideoAPI", "SeedanceImage2VideoNode"),
+    "flf": ("Seedance-FirstLastFrame", "nodes_seedance_firstlastframe", "SeedanceFirstLastFrameAPI",
+            "SeedanceFirstLastFrameNode"),
+    "refs": ("Seedance-Refs2Video", "nodes_seedance_refs2video", "SeedanceRefs2VideoAPI", "SeedanceRefs2VideoNode"),
+    "seedream": ("Seedream4.0", "nodes_seedream", "SeedreamAPI", "Seedream4Node"),
+}
+
+# Node inputs that end up in the API params
+PARAMS = ("model", "resolution", "aspect_ratio", "duration", "seed", "camera_fixed", "watermark",
+          "auto_add_image_refs", "width", "height", "sequential_image_generation", "max_images", "priority")
+LIST_FIELDS = ("images", "input_images")
+BATCH_PRIORITY = "batch"
+# Statuses written to results.jsonl; only video kinds have a remote task to resume
+STATUSES = ("submitted", "succeeded", "failed")
+TASK_KINDS = ("t2v", "i2v", "flf", "refs")
+
+_packages = {}
+_packages_lock = threading.Lock()
+
+
+def load_package(pkg_dir: str):
+    """Import a node package the way ComfyUI does (once per process)."""
+    with _packages_lock:
+        if pkg_dir not in _packages:
+            name = "byteplus_batch_" + pkg_dir.replace("-", "_").replace(".", "_")
+            path = os.path.join(ROOT, pkg_dir)
+            spec = importlib.util.spec_from_file_location(
+                name, os.path.join(path, "__init__.py"), submodule_search_locations=[path]
+            )
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[name] = module
+            spec.loader.exec_module(module)
+            _packages[pkg_dir] = module
+        return _packages[pkg_dir]
+
+
+def node_defaults(node_cls) -> dict:
+    """Default value of every API parameter input of a node class."""
+    spec = node_cls.INPUT_TYPES()
+    defaults = {}
+    for section in ("required", "optional"):
+        for name, (kind, *options) in spec.get(section, {}).items():
+            if name not in PARAMS:
+                continue
+            opts = options[0] if options else {}
+            if "default" in opts:
+                defaults[name] = opts["default"]
+            elif isinstance(kind, list) and kind:
+                defaults[name] = kind[0]
+    return defaults
+
+
+def _coerce(value, default):
+    """Convert a manifest value (CSV cells are strings) to the type of the node default."""
+    if not isinstance(value, str) or isinstance(default, str) or default is None:
+        return value
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+def read_manifest(path: str) -> list:
+    """Rows of a JSONL or CSV manifest as dicts, each with an "id"."""
+    rows = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                row = {k.strip(): v for k, v in row.items() if k and v not in (None, "")}
+                for field in LIST_FIELDS:
+                    if field in row:
+                        row[field] = [s.strip() for s in row[field].split("|") if s.strip()]
+                rows.append(row)
+        else:
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError as e:
+                        raise SystemExit(f"{path}:{line_no}: invalid JSON ({e})")
+    seen = set()
+    for index, row in enumerate(rows, 1):
+        row["id"] = str(row.get("id") or index)
+        if row["id"] in seen:
+            raise SystemExit(f"{path}: duplicate job id {row['id']!r}")
+        seen.add(row["id"])
+        if row.get("kind") not in KINDS:
+            raise SystemExit(f"{path}: job {row['id']!r} has unknown kind {row.get('kind')!r} "
+                             f"(expected one of {', '.join(KINDS)})")
+    return rows
+
+
+def load_image(ref: str, base_dir: str, keep_url: bool = False):
+    """
+    An image path or URL as an RGB uint8 array (accepted by the API classes).
+    With keep_url an http(s) URL is returned as-is for the API to fetch.
+    """
+    import numpy as np
+    from PIL import Image
+
+    if urlparse(ref).scheme in ("http", "https"):
+        if keep_url:
+            return ref
+        image = load_package(KINDS["t2v"][0]).byteplus_image_utils.download_image(ref)
+        return np.asarray(image.convert("RGB"))
+    path = ref if os.path.isabs(ref) else os.path.join(base_dir, ref)
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def load_image_bytes(ref: str, base_dir: str) -> tuple:
+    """(bytes, format) of a local image, for the Seedream data URLs; URLs are returned as-is."""
+    if urlparse(ref).scheme in ("http", "https", "data"):
+        return ref, None
+    from PIL import Image
+
+    path = ref if os.path.isabs(ref) else os.path.join(base_dir, ref)
+    with Image.open(path) as image:
+        fmt = (image.format or "png").lower()
+    with open(path, "rb") as f:
+        return f.read(), fmt
+
+
+def _url_ext(url: str, default: str) -> str:
+    return os.path.splitext(urlparse(url).path)[1].lower() or default
+
+
+class BatchRunner:
+    """Runs manifest jobs and keeps <out>/results.jsonl up to date."""
+
+    def __init__(self, out_dir: str, base_dir: str, max_wait_time: float | None = None):
+        self.out_dir = out_dir
+        self.base_dir = base_dir
+        self.max_wait_time = max_wait_time
+        self.results_path = os.path.join(out_dir, "results.jsonl")
+        self.lock = threading.Lock()
+        self.previous = self._load_results()
+
+    def _load_results(self) -> dict:
+        """Last record of every job id from an earlier run; records that cannot be ours are skipped."""
+        previous = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue    # a line cut short by a crash
+                    if not isinstance(record, dict):
+                        continue
+                    status, kind = record.get("status"), record.get("kind")
+                    if status not in STATUSES or (status == "submitted" and kind not in TASK_KINDS):
+                        # Not written by this runner (or a Seedream job, which has no task to poll)
+                        print(f"[BytePlus] {self.results_path}:{line_no}: ignoring {status!r} record "
+                              f"of kind {kind!r}")
+                        continue
+                    previous[record.get("id")] = record
+        return previous
+
+    def record(self, job_id: str, status: str, **fields) -> dict:
+        record = {"id": job_id, "status": status, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), **fields}
+        with self.lock:
+            with open(self.results_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+        return record
+
+    def pending(self, rows: list) -> list:
+        """Rows that have not succeeded in an earlier run"""
+        return [row for row in rows if (self.previous.get(row["id"]) or {}).get("status") != "succeeded"]
+
+    def resumable_task(self, row: dict) -> str | None:
+        """The task an earlier run submitted for row but did not download, if any."""
+        previous = self.previous.get(row["id"]) or {}
+        if previous.get("status") != "submitted" or previous.get("kind") != row["kind"]:
+            return None
+        return previous.get("task_id") if row["kind"] in TASK_KINDS else None
+
+    def _params(self, row: dict, node_cls) -> dict:
+        defaults = node_defaults(node_cls)
+        params = {k: _coerce(row[k], defaults.get(k)) if k in row else v for k, v in defaults.items()}
+        params["priority"] = row.get("priority", BATCH_PRIORITY)
+        if "duration" in params:
+            # Video nodes: -1 is "random", sent as no seed at all
+            params["duration"] = int(params["duration"])
+            if params.get("seed") == -1:
+                params["seed"] = None
+        return params
+
+    def _download(self, api, url: str, path: str) -> str:
+        # Storage and video helpers are the same in every Seedance package (Seedream has none)
+        tools = load_package(KINDS["t2v"][0])
+        tools.byteplus_storage.atomic_write_chunks(path, tools.byteplus_image_utils.iter_url_chunks(url, session=api.session))
+        if path.endswith(".mp4"):
+            tools.byteplus_video_utils.postprocess_video(path)
+        return path
+
+    def run(self, row: dict) -> dict:
+        job_id, kind = row["id"], row["kind"]
+        pkg_dir, module_name, api_name, node_name = KINDS[kind]
+        package = load_package(pkg_dir)
+        module = getattr(package, module_name)
+        api_utils = package.byteplus_api_utils
+        params = self._params(row, getattr(module, node_name))
+        prompt = row.get("prompt", "")
+        started = time.monotonic()
+        try:
+            if kind == "seedream":
+                outputs = self._run_seedream(row, package, module, api_utils, prompt, params)
+                return self.record(job_id, "succeeded", kind=kind, outputs=outputs,
+                                   elapsed=round(time.monotonic() - started, 1))
+            done, task_id, api = self._run_video(row, package, module, api_utils, prompt, params)
+            outputs, urls = [], {}
+            for field, extract, ext in (("video_url", module._extract_video_url_from_result, ".mp4"),
+                                        ("last_frame_url", module._extract_last_frame_url_from_result, ".png")):
+                url = extract(done)
+                if url:
+                    suffix = "" if field == "video_url" else ".last_frame"
+                    path = os.path.join(self.out_dir, f"{job_id}{suffix}{_url_ext(url, ext)}")
+                    outputs.append(self._download(api, url, path))
+                    urls[field] = url
+            if "video_url" not in urls:
+                raise RuntimeError(f"No video URL in completed result. Response: {done}")
+            return self.record(job_id, "succeeded", kind=kind, task_id=task_id, outputs=outputs, **urls,
+                               elapsed=round(time.monotonic() - started, 1))
+        except Exception as e:
+            return self.record(job_id, "failed", kind=kind, error=f"{type(e).__name__}: {e}",
+                               elapsed=round(time.monotonic() - started, 1))
+
+    def _run_video(self, row, package, module, api_utils, prompt, params):
+        job_id, kind = row["id"], row["kind"]
+        api = api_utils.get_api_client(getattr(module, KINDS[kind][2]))
+        task_id = self.resumable_task(row)
+        if task_id:
+            # Submitted by an earlier run that did not get to download the result
+            print(f"[BytePlus] {job_id}: resuming task {task_id}")
+            done = package.byteplus_coordinator.resume_task(
+                task_id, max_wait_time=self.max_wait_time, fallback={**self.previous[job_id], "params": params})
+            return done, task_id, api
+
+        if kind == "t2v":
+            args = (prompt, params)
+        elif kind == "i2v":
+            args = (load_image(row["image"], self.base_dir, keep_url=True), prompt, params)
+        elif kind == "flf":
+            args = (load_image(row["first_frame"], self.base_dir), load_image(row["last_frame"], self.base_dir),
+                    prompt, params)
+        else:
+            images = row["images"] if isinstance(row["images"], list) else [row["images"]]
+            args = ([load_image(ref, self.base_dir) for ref in images], prompt, params)
+        submit_resp = api.generate_video(*args)
+        task_id = submit_resp.get("id")
+        if not task_id:
+            raise ValueError(f"No task ID returned from API: {submit_resp}")
+        self.record(job_id, "submitted", kind=kind, task_id=task_id,
+                    region=api.region.name if api.region else None,
+                    key_label=package.byteplus_coordinator.key_label_for_task(api, task_id))
+        done = api.wait_for_completion(task_id, max_wait_time=self.max_wait_time, params=params)
+        return done, task_id, api
+
+    def _run_seedream(self, row, package, module, api_utils, prompt, params):
+        api = api_utils.get_api_client(module.SeedreamAPI)
+        refs = row.get("input_images") or []
+        image_data = []
+        for ref in refs if isinstance(refs, list) else [refs]:
+            data, fmt = load_image_bytes(ref, self.base_dir)
+            image_data.append(data if fmt is None else package.byteplus_transport.image_reference(
+                api, data, fmt, os.path.basename(ref)))
+        params["image_data"] = image_data or None
+        response = api.generate_image(prompt, params)
+        urls = [item["url"] for item in response.get("data", []) if item.get("url")]
+        if not urls:
+            raise RuntimeError(f"No images generated. Response: {response}")
+        return [self._download(api, url,
+                               os.path.join(self.out_dir, f"{row['id']}_{i}{_url_ext(url, '.png')}"))
+                for i, url in enumerate(urls)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSONL or CSV manifest")
+    parser.add_argument("--out", required=True, help="output directory (also holds results.jsonl)")
+    parser.add_argument("--jobs", type=int, default=4, help="jobs run at the same time")
+    parser.add_argument("--max-wait", type=float, default=None,
+                        help="seconds to wait per task (default: derived from model, resolution and duration)")
+    args = parser.parse_args()
+
+    rows = read_manifest(args.manifest)
+    os.makedirs(args.out, exist_ok=True)
+    runner = BatchRunner(args.out, os.path.dirname(os.path.abspath(args.manifest)), args.max_wait)
+    todo = runner.pending(rows)
+    print(f"{len(rows)} jobs, {len(rows) - len(todo)} already done, running {len(todo)} with {args.jobs} workers")
+
+    counts = {"succeeded": 0, "failed": 0}
+    started = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=max(1, args.jobs))
+    try:
+        futures = [pool.submit(runner.run, row) for row in todo]
+        for done_count, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            counts[record["status"]] += 1
+            detail = record.get("error") or ", ".join(record.get("outputs", []))
+            print(f"[{done_count}/{len(todo)}] {record['id']} {record['status']} "
+                  f"in {record['elapsed']:.0f}s: {detail}")
+    except KeyboardInterrupt:
+        # Jobs not started yet are dropped; submitted tasks keep their "submitted"
+        # record, so the next run polls them instead of paying for them again.
+        print("Interrupted: waiting for running jobs, run again with the same --out to resume")
+        pool.shutdown(wait=True, cancel_futures=True)
+        sys.exit(130)
+    pool.shutdown()
+    print(f"done in {time.monotonic() - started:.0f}s: {counts['succeeded']} succeeded, {counts['failed']} failed "
+          f"(see {runner.results_path})")
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()